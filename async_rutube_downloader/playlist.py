@@ -1,24 +1,67 @@
+from collections.abc import Awaitable
+from dataclasses import dataclass
 from typing import Self
 
 import m3u8
 from aiohttp import ClientSession
 
+from async_rutube_downloader.utils import metrics
+from async_rutube_downloader.utils.circuit_breaker import breakers_for
 from async_rutube_downloader.utils.decorators import retry
 from async_rutube_downloader.utils.exceptions import (
     APIResponseError,
     MasterPlaylistInitializationError,
 )
 from async_rutube_downloader.utils.logger import get_logger
-from async_rutube_downloader.utils.type_hints import QualitiesWithPlaylist
+from async_rutube_downloader.utils.retry import RetryPolicy
+from async_rutube_downloader.utils.type_hints import (
+    QualitiesWithMirrors,
+    QualitiesWithPlaylist,
+)
 
 logger = get_logger(__name__)
 
 
+@dataclass(frozen=True)
+class VariantInfo:
+    """A quality of the video, known from its variant playlist."""
+
+    quality: tuple[int, int]
+    # Seconds, the sum of segment durations.
+    duration: float
+    # Bytes, estimated from the bandwidth of the quality,
+    # `None` if the master playlist doesn't list it.
+    size: int | None
+
+    @classmethod
+    def from_playlist(
+        cls,
+        quality: tuple[int, int],
+        stream: m3u8.Playlist,
+        variant: m3u8.M3U8,
+    ) -> Self:
+        """
+        Args:
+            stream: The quality in the master playlist.
+            variant: Its variant playlist.
+        """
+        duration = sum(segment.duration or 0 for segment in variant.segments)
+        bandwidth = stream.stream_info.bandwidth
+        return cls(
+            quality,
+            duration,
+            int(bandwidth / 8 * duration) if bandwidth else None,
+        )
+
+
 class MasterPlaylist:
     """
     Used to parse a Master M3U8 playlist into multiple playlists,
     each corresponding to a different quality level.
 
+    Rutube lists every quality once per CDN, `qualities` holds
+    the first one, `mirrors` holds all of them in the listed order.
+
     Methods:
         run(): Makes an API call to retrieve information.
     """
@@ -27,17 +70,26 @@ class MasterPlaylist:
         self,
         master_playlist_url: str,
         session: ClientSession,
+        retry_policy: RetryPolicy | None = None,
+        text: str | None = None,
     ) -> None:
         """
         Args:
             master_playlist_url (str): The URL of the master playlist
             session (ClientSession): The aiohttp session to use
                 for http the request.
+            retry_policy (RetryPolicy | None): Retries of the request,
+                shared with the download.
+            text (str | None): The playlist, if it's cached,
+                then nothing is downloaded.
         """
         self._master_playlist_url = master_playlist_url
         self._session = session
+        self.retry_policy = retry_policy
+        self.text = text
         self._master_playlist: m3u8.M3U8 | None = None
         self.qualities: QualitiesWithPlaylist | None = None
+        self.mirrors: QualitiesWithMirrors | None = None
 
     async def run(self) -> Self:
         """
@@ -45,35 +97,47 @@ class MasterPlaylist:
         2. Call async `run()` method to make http requests.
         3. Now you can select video quality from `self.qualities` attribute.
         """
-        self._master_playlist = await self.__get_master_playlist()
-        self.qualities = self.__get_qualities()
+        self._master_playlist = (
+            await self.__parse(self.text)
+            if self.text is not None
+            else await self.__get_master_playlist()
+        )
+        self.mirrors = self.__get_mirrors()
+        self.qualities = {
+            resolution: playlists[0]
+            for resolution, playlists in self.mirrors.items()
+        }
         return self
 
     @retry(
         "Failed to download master playlist", MasterPlaylistInitializationError
     )
     async def __get_master_playlist(self) -> m3u8.M3U8:
-        async with self._session.get(self._master_playlist_url) as response:
-            try:
-                return m3u8.loads(
-                    await response.text(), self._master_playlist_url
-                )
-            except Exception as e:
-                logger.info(
-                    "An error occurred while parsing the Master Playlist",
-                    exc_info=True,
-                )
-                raise APIResponseError(str(e))
-
-    def __get_qualities(self) -> QualitiesWithPlaylist:
+        with metrics.timer(metrics.playlist_latency, kind="master"):
+            async with (
+                breakers_for(self._session).guard(self._master_playlist_url),
+                self._session.get(self._master_playlist_url) as response,
+            ):
+                return await self.__parse(response.text())
+
+    async def __parse(self, text: Awaitable[str] | str) -> m3u8.M3U8:
+        try:
+            if not isinstance(text, str):
+                text = self.text = await text
+            return m3u8.loads(text, self._master_playlist_url)
+        except Exception as e:
+            logger.info(
+                "An error occurred while parsing the Master Playlist",
+                exc_info=True,
+            )
+            raise APIResponseError(str(e))
+
+    def __get_mirrors(self) -> QualitiesWithMirrors:
         if not self._master_playlist:
             raise MasterPlaylistInitializationError
-        qualities: QualitiesWithPlaylist = {}
+        mirrors: QualitiesWithMirrors = {}
         for playlist in self._master_playlist.playlists:
             resolution = playlist.stream_info.resolution
-            if resolution and resolution not in qualities:
-                qualities[resolution] = playlist
-            # TODO: There are 2 CDNs in the master playlist,
-            # we can potentially use the second one for retry.
-            # but now just skip it.
-        return qualities
+            if resolution:
+                mirrors.setdefault(resolution, []).append(playlist)
+        return mirrors
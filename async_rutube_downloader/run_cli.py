@@ -5,12 +5,18 @@ from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
 from pathlib import Path
 
 import aiofiles
-from aiohttp import ClientSession
+from aiohttp import ClientConnectionError, ClientSession
 
 from async_rutube_downloader.rutube_downloader import RutubeDownloader
+from async_rutube_downloader.server import (
+    FINAL_STATES,
+    JobServerClient,
+    JobState,
+)
 from async_rutube_downloader.settings import (
     API_RESPONSE_ERROR_MSG,
     AVAILABLE_QUALITIES,
+    CHUNK_SIZE,
     CLI_DESCRIPTION,
     CLI_EPILOG,
     CLI_NAME,
@@ -18,39 +24,69 @@ from async_rutube_downloader.settings import (
     FILE_NOT_FOUND_ERROR_MSG,
     INVALID_FILE_ERROR_MSG,
     INVALID_URL,
+    LOW_MEMORY_REORDER_BUFFER_SIZE,
+    MAX_CONCURRENCY,
+    MIB,
     PATH_IS_A_DIRECTORY_ERROR_MSG,
+    RANGE_SPLIT_THRESHOLD,
+    REORDER_BUFFER_SIZE,
     REPORT_MULTIPLE_URLS,
+    SEGMENT_CACHE_SIZE,
     SELECT_QUALITY,
+    SERVER_PORT,
+    SERVER_UNAVAILABLE_MSG,
     _,
 )
 from async_rutube_downloader.ui import SEGMENT_DOWNLOAD_ERROR_MSG
-from async_rutube_downloader.utils.create_session import create_aiohttp_session
+from async_rutube_downloader.utils.archive import DownloadArchive
+from async_rutube_downloader.utils.cancellation import CancelPolicy
+from async_rutube_downloader.utils.concurrency import SegmentBudget
+from async_rutube_downloader.utils.create_session import (
+    ConnectionProfile,
+    create_aiohttp_session,
+)
 from async_rutube_downloader.utils.exceptions import (
     APIResponseError,
     CLIFileError,
     InvalidURLError,
+    JobServerError,
     SegmentDownloadError,
 )
 from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.metadata_cache import MetadataCache
+from async_rutube_downloader.utils.metrics import MetricsExporter
 from async_rutube_downloader.utils.miscellaneous import (
+    get_cache_directory,
     get_or_create_loop,
     get_version_from_pyproject,
 )
+from async_rutube_downloader.utils.progress import ProgressEvent
+from async_rutube_downloader.utils.progress_renderer import (
+    ProgressLine,
+    ProgressRenderer,
+)
+from async_rutube_downloader.utils.rate_limiter import process_rate_limiter
+from async_rutube_downloader.utils.scheduler import SlidingWindowScheduler
+from async_rutube_downloader.utils.segment_cache import (
+    SEGMENT_CACHE_DIRECTORY,
+    SegmentCache,
+)
+from async_rutube_downloader.utils.segment_writers import WriteMode
+from async_rutube_downloader.utils.tracing import get_tracer
 from async_rutube_downloader.utils.type_hints import Qualities
 from async_rutube_downloader.utils.validators import (
     cli_quality_validator,
+    cli_validate_concurrency,
+    cli_validate_jobs,
     cli_validate_path,
+    cli_validate_port,
+    cli_validate_rate,
+    cli_validate_size,
     cli_validate_urls_file,
 )
 
 logger = get_logger(__name__)
 INDEX_OFFSET = 1
-WIDTH_OF_PROGRESS_BAR = 20
-PROGRESS_BAR_STEP_PERCENT = 5
-
-
-def create_progress_bar() -> list[str]:
-    return [*[" " for _ in range(WIDTH_OF_PROGRESS_BAR)]]
 
 
 class CLIDownloader:
@@ -59,50 +95,30 @@ class CLIDownloader:
         cli_args: Namespace,
         session: ClientSession,
         event_loop: asyncio.AbstractEventLoop | None = None,
+        segment_budget: SegmentBudget | None = None,
+        renderer: ProgressRenderer | None = None,
+        metadata_cache: MetadataCache | None = None,
+        archive: DownloadArchive | None = None,
+        segment_cache: SegmentCache | None = None,
     ) -> None:
         self.cli_args = cli_args
         self.event_loop = event_loop if event_loop else get_or_create_loop()
         self.session = session
-        self.progress_bar = create_progress_bar()
+        self.segment_budget = segment_budget
+        self.metadata_cache = metadata_cache
+        self.archive = archive
+        self.segment_cache = segment_cache
+        # Draws progress of this download and of `--jobs` ones,
+        # messages are printed with `renderer.echo` not to be overwritten.
+        self.renderer = renderer if renderer else ProgressRenderer()
         self.downloader: RutubeDownloader | None = None
-        self.__last_step: int = 0
         self.__download_cancelled = False
         self.__tasks: list[asyncio.Task] = []
-
-    def cli_progress_callback(
-        self,
-        completed_chunks: int,
-        total_chunks: int,
-    ) -> None:
-        self.__tasks.append(
-            asyncio.create_task(
-                self._cli_progress_callback(completed_chunks, total_chunks)
-            )
-        )
-
-    async def _cli_progress_callback(
-        self, completed_chunks, total_chunks
-    ) -> None:
-        completion_percentage = int((completed_chunks / total_chunks) * 100)
-        progress_step = completion_percentage // PROGRESS_BAR_STEP_PERCENT
-        if progress_step > self.__last_step:
-            self.progress_bar[self.__last_step : progress_step] = "#" * (
-                progress_step - self.__last_step
-            )
-            self.__last_step = progress_step
-            self._print_progress_bar(
-                self.progress_bar,
-                True if completion_percentage == 100 else False,
-            )
-
-    def _print_progress_bar(
-        self, progress_bar: list[str], last: bool = False
-    ) -> None:
-        print(
-            f"\r[{''.join(progress_bar)}]",
-            end="" if not last else "\n",
-            flush=True,
-        )
+        # Downloads of `--jobs` running at the same time.
+        self.__jobs: set[CLIDownloader] = set()
+        # Jobs submitted with `--server`.
+        self.__server: JobServerClient | None = None
+        self.__server_jobs: list[int] = []
 
     def ask_for_quality(self, qualities: Qualities) -> tuple[int, int]:
         available_qualities = {}
@@ -122,18 +138,35 @@ class CLIDownloader:
         assert self.downloader
         if not self.downloader.is_interrupted():
             minutes, seconds = divmod(self._download_time, 60)
-            print(
+            self.renderer.echo(
                 _("[{}] downloaded in {} minutes, {} seconds").format(
                     self.downloader.video_title, minutes, seconds
                 )
             )
-            print(
+            self.renderer.echo(
                 _("[{}] saved to {}").format(
                     self.downloader.video_title, self.downloader.file
                 )
             )
+            if retries := self.downloader.retry_policy.retries.total():
+                self.renderer.echo(
+                    _("[{}] {} requests retried").format(
+                        self.downloader.video_title, retries
+                    )
+                )
         else:
-            print(DOWNLOAD_CANCELED)
+            self.renderer.echo(DOWNLOAD_CANCELED)
+            if report := self.downloader.cancel_report:
+                self.renderer.echo(
+                    _(
+                        "{} requests aborted, {} MiB not downloaded,"
+                        " {} MiB kept to resume"
+                    ).format(
+                        report.aborted_requests,
+                        round(report.saved_bytes / MIB, 1),
+                        round(report.kept_bytes / MIB, 1),
+                    )
+                )
 
     async def download_single_video(
         self,
@@ -141,34 +174,147 @@ class CLIDownloader:
     ) -> None:
         start_time = time.time()
         self.__current_download = self._download_single_video(url)
-        await self.__current_download
+        async with self.renderer.running():
+            downloaded = await self.__current_download
         end_time = time.time()
         self._download_time = round(end_time - start_time)
-        self._print_state()
+        if downloaded:
+            self._print_state()
 
-    async def _download_single_video(self, url) -> None:
+    async def _download_single_video(self, url) -> bool:
+        """Returns: `False` if the video is in the archive."""
+        video_url = url if url else self.cli_args.url
+        progress = ProgressLine(video_url)
         self.downloader = RutubeDownloader(
-            url if url else self.cli_args.url,
+            video_url,
             loop=self.event_loop,
-            callback=self.cli_progress_callback,
+            callback=progress.update,
             upload_directory=self.cli_args.output,
             session=self.session,
             auto_close_session=False if url else True,
+            buffer_size=LOW_MEMORY_REORDER_BUFFER_SIZE
+            if self.cli_args.low_memory
+            else REORDER_BUFFER_SIZE,
+            write_mode=self.cli_args.write_mode,
+            concurrency=self.cli_args.concurrency,
+            adaptive_concurrency=self.cli_args.adaptive_concurrency,
+            segment_budget=self.segment_budget,
+            metadata_cache=self.metadata_cache,
+            archive=self.archive,
+            segment_cache=self.segment_cache,
+            split_threshold=RANGE_SPLIT_THRESHOLD
+            if self.cli_args.split_segments
+            else None,
         )
+        if entry := await self.downloader.check_archive():
+            self.renderer.echo(
+                _("[{}] is already downloaded: {}").format(
+                    entry.video_id, entry.path
+                )
+            )
+            return False
         qualities = await self.downloader.fetch_video_info()
         if self.cli_args.quality:
             selected_quality = self.ask_for_quality(qualities)
             await self.downloader.select_quality(selected_quality)
-        print(_("[{}] download started").format(self.downloader.video_title))
-        await self.downloader.download_video()
-        await asyncio.gather(*self.__tasks)
+        progress.title = self.downloader.video_title
+        self.renderer.echo(
+            _("[{}] download started").format(self.downloader.video_title)
+        )
+        self.renderer.add(progress)
+        try:
+            await self.downloader.download_video()
+        finally:
+            self.renderer.remove(progress)
+        if timings := self.downloader.phase_timings:
+            for line in timings.summary():
+                self.renderer.echo(f"[{self.downloader.video_title}] {line}")
+        return True
 
     def interrupt_download(self) -> None:
         # FIXME: add interrupt while selecting qualities.
+        for job in self.__jobs:
+            job.interrupt_download()
         if self.downloader:
-            self.downloader.interrupt_download()
+            self.downloader.interrupt_download(self.cli_args.on_cancel)
+        if self.__server:
+            self.__tasks.append(
+                asyncio.create_task(self.__cancel_server_jobs(self.__server))
+            )
+        if self.downloader or self.__jobs or self.__server:
             self.__download_cancelled = True
 
+    async def download_with_server(self) -> None:
+        """
+        Submit the video or the videos of the file to a running
+        `rtube-server` and print their progress until they're finished.
+        """
+        if self.cli_args.url:
+            urls = [self.cli_args.url]
+        else:
+            urls = await self.get_urls_list_from_file(
+                self.cli_args.file, self.cli_args.delimiter
+            )
+            if not cli_validate_urls_file(urls):
+                raise CLIFileError
+        async with JobServerClient.connect(self.cli_args.server) as server:
+            self.__server = server
+            for url in urls:
+                if self.__download_cancelled:
+                    break
+                try:
+                    job = await server.submit(url, output=self.cli_args.output)
+                except JobServerError as e:
+                    self.renderer.echo(
+                        _("[{}] rejected by the server: {}").format(url, e)
+                    )
+                    continue
+                self.__server_jobs.append(job["id"])
+            async with self.renderer.running():
+                await asyncio.gather(
+                    *(
+                        self.__follow_job(server, job)
+                        for job in self.__server_jobs
+                    )
+                )
+            await asyncio.gather(*self.__tasks)
+            self.__server = None
+
+    async def __follow_job(self, server: JobServerClient, job_id: int) -> None:
+        progress = ProgressLine(str(job_id))
+        self.renderer.add(progress)
+        try:
+            async for event in server.events(job_id):
+                job = event["job"]
+                title = progress.title = job["title"] or job["url"]
+                if event["event"] == "progress":
+                    if job["total_segments"]:
+                        progress.update(
+                            ProgressEvent(
+                                job["completed_segments"],
+                                job["total_segments"],
+                                job["bytes_received"],
+                                job["rate"],
+                                eta=job["eta"],
+                            )
+                        )
+                    continue
+                if job["state"] in FINAL_STATES:
+                    self.renderer.remove(progress)
+                if job["state"] == JobState.done:
+                    message = _("[{}] saved to {}").format(title, job["file"])
+                elif job["state"] == JobState.failed:
+                    message = _("[{}] failed: {}").format(title, job["error"])
+                else:
+                    message = f"[{title}] {job['state']}"
+                self.renderer.echo(message)
+        finally:
+            self.renderer.remove(progress)
+
+    async def __cancel_server_jobs(self, server: JobServerClient) -> None:
+        for job_id in self.__server_jobs:
+            await server.cancel(job_id)
+
     async def get_urls_list_from_file(
         self, user_file: Path, delimiter: str
     ) -> list[str]:
@@ -200,24 +346,61 @@ class CLIDownloader:
         )
         if not cli_validate_urls_file(urls):
             raise CLIFileError
+        if cli_args.jobs > 1:
+            return await self.__download_concurrently(urls, cli_args.jobs)
         for url in urls:
             if self.__download_cancelled:
                 break
 
             try:
-                # cleanup
-                self.progress_bar = create_progress_bar()
-                self.__last_step = 0
-                self.__tasks = []
-
                 await self.download_single_video(url)
                 success_downloads += 1
             except InvalidURLError:
-                print(_("Invalid URL Error: {}").format(url))
+                self.renderer.echo(_("Invalid URL Error: {}").format(url))
                 invalid_urls += 1
                 continue
         return success_downloads, invalid_urls
 
+    async def __download_concurrently(
+        self, urls: list[str], jobs: int
+    ) -> tuple[int, int]:
+        """
+        Download `jobs` videos at the same time, a new one starts
+        as soon as any finishes. Together they keep at most
+        `--concurrency` segment requests in flight.
+        """
+        budget = SegmentBudget(self.cli_args.concurrency)
+        results: list[bool] = []
+
+        async def download(url: str) -> bool:
+            job = CLIDownloader(
+                self.cli_args,
+                self.session,
+                self.event_loop,
+                segment_budget=budget,
+                renderer=self.renderer,
+                metadata_cache=self.metadata_cache,
+                archive=self.archive,
+                segment_cache=self.segment_cache,
+            )
+            self.__jobs.add(job)
+            try:
+                await job.download_single_video(url)
+            except InvalidURLError:
+                self.renderer.echo(_("Invalid URL Error: {}").format(url))
+                return False
+            finally:
+                self.__jobs.discard(job)
+            return True
+
+        async def collect(url: str, downloaded: bool) -> None:
+            results.append(downloaded)
+
+        await SlidingWindowScheduler(
+            download, window=jobs, is_stopped=lambda: self.__download_cancelled
+        ).run(urls, collect)
+        return results.count(True), results.count(False)
+
 
 def parse_args(parser: ArgumentParser) -> Namespace:
     # I think cli looks better when metavar=""
@@ -241,6 +424,144 @@ def parse_args(parser: ArgumentParser) -> Namespace:
         action="store_true",
         help=_("Select video quality interactively"),
     )
+    parser.add_argument(
+        "--low-memory",
+        action="store_true",
+        help=_("Keep less downloaded data in memory, may be slower"),
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        metavar="",
+        type=cli_validate_concurrency,
+        default=CHUNK_SIZE,
+        help=_(
+            "How many video segments are downloaded at the same time"
+            " (default: {})"
+        ).format(CHUNK_SIZE),
+    )
+    parser.add_argument(
+        "--adaptive-concurrency",
+        action="store_true",
+        help=_(
+            "Adjust the number of segments downloaded at the same time"
+            " to the connection speed, starting from --concurrency"
+        ),
+    )
+    parser.add_argument(
+        "--limit-rate",
+        metavar="",
+        type=cli_validate_rate,
+        default=None,
+        help=_(
+            "Limit total download speed, bytes per second"
+            " with an optional K, M or G suffix, like 500K or 2M"
+        ),
+    )
+    parser.add_argument(
+        "--split-segments",
+        action="store_true",
+        help=_(
+            "Download big segments with several range requests"
+            " at the same time, helps on high-latency connections"
+        ),
+    )
+    parser.add_argument(
+        "--async-dns",
+        action="store_true",
+        help=_("Resolve host names with aiodns, if it's installed"),
+    )
+    parser.add_argument(
+        "--trace-phases",
+        action="store_true",
+        help=_(
+            "Time DNS, connect, first byte and body of every request,"
+            " print a summary per host when a video is downloaded"
+        ),
+    )
+    parser.add_argument(
+        "--trace-file",
+        metavar="",
+        type=Path,
+        default=None,
+        help=_(
+            "Write the request phase timings of all downloads"
+            " to this JSON file, implies --trace-phases"
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=_(
+            "Always fetch video info. By default it's cached for up to"
+            " an hour in the user cache directory, and fetched again"
+            " before that only if a segment request fails"
+            " with 403, 404 or 410"
+        ),
+    )
+    parser.add_argument(
+        "--segment-cache",
+        metavar="",
+        type=Path,
+        nargs="?",
+        const=get_cache_directory() / SEGMENT_CACHE_DIRECTORY,
+        default=None,
+        help=_(
+            "Keep downloaded segments in this directory and reuse them"
+            " on retries and repeated downloads"
+            " (default directory: in the user cache directory)"
+        ),
+    )
+    parser.add_argument(
+        "--segment-cache-size",
+        metavar="",
+        type=cli_validate_size,
+        default=SEGMENT_CACHE_SIZE,
+        help=_(
+            "Bytes of segments the cache keeps, with an optional"
+            " K, M or G suffix (default: 2G)"
+        ),
+    )
+    parser.add_argument(
+        "--download-archive",
+        metavar="",
+        type=Path,
+        default=None,
+        help=_(
+            "Record downloaded videos in this file"
+            " and skip videos already recorded there"
+        ),
+    )
+    parser.add_argument(
+        "--verify-archive",
+        action="store_true",
+        help=_(
+            "Skip a recorded video only if its file still exists"
+            " and matches the recorded checksum"
+        ),
+    )
+    parser.add_argument(
+        "--on-cancel",
+        metavar="",
+        type=CancelPolicy,
+        choices=tuple(CancelPolicy),
+        default=CancelPolicy.keep,
+        help=_(
+            "What to do with a cancelled download: keep to resume it"
+            " later or discard (default: keep)"
+        ),
+    )
+    parser.add_argument(
+        "--write-mode",
+        metavar="",
+        type=WriteMode,
+        choices=tuple(WriteMode),
+        default=WriteMode.ordered,
+        help=_(
+            "How segments are written: ordered or positional"
+            " (default: ordered)"
+        ),
+    )
     parser_multiple_videos_group = parser.add_argument_group(
         _("Multiple videos download")
     )
@@ -265,7 +586,52 @@ def parse_args(parser: ArgumentParser) -> Namespace:
         help=_("Delimiter between URLs in the file(default: \\n)"),
         default="\n",
     )
-    return parser.parse_args()
+    parser_multiple_videos_group.add_argument(
+        "-j",
+        "--jobs",
+        metavar="",
+        type=cli_validate_jobs,
+        default=1,
+        help=_(
+            "How many videos are downloaded at the same time,"
+            " they share --concurrency (default: 1)"
+        ),
+    )
+    parser.add_argument(
+        "--metrics-port",
+        metavar="",
+        type=cli_validate_port,
+        default=None,
+        help=_(
+            "Serve Prometheus metrics of the downloads"
+            " on this local port, at /metrics"
+        ),
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="",
+        type=Path,
+        default=None,
+        help=_(
+            "Write Prometheus metrics of the downloads to this file,"
+            " for the node-exporter textfile collector"
+        ),
+    )
+    parser.add_argument(
+        "--server",
+        metavar="",
+        default=None,
+        help=_(
+            "Submit the download to a running rtube-server,"
+            " its URL or Unix socket path, like http://127.0.0.1:{}"
+        ).format(SERVER_PORT),
+    )
+    cli_args = parser.parse_args()
+    if cli_args.jobs > 1 and cli_args.quality:
+        parser.error(_("--jobs can't be used with --quality"))
+    if cli_args.server and cli_args.quality:
+        parser.error(_("--server can't be used with --quality"))
+    return cli_args
 
 
 def create_parser() -> ArgumentParser:
@@ -278,7 +644,7 @@ def create_parser() -> ArgumentParser:
 
 
 def _interrupt_and_report(cli_downloader: CLIDownloader) -> None:
-    print("\n", _("Cancelling download..."))
+    cli_downloader.renderer.echo(_("Cancelling download..."))
     cli_downloader.interrupt_download()
 
 
@@ -299,14 +665,50 @@ def main(
     if not event_loop:
         event_loop = asyncio.new_event_loop()
     if not session:
-        session = create_aiohttp_session(event_loop)
-    cli_downloader = CLIDownloader(cli_args, session, event_loop)
+        session = create_aiohttp_session(
+            event_loop,
+            ConnectionProfile.for_concurrency(
+                MAX_CONCURRENCY
+                if cli_args.adaptive_concurrency
+                else cli_args.concurrency,
+                split_segments=cli_args.split_segments,
+                async_resolver=cli_args.async_dns,
+                trace_phases=cli_args.trace_phases
+                or cli_args.trace_file is not None,
+            ),
+        )
+    metadata_cache = None if cli_args.no_cache else MetadataCache()
+    archive = (
+        DownloadArchive(cli_args.download_archive, cli_args.verify_archive)
+        if cli_args.download_archive
+        else None
+    )
+    segment_cache = (
+        SegmentCache(cli_args.segment_cache, cli_args.segment_cache_size)
+        if cli_args.segment_cache
+        else None
+    )
+    cli_downloader = CLIDownloader(
+        cli_args,
+        session,
+        event_loop,
+        metadata_cache=metadata_cache,
+        archive=archive,
+        segment_cache=segment_cache,
+    )
+    process_rate_limiter.set_rate(cli_args.limit_rate)
+    exporter = MetricsExporter(cli_args.metrics_port, cli_args.metrics_file)
 
     try:
+        event_loop.run_until_complete(exporter.start(session))
         event_loop.add_signal_handler(
             signal.SIGINT, lambda: _interrupt_and_report(cli_downloader)
         )
-        if cli_args.url:
+        if cli_args.server and (cli_args.url or cli_args.file):
+            event_loop.run_until_complete(
+                cli_downloader.download_with_server()
+            )
+        elif cli_args.url:
             print(_("Download directory: {}").format(cli_args.output))
             event_loop.run_until_complete(
                 cli_downloader.download_single_video()
@@ -330,9 +732,25 @@ def main(
         handle_exception(PATH_IS_A_DIRECTORY_ERROR_MSG, cli_args.file)
     except CLIFileError:
         handle_exception(INVALID_FILE_ERROR_MSG)
+    except JobServerError as e:
+        handle_exception(str(e))
+    except ClientConnectionError:
+        if cli_args.server:
+            handle_exception(SERVER_UNAVAILABLE_MSG, cli_args.server)
+        else:
+            handle_exception(SEGMENT_DOWNLOAD_ERROR_MSG)
     finally:
+        event_loop.run_until_complete(exporter.stop())
         event_loop.run_until_complete(session.close())
+        if cli_args.trace_file and (tracer := get_tracer(session)):
+            tracer.timings.dump(cli_args.trace_file)
         event_loop.close()
+        if metadata_cache:
+            metadata_cache.close()
+        if archive:
+            archive.close()
+        if segment_cache:
+            segment_cache.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,324 @@
+import asyncio
+import signal
+from argparse import ArgumentParser, Namespace, RawDescriptionHelpFormatter
+from ipaddress import ip_address
+from pathlib import Path
+
+from aiohttp import web
+
+from async_rutube_downloader.server import JobManager, create_app
+from async_rutube_downloader.settings import (
+    CHUNK_SIZE,
+    RANGE_SPLIT_THRESHOLD,
+    SEGMENT_CACHE_SIZE,
+    SERVER_DESCRIPTION,
+    SERVER_HOST,
+    SERVER_NAME,
+    SERVER_PORT,
+    _,
+)
+from async_rutube_downloader.utils.archive import DownloadArchive
+from async_rutube_downloader.utils.cancellation import CancelPolicy
+from async_rutube_downloader.utils.create_session import (
+    ConnectionProfile,
+    create_aiohttp_session,
+)
+from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.metadata_cache import MetadataCache
+from async_rutube_downloader.utils.metrics import (
+    MetricsExporter,
+    collect_pool_stats,
+    process_metrics,
+)
+from async_rutube_downloader.utils.miscellaneous import (
+    get_cache_directory,
+    get_version_from_pyproject,
+)
+from async_rutube_downloader.utils.rate_limiter import process_rate_limiter
+from async_rutube_downloader.utils.segment_cache import (
+    SEGMENT_CACHE_DIRECTORY,
+    SegmentCache,
+)
+from async_rutube_downloader.utils.validators import (
+    cli_validate_concurrency,
+    cli_validate_jobs,
+    cli_validate_path,
+    cli_validate_port,
+    cli_validate_rate,
+    cli_validate_size,
+)
+
+logger = get_logger(__name__)
+
+
+def create_parser() -> ArgumentParser:
+    return ArgumentParser(
+        prog=SERVER_NAME,
+        description=SERVER_DESCRIPTION,
+        formatter_class=RawDescriptionHelpFormatter,
+    )
+
+
+def parse_args(parser: ArgumentParser) -> Namespace:
+    # Same look as rtube-cli, metavar=""
+    parser.add_argument(
+        "--host",
+        metavar="",
+        default=SERVER_HOST,
+        help=_(
+            "Address to listen on (default: {}). The API has no"
+            " authentication, anyone who reaches the address can"
+            " download files to any directory of this user"
+        ).format(SERVER_HOST),
+    )
+    parser.add_argument(
+        "--port",
+        metavar="",
+        type=cli_validate_port,
+        default=SERVER_PORT,
+        help=_("Port to listen on (default: {})").format(SERVER_PORT),
+    )
+    parser.add_argument(
+        "--socket",
+        metavar="",
+        type=Path,
+        default=None,
+        help=_("Listen on this Unix socket instead of a port"),
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        metavar="",
+        type=cli_validate_path,
+        default=Path.cwd(),
+        help=_(
+            "Output directory of jobs that don't set one"
+            " (default: current working directory)"
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        metavar="",
+        type=cli_validate_jobs,
+        default=2,
+        help=_("How many videos are downloaded at the same time (default: 2)"),
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        metavar="",
+        type=cli_validate_concurrency,
+        default=CHUNK_SIZE,
+        help=_(
+            "How many video segments all jobs download at the same time"
+            " (default: {})"
+        ).format(CHUNK_SIZE),
+    )
+    parser.add_argument(
+        "--limit-rate",
+        metavar="",
+        type=cli_validate_rate,
+        default=None,
+        help=_(
+            "Limit total download speed, bytes per second"
+            " with an optional K, M or G suffix, like 500K or 2M"
+        ),
+    )
+    parser.add_argument(
+        "--split-segments",
+        action="store_true",
+        help=_(
+            "Download big segments with several range requests"
+            " at the same time, helps on high-latency connections"
+        ),
+    )
+    parser.add_argument(
+        "--async-dns",
+        action="store_true",
+        help=_("Resolve host names with aiodns, if it's installed"),
+    )
+    parser.add_argument(
+        "--trace-phases",
+        action="store_true",
+        help=_(
+            "Time DNS, connect, first byte and body of every request,"
+            " jobs report the timings per host"
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=_(
+            "Always fetch video info. By default it's cached for up to"
+            " an hour in the user cache directory, and fetched again"
+            " before that only if a segment request fails"
+            " with 403, 404 or 410"
+        ),
+    )
+    parser.add_argument(
+        "--segment-cache",
+        metavar="",
+        type=Path,
+        nargs="?",
+        const=get_cache_directory() / SEGMENT_CACHE_DIRECTORY,
+        default=None,
+        help=_(
+            "Keep downloaded segments in this directory and reuse them"
+            " when jobs download the same video"
+            " (default directory: in the user cache directory)"
+        ),
+    )
+    parser.add_argument(
+        "--segment-cache-size",
+        metavar="",
+        type=cli_validate_size,
+        default=SEGMENT_CACHE_SIZE,
+        help=_(
+            "Bytes of segments the cache keeps, with an optional"
+            " K, M or G suffix (default: 2G)"
+        ),
+    )
+    parser.add_argument(
+        "--download-archive",
+        metavar="",
+        type=Path,
+        default=None,
+        help=_(
+            "Record downloaded videos in this file"
+            " and skip videos already recorded there"
+        ),
+    )
+    parser.add_argument(
+        "--verify-archive",
+        action="store_true",
+        help=_(
+            "Skip a recorded video only if its file still exists"
+            " and matches the recorded checksum"
+        ),
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help=_("Record Prometheus metrics of the jobs, served at /metrics"),
+    )
+    parser.add_argument(
+        "--metrics-file",
+        metavar="",
+        type=Path,
+        default=None,
+        help=_(
+            "Write Prometheus metrics of the jobs to this file,"
+            " for the node-exporter textfile collector"
+        ),
+    )
+    parser.add_argument(
+        "--on-cancel",
+        metavar="",
+        type=CancelPolicy,
+        choices=tuple(CancelPolicy),
+        default=CancelPolicy.keep,
+        help=_(
+            "What to do with a cancelled job: keep to resume it"
+            " later or discard (default: keep)"
+        ),
+    )
+    parser.add_argument(
+        "-v",
+        "--version",
+        action="version",
+        version=get_version_from_pyproject(),
+    )
+    return parser.parse_args()
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+async def serve(args: Namespace, stop: asyncio.Event) -> None:
+    """Serve jobs until `stop` is set, then cancel the running ones."""
+    session = create_aiohttp_session(
+        asyncio.get_running_loop(),
+        ConnectionProfile.for_concurrency(
+            args.concurrency,
+            split_segments=args.split_segments,
+            async_resolver=args.async_dns,
+            trace_phases=args.trace_phases,
+        ),
+    )
+    metadata_cache = None if args.no_cache else MetadataCache()
+    archive = (
+        DownloadArchive(args.download_archive, args.verify_archive)
+        if args.download_archive
+        else None
+    )
+    segment_cache = (
+        SegmentCache(args.segment_cache, args.segment_cache_size)
+        if args.segment_cache
+        else None
+    )
+    manager = JobManager(
+        session,
+        upload_directory=args.output,
+        workers=args.jobs,
+        concurrency=args.concurrency,
+        split_threshold=RANGE_SPLIT_THRESHOLD if args.split_segments else None,
+        cancel_policy=args.on_cancel,
+        metadata_cache=metadata_cache,
+        archive=archive,
+        segment_cache=segment_cache,
+    )
+    runner = web.AppRunner(create_app(manager))
+    await runner.setup()
+    exporter = MetricsExporter(file=args.metrics_file)
+    try:
+        if args.metrics or args.metrics_file:
+            process_metrics.enabled = True
+            collect_pool_stats(session)
+        await exporter.start()
+        if args.socket:
+            site: web.BaseSite = web.UnixSite(runner, args.socket)
+        else:
+            if not _is_loopback(args.host):
+                logger.warning(
+                    "%s listens on %s, the API has no authentication",
+                    SERVER_NAME,
+                    args.host,
+                )
+            site = web.TCPSite(runner, args.host, args.port)
+        await site.start()
+        print(_("{} is listening on {}").format(SERVER_NAME, site.name))
+        await stop.wait()
+    finally:
+        await exporter.stop()
+        await runner.cleanup()
+        await session.close()
+        if metadata_cache:
+            metadata_cache.close()
+        if archive:
+            archive.close()
+        if segment_cache:
+            segment_cache.close()
+
+
+def main() -> None:
+    args = parse_args(create_parser())
+    process_rate_limiter.set_rate(args.limit_rate)
+    event_loop = asyncio.new_event_loop()
+    stop = asyncio.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        event_loop.add_signal_handler(signal_number, stop.set)
+    try:
+        event_loop.run_until_complete(serve(args, stop))
+    finally:
+        event_loop.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -44,6 +44,10 @@ def main() -> None:
     Create the Tkinter application, and start its main event loop.
     """
     app.mainloop()
+    # The window stopped the jobs before it was closed.
+    loop.call_soon_threadsafe(loop.stop)
+    asyncio_thread.join()
+    loop.close()
 
 
 if __name__ == "__main__":
@@ -1,22 +1,60 @@
 import asyncio
+import json
 import re
-from collections.abc import Callable
+import time
+from collections.abc import Callable, Coroutine, Iterable
+from contextlib import AbstractAsyncContextManager, nullcontext, suppress
+from http import HTTPStatus
 from pathlib import Path
+from typing import Any, cast
+from urllib.parse import urlsplit
 
 import aiofiles
+import aiofiles.os
 import m3u8
-from aiofiles.threadpool.binary import AsyncBufferedIOBase
-from aiohttp import ClientSession
+from aiohttp import (
+    ClientError,
+    ClientResponse,
+    ClientResponseError,
+    ClientSession,
+)
 from slugify import slugify
 
-from async_rutube_downloader.playlist import MasterPlaylist
+from async_rutube_downloader.playlist import MasterPlaylist, VariantInfo
 from async_rutube_downloader.settings import (
     CHUNK_SIZE,
+    MAX_CONCURRENCY,
+    MIRROR_PROBE_SIZE,
+    PART_FILE_TEMPLATE,
+    PROGRESS_INTERVAL,
+    RANGE_PARTS,
+    REORDER_BUFFER_SIZE,
     RUTUBE_API_LINK,
+    SEGMENT_READ_SIZE,
     VIDEO_FORMAT,
     VIDEO_ID_REGEX,
 )
-from async_rutube_downloader.utils.create_session import create_aiohttp_session
+from async_rutube_downloader.utils import metrics
+from async_rutube_downloader.utils.archive import (
+    ArchiveEntry,
+    DownloadArchive,
+)
+from async_rutube_downloader.utils.cancellation import (
+    CancelPolicy,
+    CancelReport,
+)
+from async_rutube_downloader.utils.circuit_breaker import breakers_for
+from async_rutube_downloader.utils.concurrency import (
+    AdaptiveConcurrency,
+    BudgetSlot,
+    ConcurrencyLimit,
+    SegmentBudget,
+)
+from async_rutube_downloader.utils.create_session import (
+    ConnectionProfile,
+    create_aiohttp_session,
+    get_pool_stats,
+)
 from async_rutube_downloader.utils.decorators import log_download_time, retry
 from async_rutube_downloader.utils.descriptors import UrlDescriptor
 from async_rutube_downloader.utils.exceptions import (
@@ -27,18 +65,61 @@ from async_rutube_downloader.utils.exceptions import (
     MasterPlaylistInitializationError,
     QualityError,
     SegmentDownloadError,
+    UnknownSegmentSizesError,
 )
 from async_rutube_downloader.utils.interfaces import DownloaderABC
+from async_rutube_downloader.utils.journal import SegmentJournal
 from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.metadata_cache import (
+    MetadataCache,
+    signed_url_expiry,
+)
+from async_rutube_downloader.utils.mirrors import Mirror, MirrorPool
 from async_rutube_downloader.utils.miscellaneous import (
     get_or_create_loop,
     resolve_file_name,
 )
+from async_rutube_downloader.utils.progress import (
+    ProgressEvent,
+    ProgressTracker,
+)
+from async_rutube_downloader.utils.ranges import (
+    read_in_ranges,
+    supports_ranges,
+)
+from async_rutube_downloader.utils.rate_limiter import (
+    TokenBucket,
+    process_rate_limiter,
+)
+from async_rutube_downloader.utils.retry import RetryPolicy
+from async_rutube_downloader.utils.scheduler import SlidingWindowScheduler
+from async_rutube_downloader.utils.segment_cache import (
+    SegmentCache,
+    SegmentCacheEntry,
+    segment_key,
+)
+from async_rutube_downloader.utils.segment_writers import (
+    OnCommit,
+    OrderedSegmentWriter,
+    PositionalSegmentWriter,
+    SegmentWriter,
+    WriteMode,
+)
+from async_rutube_downloader.utils.tracing import (
+    Phase,
+    PhaseTimings,
+    get_tracer,
+)
 from async_rutube_downloader.utils.type_hints import APIResponseDict, Qualities
 from async_rutube_downloader.utils.validators import is_quality_valid
 
 logger = get_logger(__name__)
 
+# Segment responses meaning the signed playlist URLs expired.
+EXPIRED_URL_STATUSES = frozenset(
+    {HTTPStatus.FORBIDDEN, HTTPStatus.NOT_FOUND, HTTPStatus.GONE}
+)
+
 
 class RutubeDownloader(DownloaderABC):
     """
@@ -52,10 +133,22 @@ class RutubeDownloader(DownloaderABC):
         self,
         url: str,
         loop: asyncio.AbstractEventLoop | None = None,
-        callback: Callable[[int, int], None] | None = None,
+        callback: Callable[[ProgressEvent], None] | None = None,
         upload_directory: Path = Path.cwd(),
         session: ClientSession | None = None,
         auto_close_session: bool = True,
+        buffer_size: int | None = REORDER_BUFFER_SIZE,
+        write_mode: WriteMode = WriteMode.ordered,
+        concurrency: int = CHUNK_SIZE,
+        adaptive_concurrency: bool = False,
+        limit_rate: float | None = None,
+        split_threshold: int | None = None,
+        retry_policy: RetryPolicy | None = None,
+        segment_budget: SegmentBudget | None = None,
+        metadata_cache: MetadataCache | None = None,
+        archive: DownloadArchive | None = None,
+        segment_cache: SegmentCache | None = None,
+        progress_interval: float = PROGRESS_INTERVAL,
     ) -> None:
         """
         Args:
@@ -63,13 +156,40 @@ class RutubeDownloader(DownloaderABC):
             loop: The event loop to use
                 for asynchronous operations.
                 Defaults to the current event loop.
-            callback:
-                The callback function to call with the number of
-                completed requests and the total requests. Defaults to None.
+            callback: Called with the progress of the download,
+                at most once per `progress_interval` seconds.
             upload_directory: The directory to upload
                 the video to. Defaults to the current working directory.
             session: The aiohttp ClientSession to use for requests.
             auto_close_session: Whether to close the session
+            buffer_size: Max bytes of out-of-order segments kept in memory,
+                `None` means unlimited.
+            write_mode: How segments are written to the file.
+                `positional` learns segment sizes with HEAD requests
+                and falls back to `ordered` if they are unknown.
+            concurrency: How many segments are downloaded at the same time.
+            adaptive_concurrency: Change the number of segments downloaded
+                at the same time from the observed throughput and latency,
+                starting from `concurrency`.
+            limit_rate: Bandwidth limit of this download in bytes
+                per second, `None` means unlimited. The limit shared
+                by all downloads is `process_rate_limiter`.
+            split_threshold: Segments bigger than this many bytes are
+                downloaded with `RANGE_PARTS` parallel range requests,
+                `None` means never.
+            retry_policy: Retries of all requests of the download,
+                `retry_policy.retries` counts them.
+            segment_budget: Segment requests in flight shared with
+                other downloads running at the same time, their total
+                never goes above its limit.
+            metadata_cache: Keeps the API response and playlists
+                of the video, so fetching its info again is instant.
+            archive: Downloaded videos are recorded there, and an archived
+                video is not downloaded again, see `check_archive`.
+            segment_cache: Segments are served from it, if they were
+                downloaded before, and new ones are stored there.
+            progress_interval: Seconds between calls of the callback,
+                `0` means after every segment.
         """
         self.url = url
         self.video_title = "Unknown video"
@@ -78,33 +198,119 @@ class RutubeDownloader(DownloaderABC):
         self._callback = callback
         self._upload_directory = upload_directory
         self._selected_quality: m3u8.M3U8 | None = None
+        self._quality: tuple[int, int] | None = None
+        self._mirrors: MirrorPool | None = None
         self._master_playlist: MasterPlaylist | None = None
         self._video_id = self.__extract_id_from_url()
         self._session = (
-            session if session else create_aiohttp_session(self._loop)
+            session
+            if session
+            else create_aiohttp_session(
+                self._loop,
+                ConnectionProfile.for_concurrency(
+                    MAX_CONCURRENCY if adaptive_concurrency else concurrency,
+                    split_segments=split_threshold is not None,
+                ),
+            )
         )
         self._auto_close_session = auto_close_session
+        # Shared by every download on the session.
+        self._breakers = breakers_for(self._session)
+        self._tracer = get_tracer(self._session)
+        # Timings of the session when the download started.
+        self.__phases_start: PhaseTimings | None = None
+        self._buffer_size = buffer_size
+        self._write_mode = write_mode
+        self._concurrency = (
+            AdaptiveConcurrency(concurrency)
+            if adaptive_concurrency
+            else ConcurrencyLimit(concurrency)
+        )
+        self._rate_limiter = TokenBucket(limit_rate)
+        self._split_threshold = split_threshold
+        self.retry_policy = retry_policy if retry_policy else RetryPolicy()
+        self._segment_budget = segment_budget
+        self._metadata_cache = metadata_cache
+        self._archive = archive
+        self._segment_cache = segment_cache
+        self._progress_interval = progress_interval
+        self.__progress: ProgressTracker | None = None
+        # Unix time the playlist URLs expire, if it's known.
+        self.__metadata_expiry: float | None = None
+        self.__metadata_cached = False
         self.__api_response: APIResponseDict | None = None
-        self.__total_chunks = 0
-        self.__completed_requests = 0
-        self.__refresh_rate = 1
         self.__master_playlist_url: str = ""
+        # Qualities with prefetched variant playlists,
+        # see `fetch_video_info`.
+        self.variants: dict[tuple[int, int], VariantInfo] = {}
+        self.__variant_playlists: dict[tuple[int, int], str] = {}
         self.__download_cancelled = False
+        self.__cancel_policy = CancelPolicy.keep
+        # Work of the download that is aborted on cancel.
+        self.__cancellable_task: asyncio.Future | None = None
+        self.__failed_mirrors: dict[int, Mirror] = {}
+        # Bytes received for segments that are not complete yet.
+        self.__partial_bytes: dict[int, int] = {}
+        # Bytes of downloaded segments the writer didn't commit yet,
+        # see `__on_commit`.
+        self.__received_bytes: dict[int, int] = {}
+        self.cancel_report: CancelReport | None = None
+
+    async def check_archive(self) -> ArchiveEntry | None:
+        """
+        Look the video up in the archive, no requests are made.
+        If it's there, `file` is the archived file
+        and the video doesn't need to be downloaded.
+
+        Before `select_quality` any quality matches.
+        """
+        if not self._archive:
+            return None
+        entry = await self._archive.find(self._video_id, self._quality)
+        if entry:
+            logger.info("%s is in the archive: %s", self._video_id, entry)
+            self.file = entry.path
+        return entry
+
+    async def fetch_video_info(self, prefetch: bool = False) -> Qualities:
+        """
+        Fetch video info from Rutube API.
 
-    async def fetch_video_info(self) -> Qualities:
-        """Fetch video info from Rutube API."""
-        self.__api_response = await self._get_api_response()
+        Args:
+            prefetch: Also fetch variant playlists of all qualities
+                at the same time, they fill `variants`
+                and `select_quality` makes no requests.
+        """
+        self.variants = {}
+        self.__variant_playlists = {}
+        cached_api_response = await self.__get_cached("api")
+        self.__api_response = (
+            json.loads(cached_api_response)
+            if cached_api_response
+            else await self._get_api_response()
+        )
         self.__master_playlist_url = self.__extract_master_playlist_url(
             self.__api_response
         )
+        self.__metadata_expiry = signed_url_expiry(self.__master_playlist_url)
+        if not cached_api_response:
+            await self.__cache("api", json.dumps(self.__api_response))
         self.video_title = self.__api_response.get("title", "Unknown")
         self._filename = self.__sanitize_video_title(self.__api_response)
+        cached_master_playlist = await self.__get_cached("master")
         self._master_playlist = await MasterPlaylist(
-            self.__master_playlist_url, self._session
+            self.__master_playlist_url,
+            self._session,
+            self.retry_policy,
+            cached_master_playlist,
         ).run()
-        if self._master_playlist.qualities is not None:
-            return tuple(self._master_playlist.qualities.keys())
-        raise APIResponseError
+        if not cached_master_playlist and self._master_playlist.text:
+            await self.__cache("master", self._master_playlist.text)
+        if self._master_playlist.qualities is None:
+            raise APIResponseError
+        if prefetch:
+            await self.__prefetch_variants()
+        return tuple(self._master_playlist.qualities.keys())
 
     async def select_quality(self, selected_quality: tuple[int, int]) -> None:
         """
@@ -126,8 +332,17 @@ class RutubeDownloader(DownloaderABC):
         ]
         if not selected_quality_obj.uri:
             raise InvalidPlaylistError
-        self._selected_quality = await self.__get_selected_quality(
-            selected_quality_obj.uri
+        playlist = await self.__get_variant(
+            selected_quality, selected_quality_obj.uri
+        )
+        self._selected_quality = m3u8.loads(playlist, selected_quality_obj.uri)
+        self._quality = selected_quality
+        mirrors = (self._master_playlist.mirrors or {}).get(
+            selected_quality, [selected_quality_obj]
+        )
+        self._mirrors = MirrorPool(
+            (playlist.uri for playlist in mirrors if playlist.uri),
+            self._breakers,
         )
 
     @log_download_time
@@ -140,44 +355,349 @@ class RutubeDownloader(DownloaderABC):
         if not already selected, divides the video into segments,
         and downloads each segment concurrently. The downloaded segments are
         then written to a file in the specified upload directory.
+
+        If a previous download of the same video and quality
+        was interrupted, it's resumed from the first missing segment.
         """
         if self._master_playlist is None:
             raise MasterPlaylistInitializationError
         if self._selected_quality is None:
             await self.__select_best_quality()
-        assert self._selected_quality
+        assert self._selected_quality and self._quality and self._mirrors
+        if await self.check_archive():
+            if self._auto_close_session:
+                await self.close_session()
+            return
         self.segments = self._selected_quality.segments
-        self.__total_chunks = len(self.segments)
-        self.__refresh_rate = len(self.segments) // self.__total_chunks
-        self.file = resolve_file_name(
-            self._upload_directory, self._filename, VIDEO_FORMAT
+        if self._tracer:
+            self.__phases_start = self._tracer.timings
+        if len(self._mirrors.mirrors) > 1 and self.segments:
+            await self.__cancellable(self.__probe_mirrors(self._mirrors))
+        self.__progress = ProgressTracker(
+            len(self.segments),
+            self._callback,
+            self._progress_interval,
+            phases=lambda: self.phase_timings,
+        )
+        # The video is downloaded to a `.part` file, the journal next to it
+        # lists committed segments, so an interrupted download can resume.
+        self.file = self._upload_directory / PART_FILE_TEMPLATE.format(
+            self._video_id, *self._quality, VIDEO_FORMAT
         )
+        journal = SegmentJournal(
+            self.file, self._video_id, self._quality, len(self.segments)
+        )
+        await journal.load()
+        with (
+            metrics.active_downloads.track(),
+            self._segment_budget.join()
+            if self._segment_budget
+            else nullcontext(),
+        ):
+            try:
+                sizes = await self.__download_segments(journal)
+            except SegmentDownloadError as e:
+                if not self.__is_expired(e):
+                    raise
+                await self.__revalidate()
+                assert self._selected_quality
+                self.segments = self._selected_quality.segments
+                sizes = await self.__download_segments(journal)
 
-        async with aiofiles.open(
-            self.file,
-            mode="wb",
-        ) as file:
-            await self._download_video(file)
+        logger.debug("Connection pool: %s", get_pool_stats(self._session))
+        if self.retry_policy.retries:
+            logger.info(
+                "Retried requests: %s", dict(self.retry_policy.retries)
+            )
+        if timings := self.phase_timings:
+            logger.info("Request phases: %s", timings.summary())
+        if self.is_interrupted():
+            self.cancel_report = await self.__finish_cancelled(journal, sizes)
+        else:
+            part_file = self.file
+            self.file = resolve_file_name(
+                self._upload_directory, self._filename, VIDEO_FORMAT
+            )
+            await aiofiles.os.replace(part_file, self.file)
+            await journal.remove()
+            if self._archive:
+                await self._archive.add(
+                    self._video_id, self._quality, self.file
+                )
 
         if self._auto_close_session:
             await self.close_session()
 
-    async def _download_video(self, file: AsyncBufferedIOBase) -> None:
-        for i in range(0, len(self.segments), CHUNK_SIZE):
-            if not self.__download_cancelled:
-                download_tasks = [
-                    asyncio.create_task(self._download_segment(segment))
-                    for segment in self.segments[i : i + CHUNK_SIZE]
+    async def __download_segments(
+        self, journal: SegmentJournal
+    ) -> list[int] | None:
+        """
+        Returns:
+            Segment sizes, if they were learned for positional writes.
+        """
+        sizes = None
+        # A journal of positional writes is resumed positionally,
+        # whatever the write mode is.
+        scattered = journal.is_scattered()
+        if self._write_mode is WriteMode.positional or scattered:
+            sizes = await self.__get_segment_sizes()
+            if self.is_interrupted():
+                # Leave the `.part` file to the cancel policy.
+                return sizes
+        if sizes:
+            await self.__download_positional(journal, sizes)
+        elif scattered:
+            raise UnknownSegmentSizesError
+        else:
+            await self.__download_ordered(journal)
+        return sizes
+
+    async def _download_video(
+        self,
+        writer: SegmentWriter,
+        indices: Iterable[int],
+    ) -> None:
+        """
+        Download segments with a sliding window of `concurrency` requests
+        and stream their bodies to the writer.
+        """
+        scheduler = SlidingWindowScheduler(
+            lambda index: self._download_segment(
+                index, self.segments[index], writer
+            ),
+            window=self.__window,
+            is_stopped=self.is_interrupted,
+        )
+        await self.__cancellable(scheduler.run(indices))
+
+    def __window(self) -> int:
+        """How many segment requests may be in flight now."""
+        if self._segment_budget:
+            return min(self._concurrency.limit, self._segment_budget.share())
+        return self._concurrency.limit
+
+    def __request_slot(
+        self,
+    ) -> AbstractAsyncContextManager[BudgetSlot | None]:
+        """A slot of the segment budget, if downloads share one."""
+        if self._segment_budget:
+            return self._segment_budget.request()
+        return nullcontext()
+
+    async def __cancellable(
+        self, coroutine: Coroutine[Any, Any, None]
+    ) -> None:
+        """
+        Run the coroutine until it's done or the download is cancelled,
+        `interrupt_download` cancels it together with its requests.
+        """
+        if self.is_interrupted():
+            coroutine.close()
+            return
+        self.__cancellable_task = asyncio.ensure_future(coroutine)
+        try:
+            await self.__cancellable_task
+        except asyncio.CancelledError:
+            task = asyncio.current_task()
+            # The caller itself is cancelled, not the download.
+            if not self.is_interrupted() or (task and task.cancelling()):
+                raise
+        finally:
+            self.__cancellable_task = None
+
+    async def __finish_cancelled(
+        self, journal: SegmentJournal, sizes: list[int] | None
+    ) -> CancelReport:
+        """Apply the cancel policy to the `.part` file and report it."""
+        kept_bytes = sum(size for _, size in journal.committed.values())
+        discarded_bytes = sum(self.__partial_bytes.values())
+        saved_bytes = max(
+            self.__estimate_size(journal, sizes)
+            - kept_bytes
+            - discarded_bytes,
+            0,
+        )
+        if self.__cancel_policy is CancelPolicy.discard:
+            with suppress(FileNotFoundError):
+                await aiofiles.os.remove(self.file)
+            await journal.remove()
+            kept_bytes = 0
+        report = CancelReport(
+            policy=self.__cancel_policy,
+            aborted_requests=len(self.__partial_bytes),
+            discarded_bytes=discarded_bytes,
+            kept_bytes=kept_bytes,
+            saved_bytes=saved_bytes,
+        )
+        logger.info("Download is cancelled: %s", report)
+        return report
+
+    def __estimate_size(
+        self, journal: SegmentJournal, sizes: list[int] | None
+    ) -> int:
+        """Size of the whole video in bytes, exact if sizes are known,
+        else from the committed segments or the playlist bandwidth."""
+        if sizes:
+            return sum(sizes)
+        if journal.committed:
+            committed = sum(size for _, size in journal.committed.values())
+            return committed * len(self.segments) // len(journal.committed)
+        assert self._master_playlist and self._quality
+        playlist = (self._master_playlist.qualities or {}).get(self._quality)
+        bandwidth = playlist.stream_info.bandwidth if playlist else None
+        duration = sum(segment.duration or 0 for segment in self.segments)
+        return int((bandwidth or 0) / 8 * duration)
+
+    async def __download_ordered(self, journal: SegmentJournal) -> None:
+        """
+        Append segments to the file in playlist order,
+        memory is bounded by `buffer_size`, see `OrderedSegmentWriter`.
+        """
+        first_index, first_offset = journal.committed_prefix()
+        journal.forget(
+            [index for index in journal.committed if index >= first_index]
+        )
+        if first_index:
+            logger.info("Resuming download from segment %s", first_index)
+        assert self.__progress
+        self.__progress.resume(first_index)
+        async with (
+            aiofiles.open(
+                self.file,
+                mode="r+b" if first_index else "wb",
+            ) as file,
+            journal.open(),
+        ):
+            if first_index:
+                await file.truncate(first_offset)
+                await file.seek(first_offset)
+            writer = OrderedSegmentWriter(
+                file,
+                first_index,
+                max_buffered_bytes=self._buffer_size,
+                first_offset=first_offset,
+                on_commit=self.__on_commit(journal),
+            )
+            await self._download_video(
+                writer, range(first_index, len(self.segments))
+            )
+
+    async def __download_positional(
+        self, journal: SegmentJournal, sizes: list[int]
+    ) -> None:
+        """
+        Write segments at their final offsets in a preallocated file,
+        see `PositionalSegmentWriter`.
+        """
+        async with PositionalSegmentWriter.open(
+            self.file, sizes, self.__on_commit(journal)
+        ) as writer:
+            journal.forget(
+                [
+                    index
+                    for index, segment in journal.committed.items()
+                    if segment != writer.layout(index)
                 ]
-                downloaded_segments = await asyncio.gather(*download_tasks)
-                await file.writelines(downloaded_segments)
-            else:
-                break
+            )
+            if journal.committed:
+                logger.info(
+                    "Resuming download, %s segments are already written",
+                    len(journal.committed),
+                )
+            assert self.__progress
+            self.__progress.resume(len(journal.committed))
+            async with journal.open():
+                await self._download_video(
+                    writer,
+                    [
+                        index
+                        for index in range(len(self.segments))
+                        if index not in journal.committed
+                    ],
+                )
+
+    def __on_commit(self, journal: SegmentJournal) -> OnCommit:
+        """
+        A segment is complete once the writer flushed it to the file,
+        the ordered writer keeps segments after the head in memory.
+        """
+
+        async def on_commit(index: int, offset: int, size: int) -> None:
+            await journal.record(index, offset, size)
+            assert self.__progress
+            # Segments from the cache were not received.
+            self.__progress.complete(self.__received_bytes.pop(index, None))
+            self.__report_progress()
+
+        return on_commit
+
+    async def __get_segment_sizes(self) -> list[int] | None:
+        """
+        Learn sizes of all segments with HEAD requests.
+
+        Returns:
+            Segment sizes, or `None` when positional writes are not
+            supported or the server does not report some of them.
+        """
+        if not PositionalSegmentWriter.is_supported():
+            logger.info("Positional writes are not supported, append instead")
+            return None
+        sizes: list[int | None] = [None] * len(self.segments)
+
+        async def store_size(index: int, size: int | None) -> None:
+            sizes[index] = size
+
+        await self.__cancellable(
+            SlidingWindowScheduler(
+                lambda index: self._get_segment_size(self.segments[index]),
+                window=self.__window,
+            ).run(range(len(self.segments)), store_size)
+        )
+        if self.is_interrupted():
+            return None
+        if None in sizes:
+            logger.info("Segment sizes are unknown, append instead")
+            return None
+        return cast(list[int], sizes)
+
+    @property
+    def phase_timings(self) -> PhaseTimings | None:
+        """
+        Timings of request phases per host since the download started,
+        `None` if the session doesn't trace them, see `ConnectionProfile`.
+        Requests of other downloads on the session are counted too.
+        """
+        if self._tracer is None or self.__phases_start is None:
+            return None
+        return self._tracer.timings.since(self.__phases_start)
+
+    def set_rate_limit(self, rate: float | None) -> None:
+        """
+        Change the bandwidth limit of this download, even if it's running.
+        Call it from the event loop thread.
+
+        Args:
+            rate: Bytes per second, `None` means unlimited.
+        """
+        self._rate_limiter.set_rate(rate)
 
-    def interrupt_download(self) -> None:
-        """Will stop the next chunk of video segments from downloading."""
+    def interrupt_download(
+        self, policy: CancelPolicy = CancelPolicy.keep
+    ) -> None:
+        """
+        Cancel the download right away: requests in flight are aborted,
+        their connections are closed, and no new ones are started.
+        `download_video` then applies the policy to the `.part` file
+        and returns, see `cancel_report`.
+
+        Call it from the event loop thread,
+        from other threads use `loop.call_soon_threadsafe`.
+        """
         logger.info("Download is cancelled")
         self.__download_cancelled = True
+        self.__cancel_policy = policy
+        if self.__cancellable_task:
+            self.__cancellable_task.cancel()
 
     def is_interrupted(self) -> bool:
         return self.__download_cancelled
@@ -189,18 +709,201 @@ class RutubeDownloader(DownloaderABC):
     @retry("Failed to fetch API response", APIResponseError)
     async def _get_api_response(self) -> APIResponseDict:
         """Actually going to Rutube API and fetching video info by id."""
-        async with self._session.get(
-            RUTUBE_API_LINK.format(self._video_id)
-        ) as result:
+        url = RUTUBE_API_LINK.format(self._video_id)
+        async with self._breakers.guard(url), self._session.get(url) as result:
             return await result.json()
 
+    async def __probe_mirrors(self, pool: MirrorPool) -> None:
+        """
+        Measure latency and throughput of every mirror with a range
+        request of the first `MIRROR_PROBE_SIZE` bytes of the first
+        segment. A failed probe counts as one failure of the mirror.
+        """
+
+        async def probe(mirror: Mirror) -> None:
+            # Waiting for the slot is not a part of the latency.
+            async with self.__request_slot():
+                start = time.monotonic()
+                size = 0
+                url = mirror.segment_url(self.segments[0])
+                try:
+                    async with (
+                        self._breakers.guard(url),
+                        self._session.get(
+                            url,
+                            headers={
+                                "Range": f"bytes=0-{MIRROR_PROBE_SIZE - 1}"
+                            },
+                        ) as response,
+                    ):
+                        latency = time.monotonic() - start
+                        # A server ignoring the range sends the whole body.
+                        async for chunk in response.content.iter_chunked(
+                            SEGMENT_READ_SIZE
+                        ):
+                            size += len(chunk)
+                            await self.__throttle(len(chunk))
+                            if size >= MIRROR_PROBE_SIZE:
+                                break
+                except ClientError:
+                    logger.info("Probe of mirror %s failed", mirror.host)
+                    pool.report_failure(mirror)
+                else:
+                    pool.report_success(
+                        mirror, size, latency, time.monotonic() - start
+                    )
+
+        await asyncio.gather(*(probe(mirror) for mirror in pool.mirrors))
+
+    @retry("Failed to get size of video segment", SegmentDownloadError)
+    async def _get_segment_size(self, segment: m3u8.Segment) -> int | None:
+        assert self._mirrors
+        async with self.__request_slot():
+            # Chosen once the slot is taken, a circuit may open meanwhile.
+            url = self._mirrors.choose().segment_url(segment)
+            async with (
+                self._breakers.guard(url),
+                self._session.head(url) as response,
+            ):
+                return response.content_length
+
     @retry("Failed to download segment of video", SegmentDownloadError)
-    async def _download_segment(self, segment: m3u8.Segment) -> bytes:
-        async with self._session.get(segment.absolute_uri) as response:
-            self.__completed_requests += 1
-            if self._callback:
-                await self.__call_callback()
-            return await response.read()
+    async def _download_segment(
+        self,
+        index: int,
+        segment: m3u8.Segment,
+        writer: SegmentWriter,
+    ) -> None:
+        """Stream the segment body to the writer in fixed-size chunks."""
+        await writer.wait_for_space(index)
+        # A previous attempt may have written a part of the segment.
+        await writer.reset(index)
+        if await self.__write_cached(index, segment, writer):
+            return
+        assert self._mirrors and self.__progress
+        progress = self.__progress
+        size = 0
+        self.__partial_bytes[index] = 0
+
+        async def on_chunk(chunk_size: int) -> None:
+            self.__partial_bytes[index] += chunk_size
+            progress.receive(chunk_size)
+            await self.__throttle(chunk_size)
+
+        async def write(data: bytes) -> None:
+            # The slot is given up while the reorder buffer is full.
+            await writer.write(
+                index, data, slot.released if slot else nullcontext
+            )
+            if cached:
+                await cached.write(data)
+
+        try:
+            async with (
+                self.__cache_entry(segment) as cached,
+                self.__request_slot() as slot,
+            ):
+                # Chosen once the slot is taken, a circuit may open
+                # meanwhile. Retry on another mirror, if the previous
+                # one failed.
+                mirror = self._mirrors.choose(
+                    avoid=self.__failed_mirrors.get(index)
+                )
+                url = mirror.segment_url(segment)
+                # Waiting for the slot is not a part of the latency.
+                start = time.monotonic()
+                metrics.requests_in_flight.inc()
+                try:
+                    async with (
+                        self._breakers.guard(url),
+                        self._session.get(url) as response,
+                    ):
+                        latency = time.monotonic() - start
+                        if self.__should_split(response):
+                            body = await read_in_ranges(
+                                response,
+                                self._session,
+                                url,
+                                RANGE_PARTS,
+                                on_chunk,
+                                self._breakers,
+                                self.retry_policy,
+                            )
+                            size = len(body)
+                            await write(body)
+                        else:
+                            async for chunk in response.content.iter_chunked(
+                                SEGMENT_READ_SIZE
+                            ):
+                                size += len(chunk)
+                                await on_chunk(len(chunk))
+                                await write(chunk)
+                finally:
+                    metrics.requests_in_flight.dec()
+        except ClientError:
+            self.__failed_mirrors[index] = mirror
+            self._mirrors.report_failure(mirror)
+            self._concurrency.record_error()
+            metrics.segments_failed.inc()
+            raise
+        duration = time.monotonic() - start
+        if self._tracer:
+            # Streamed bodies are not reported by aiohttp tracing.
+            self._tracer.record(
+                urlsplit(url).hostname or "", Phase.body, duration - latency
+            )
+        self._mirrors.report_success(mirror, size, latency, duration)
+        self._concurrency.record_success(size, latency)
+        self.__failed_mirrors.pop(index, None)
+        self.__received_bytes[index] = size
+        await writer.commit(index)
+        self.__record_segment(size, latency, duration)
+        self.__partial_bytes.pop(index, None)
+
+    @staticmethod
+    def __record_segment(size: int, latency: float, duration: float) -> None:
+        metrics.segments_completed.inc()
+        metrics.downloaded_bytes.inc(size)
+        metrics.segment_latency.observe(latency)
+        if duration > 0:
+            metrics.segment_throughput.observe(size / duration)
+
+    async def __write_cached(
+        self, index: int, segment: m3u8.Segment, writer: SegmentWriter
+    ) -> bool:
+        """Write the segment from the segment cache, `False` on a miss."""
+        if not self._segment_cache:
+            return False
+        data = await self._segment_cache.get(self.__segment_key(segment))
+        if data is None:
+            return False
+        await writer.write(index, data)
+        await writer.commit(index)
+        return True
+
+    def __cache_entry(
+        self, segment: m3u8.Segment
+    ) -> AbstractAsyncContextManager[SegmentCacheEntry | None]:
+        """The body is streamed to the segment cache, if there is one."""
+        if self._segment_cache:
+            return self._segment_cache.entry(self.__segment_key(segment))
+        return nullcontext()
+
+    def __segment_key(self, segment: m3u8.Segment) -> str:
+        assert self._quality and segment.uri
+        return segment_key(self._video_id, self._quality, segment.uri)
+
+    def __should_split(self, response: ClientResponse) -> bool:
+        return (
+            self._split_threshold is not None
+            and (response.content_length or 0) > self._split_threshold
+            and supports_ranges(response)
+        )
+
+    async def __throttle(self, size: int) -> None:
+        """Wait for both the process and the download bandwidth limits."""
+        await process_rate_limiter.acquire(size)
+        await self._rate_limiter.acquire(size)
 
     async def __select_best_quality(self) -> None:
         if not (
@@ -228,17 +931,95 @@ class RutubeDownloader(DownloaderABC):
         except KeyError:
             raise M3U8URLNotFoundError
 
-    async def __call_callback(self) -> None:
-        """Once we've completed 1% of requests, call
-        the callback with the number of completed
-        requests and the total requests."""
-        if self._callback and (
-            self.__completed_requests % self.__refresh_rate == 0
-            or self.__completed_requests == self.__total_chunks
+    def __report_progress(self) -> None:
+        """Pass the progress to the callback, if `progress_interval`
+        passed since the last time, see `ProgressTracker`."""
+        if self.__progress:
+            self.__progress.emit(
+                self.retry_policy.retries.total(), self.__window()
+            )
+
+    async def __prefetch_variants(self) -> None:
+        """Fetch variant playlists of all qualities at the same time,
+        a quality that fails is left out of `variants`."""
+        assert self._master_playlist and self._master_playlist.qualities
+        streams = [
+            (quality, stream)
+            for quality, stream in self._master_playlist.qualities.items()
+            if stream.uri
+        ]
+        playlists = await asyncio.gather(
+            *(
+                self.__get_variant(quality, stream.uri)
+                for quality, stream in streams
+            ),
+            return_exceptions=True,
+        )
+        for (quality, stream), playlist in zip(
+            streams, playlists, strict=True
         ):
-            self._callback(self.__completed_requests, self.__total_chunks)
+            if isinstance(playlist, BaseException):
+                logger.info(
+                    "Failed to prefetch %s playlist",
+                    quality,
+                    exc_info=playlist,
+                )
+                continue
+            self.__variant_playlists[quality] = playlist
+            self.variants[quality] = VariantInfo.from_playlist(
+                quality, stream, m3u8.loads(playlist, stream.uri)
+            )
+
+    async def __get_variant(self, quality: tuple[int, int], uri: str) -> str:
+        """The variant playlist: prefetched, cached or downloaded."""
+        if playlist := self.__variant_playlists.get(quality):
+            return playlist
+        kind = "variant:{}x{}".format(*quality)
+        playlist = await self.__get_cached(kind)
+        if playlist is None:
+            playlist = await self.__get_playlist(uri)
+            await self.__cache(kind, playlist)
+        return playlist
 
     @retry("Failed to fetch API response", APIResponseError)
-    async def __get_selected_quality(self, quality_url: str) -> m3u8.M3U8:
-        async with self._session.get(quality_url) as response:
-            return m3u8.loads(await response.text(), quality_url)
+    async def __get_playlist(self, quality_url: str) -> str:
+        with metrics.timer(metrics.playlist_latency, kind="variant"):
+            async with (
+                self._breakers.guard(quality_url),
+                self._session.get(quality_url) as response,
+            ):
+                return await response.text()
+
+    async def __get_cached(self, kind: str) -> str | None:
+        if not self._metadata_cache:
+            return None
+        value = await self._metadata_cache.get(self._video_id, kind)
+        if value is not None:
+            logger.debug("Using cached %s of %s", kind, self._video_id)
+            self.__metadata_cached = True
+        return value
+
+    async def __cache(self, kind: str, value: str) -> None:
+        if self._metadata_cache:
+            await self._metadata_cache.set(
+                self._video_id, kind, value, self.__metadata_expiry
+            )
+
+    def __is_expired(self, error: SegmentDownloadError) -> bool:
+        """Segments of cached playlists failed, their URLs expired."""
+        cause = error.__cause__
+        return (
+            self.__metadata_cached
+            and isinstance(cause, ClientResponseError)
+            and cause.status in EXPIRED_URL_STATUSES
+        )
+
+    async def __revalidate(self) -> None:
+        """Fetch the metadata again, bypassing the cache."""
+        assert self._metadata_cache and self._quality
+        logger.info("Cached playlists of %s expired", self._video_id)
+        quality = self._quality
+        await self._metadata_cache.invalidate(self._video_id)
+        self.__metadata_cached = False
+        await self.fetch_video_info()
+        await self.select_quality(quality)
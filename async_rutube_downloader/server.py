@@ -0,0 +1,625 @@
+import asyncio
+import itertools
+import json
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from enum import StrEnum
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Self
+
+from aiohttp import ClientResponse, ClientSession, UnixConnector, web
+from aiohttp.typedefs import Handler
+
+from async_rutube_downloader.rutube_downloader import RutubeDownloader
+from async_rutube_downloader.settings import CHUNK_SIZE, JOB_STOP_TIMEOUT
+from async_rutube_downloader.utils.archive import DownloadArchive
+from async_rutube_downloader.utils.cancellation import CancelPolicy
+from async_rutube_downloader.utils.concurrency import SegmentBudget
+from async_rutube_downloader.utils.descriptors import UrlDescriptor
+from async_rutube_downloader.utils.exceptions import (
+    InvalidJobError,
+    JobServerError,
+)
+from async_rutube_downloader.utils.interfaces import DownloaderABC
+from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.metadata_cache import MetadataCache
+from async_rutube_downloader.utils.metrics import METRICS_PATH, handle_metrics
+from async_rutube_downloader.utils.progress import ProgressEvent
+from async_rutube_downloader.utils.segment_cache import SegmentCache
+from async_rutube_downloader.utils.type_hints import Qualities
+
+logger = get_logger(__name__)
+
+
+class JobState(StrEnum):
+    queued = "queued"
+    running = "running"
+    # Stopped by `JobManager.pause`, the `.part` file is kept to resume.
+    paused = "paused"
+    done = "done"
+    failed = "failed"
+    cancelled = "cancelled"
+
+
+FINAL_STATES = frozenset({JobState.done, JobState.failed, JobState.cancelled})
+
+
+@dataclass(eq=False)
+class Job:
+    """A video download submitted to the server."""
+
+    id: int
+    url: str
+    upload_directory: Path
+    # `None` means the best available quality.
+    quality: tuple[int, int] | None = None
+    state: JobState = JobState.queued
+    title: str | None = None
+    completed_segments: int = 0
+    total_segments: int = 0
+    bytes_received: int = 0
+    # Bytes per second, see `ProgressEvent`.
+    rate: float = 0.0
+    # Seconds until the job is done, `None` if it's unknown.
+    eta: float | None = None
+    # The saved video, when the job is done.
+    file: Path | None = None
+    # Request phase timings per host, see `PhaseTimings.to_dict`,
+    # if the session traces them.
+    phases: dict[str, Any] | None = None
+    error: str | None = None
+    # Set while the job runs.
+    downloader: DownloaderABC | None = field(default=None, repr=False)
+    # Downloader that fetched the video info before the job was
+    # submitted, and the qualities it returned, see `JobManager.submit`.
+    prefetched: tuple[DownloaderABC, Qualities] | None = field(
+        default=None, repr=False
+    )
+    # Queues of the event streams following the job.
+    _listeners: set[asyncio.Queue[dict[str, Any]]] = field(
+        default_factory=set, repr=False
+    )
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINAL_STATES
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "id": self.id,
+            "url": self.url,
+            "output": str(self.upload_directory),
+            "quality": list(self.quality) if self.quality else None,
+            "state": self.state,
+            "title": self.title,
+            "completed_segments": self.completed_segments,
+            "total_segments": self.total_segments,
+            "bytes_received": self.bytes_received,
+            "rate": self.rate,
+            "eta": self.eta,
+            "file": str(self.file) if self.file else None,
+            "error": self.error,
+            "phases": self.phases,
+        }
+
+    def publish(self, event: str) -> None:
+        """Send the event with the job snapshot to every listener."""
+        message = {"event": event, "job": self.to_dict()}
+        for listener in self._listeners:
+            listener.put_nowait(message)
+
+    async def events(self) -> AsyncIterator[dict[str, Any]]:
+        """
+        The current state of the job, then its events,
+        until the job is finished.
+        """
+        listener: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self._listeners.add(listener)
+        try:
+            yield {"event": "state", "job": self.to_dict()}
+            while not self.finished or not listener.empty():
+                yield await listener.get()
+        finally:
+            self._listeners.discard(listener)
+
+
+class JobManager:
+    """
+    Runs submitted jobs with a pool of `workers` on one session.
+
+    Jobs wait in a queue, every worker downloads one video at a time.
+    Running jobs share `concurrency` segment requests in flight,
+    see `SegmentBudget`. A paused job gives its worker up,
+    when it's resumed it's queued again and continues from its journal.
+    """
+
+    def __init__(
+        self,
+        session: ClientSession,
+        upload_directory: Path = Path.cwd(),
+        workers: int = 1,
+        concurrency: int = CHUNK_SIZE,
+        split_threshold: int | None = None,
+        cancel_policy: CancelPolicy = CancelPolicy.keep,
+        downloader_class: type[DownloaderABC] = RutubeDownloader,
+        metadata_cache: MetadataCache | None = None,
+        archive: DownloadArchive | None = None,
+        segment_cache: SegmentCache | None = None,
+    ) -> None:
+        self._session = session
+        self._upload_directory = upload_directory
+        self._workers = workers
+        self._concurrency = concurrency
+        self._split_threshold = split_threshold
+        self._cancel_policy = cancel_policy
+        self._downloader_class = downloader_class
+        self._metadata_cache = metadata_cache
+        self._archive = archive
+        self._segment_cache = segment_cache
+        self._budget = SegmentBudget(concurrency)
+        # `None` stops a worker.
+        self._queue: asyncio.Queue[Job | None] = asyncio.Queue()
+        self._jobs: dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._tasks: list[asyncio.Task] = []
+        self._url_validator = UrlDescriptor()
+        # Jobs of the running downloaders, for their progress callbacks.
+        self._running: dict[DownloaderABC, Job] = {}
+
+    def start(self) -> None:
+        """Start the workers, call it from the event loop thread."""
+        self._tasks = [
+            asyncio.create_task(self._work()) for _ in range(self._workers)
+        ]
+
+    async def stop(self) -> None:
+        """
+        Cancel all jobs and wait for the workers to finish. Running
+        downloads stop as on `cancel`, saving their journals, those
+        that don't within `JOB_STOP_TIMEOUT` are cancelled outright.
+        """
+        for job in self._jobs.values():
+            self.cancel(job.id)
+        for _ in self._tasks:
+            self._queue.put_nowait(None)
+        if self._tasks:
+            await asyncio.wait(self._tasks, timeout=JOB_STOP_TIMEOUT)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def create_downloader(
+        self,
+        url: str,
+        upload_directory: Path | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> DownloaderABC:
+        """
+        A downloader with the settings of the queue. Its video info
+        may be fetched before the job is submitted, see `submit`.
+
+        Args:
+            loop: The event loop of the manager,
+                if it's called from another thread.
+
+        Raises:
+            InvalidURLError: The URL is invalid.
+        """
+        downloader = self._downloader_class(
+            url,
+            loop,
+            callback=lambda event: self.__on_progress(downloader, event),
+            upload_directory=upload_directory or self._upload_directory,
+            session=self._session,
+            auto_close_session=False,
+            concurrency=self._concurrency,
+            split_threshold=self._split_threshold,
+            segment_budget=self._budget,
+            metadata_cache=self._metadata_cache,
+            archive=self._archive,
+            segment_cache=self._segment_cache,
+        )
+        return downloader
+
+    def submit(
+        self,
+        url: str,
+        quality: tuple[int, int] | None = None,
+        upload_directory: Path | None = None,
+        prefetched: tuple[DownloaderABC, Qualities] | None = None,
+    ) -> Job:
+        """
+        Args:
+            prefetched: A downloader of `create_downloader` for the same
+                URL and directory, and the qualities its
+                `fetch_video_info` returned. The job doesn't fetch
+                the video info again.
+
+        Raises:
+            JobServerError: The URL, quality or directory is invalid.
+        """
+        if not (
+            self._url_validator.is_valid_url(url)
+            or self._url_validator.is_valid_id(url)
+        ):
+            raise InvalidJobError("URL", url)
+        if quality is not None and not (
+            len(quality) == 2
+            and all(type(side) is int and side > 0 for side in quality)
+        ):
+            raise InvalidJobError("quality", quality)
+        upload_directory = upload_directory or self._upload_directory
+        if not upload_directory.is_dir():
+            raise InvalidJobError("output", upload_directory)
+        job = Job(
+            next(self._ids),
+            url,
+            upload_directory,
+            quality,
+            prefetched=prefetched,
+        )
+        self._jobs[job.id] = job
+        self._queue.put_nowait(job)
+        logger.info("Job %s is queued: %s", job.id, url)
+        return job
+
+    def get(self, job_id: int) -> Job:
+        """
+        Raises:
+            KeyError: There is no such job.
+        """
+        return self._jobs[job_id]
+
+    def jobs(self) -> list[Job]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: int) -> Job:
+        """
+        A queued job is cancelled at once, a running one
+        as soon as its requests are aborted.
+        """
+        job = self.get(job_id)
+        if job.finished:
+            return job
+        if job.downloader:
+            job.downloader.interrupt_download(self._cancel_policy)
+            if job.state is not JobState.running:
+                # It's being paused, or resumed before it stopped.
+                self.__set_state(job, JobState.cancelled)
+        else:
+            self.__set_state(job, JobState.cancelled)
+        return job
+
+    def pause(self, job_id: int) -> Job:
+        """
+        A queued job is skipped until it's resumed, a running one
+        is stopped keeping its `.part` file.
+        """
+        job = self.get(job_id)
+        if job.state not in (JobState.queued, JobState.running):
+            return job
+        self.__set_state(job, JobState.paused)
+        if job.downloader:
+            job.downloader.interrupt_download(CancelPolicy.keep)
+        return job
+
+    def resume(self, job_id: int) -> Job:
+        """Queue a paused job again."""
+        job = self.get(job_id)
+        if job.state is not JobState.paused:
+            return job
+        self.__set_state(job, JobState.queued)
+        # A job still stopping is queued again when it stops.
+        if not job.downloader:
+            self._queue.put_nowait(job)
+        return job
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            if job is None:
+                return
+            try:
+                # Paused or cancelled while it was waiting.
+                if job.state is JobState.queued:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        # An interrupted downloader can't be used again,
+        # a resumed job fetches the video info anew.
+        prefetched, job.prefetched = job.prefetched, None
+        downloader = job.downloader = (
+            prefetched[0]
+            if prefetched
+            else self.create_downloader(job.url, job.upload_directory)
+        )
+        self._running[downloader] = job
+        self.__set_state(job, JobState.running)
+        try:
+            if entry := await downloader.check_archive():
+                job.file = entry.path
+                self.__set_state(job, JobState.done)
+                return
+            qualities = (
+                prefetched[1]
+                if prefetched
+                else await downloader.fetch_video_info()
+            )
+            job.title = downloader.video_title
+            if job.quality:
+                await self.__select_quality(downloader, job.quality, qualities)
+            if not downloader.is_interrupted():
+                await downloader.download_video()
+        except asyncio.CancelledError:
+            downloader.interrupt_download(self._cancel_policy)
+            self.__set_state(job, JobState.cancelled)
+            raise
+        except Exception as e:
+            logger.info("Job %s failed", job.id, exc_info=True)
+            job.error = str(e) or type(e).__name__
+            self.__set_state(job, JobState.failed)
+            return
+        finally:
+            job.downloader = None
+            del self._running[downloader]
+        if not downloader.is_interrupted():
+            job.file = downloader.file
+            self.__set_state(job, JobState.done)
+        elif job.state is JobState.running:
+            self.__set_state(job, JobState.cancelled)
+        elif job.state is JobState.queued:
+            # Resumed before it stopped.
+            self._queue.put_nowait(job)
+
+    async def __select_quality(
+        self,
+        downloader: DownloaderABC,
+        quality: tuple[int, int],
+        qualities: Qualities,
+    ) -> None:
+        if quality not in qualities:
+            raise InvalidJobError("quality", quality)
+        await downloader.select_quality(quality)
+
+    def __on_progress(
+        self, downloader: DownloaderABC, event: ProgressEvent
+    ) -> None:
+        if (job := self._running.get(downloader)) is None:
+            return
+        job.completed_segments = event.completed_segments
+        job.total_segments = event.total_segments
+        job.bytes_received = event.bytes_received
+        job.rate = event.rate
+        job.eta = event.eta
+        if event.phases:
+            job.phases = event.phases.to_dict()
+        job.publish("progress")
+
+    def __set_state(self, job: Job, state: JobState) -> None:
+        logger.info("Job %s is %s", job.id, state)
+        job.state = state
+        job.publish("state")
+
+
+MANAGER_KEY = web.AppKey("manager", JobManager)
+
+
+def create_app(manager: JobManager) -> web.Application:
+    """
+    JSON API of the job server:
+
+    - `POST /jobs` submit a job: `{"url": ..., "quality": [1920, 1080],
+      "output": "/path/to/directory"}`, only `url` is required.
+    - `GET /jobs` list jobs.
+    - `GET /jobs/{id}` status of a job.
+    - `DELETE /jobs/{id}` cancel a job.
+    - `POST /jobs/{id}/pause`, `POST /jobs/{id}/resume`.
+    - `GET /jobs/{id}/events` progress events of a job,
+      one JSON object per line, until the job is finished.
+    - `GET /metrics` Prometheus metrics, see `MetricsExporter`.
+
+    `POST` requests must be `application/json`, even without a body.
+    """
+    app = web.Application(middlewares=[_require_json])
+    app[MANAGER_KEY] = manager
+    app.router.add_post("/jobs", _submit_job)
+    app.router.add_get("/jobs", _list_jobs)
+    app.router.add_get("/jobs/{id}", _get_job)
+    app.router.add_delete("/jobs/{id}", _cancel_job)
+    app.router.add_post("/jobs/{id}/pause", _pause_job)
+    app.router.add_post("/jobs/{id}/resume", _resume_job)
+    app.router.add_get("/jobs/{id}/events", _stream_events)
+    app.router.add_get(METRICS_PATH, handle_metrics)
+
+    async def start(app: web.Application) -> None:
+        app[MANAGER_KEY].start()
+
+    async def stop(app: web.Application) -> None:
+        await app[MANAGER_KEY].stop()
+
+    app.on_startup.append(start)
+    app.on_shutdown.append(stop)
+    return app
+
+
+def _error(message: str, status: int) -> web.Response:
+    return web.json_response({"error": message}, status=status)
+
+
+@web.middleware
+async def _require_json(
+    request: web.Request, handler: Handler
+) -> web.StreamResponse:
+    """
+    Browsers send `POST` of other content types cross-origin without
+    a preflight, a web page could submit jobs to the server.
+    """
+    if request.method == "POST" and request.content_type != "application/json":
+        return _error(
+            "Content-Type must be application/json",
+            HTTPStatus.UNSUPPORTED_MEDIA_TYPE,
+        )
+    return await handler(request)
+
+
+def _find_job(request: web.Request) -> Job | None:
+    try:
+        return request.app[MANAGER_KEY].get(int(request.match_info["id"]))
+    except (KeyError, ValueError):
+        return None
+
+
+async def _submit_job(request: web.Request) -> web.Response:
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return _error("Request body must be JSON", HTTPStatus.BAD_REQUEST)
+    if not isinstance(body, dict) or not isinstance(body.get("url"), str):
+        return _error("url is required", HTTPStatus.BAD_REQUEST)
+    quality = body.get("quality")
+    output = body.get("output")
+    try:
+        job = request.app[MANAGER_KEY].submit(
+            body["url"],
+            tuple(quality) if isinstance(quality, list) else quality,
+            Path(output) if isinstance(output, str) else None,
+        )
+    except JobServerError as e:
+        return _error(str(e), HTTPStatus.BAD_REQUEST)
+    return web.json_response(job.to_dict(), status=HTTPStatus.CREATED)
+
+
+async def _list_jobs(request: web.Request) -> web.Response:
+    return web.json_response(
+        {"jobs": [job.to_dict() for job in request.app[MANAGER_KEY].jobs()]}
+    )
+
+
+async def _get_job(request: web.Request) -> web.Response:
+    if not (job := _find_job(request)):
+        return _error("Job not found", HTTPStatus.NOT_FOUND)
+    return web.json_response(job.to_dict())
+
+
+async def _cancel_job(request: web.Request) -> web.Response:
+    if not (job := _find_job(request)):
+        return _error("Job not found", HTTPStatus.NOT_FOUND)
+    return web.json_response(request.app[MANAGER_KEY].cancel(job.id).to_dict())
+
+
+async def _pause_job(request: web.Request) -> web.Response:
+    if not (job := _find_job(request)):
+        return _error("Job not found", HTTPStatus.NOT_FOUND)
+    return web.json_response(request.app[MANAGER_KEY].pause(job.id).to_dict())
+
+
+async def _resume_job(request: web.Request) -> web.Response:
+    if not (job := _find_job(request)):
+        return _error("Job not found", HTTPStatus.NOT_FOUND)
+    return web.json_response(request.app[MANAGER_KEY].resume(job.id).to_dict())
+
+
+async def _stream_events(request: web.Request) -> web.StreamResponse:
+    if not (job := _find_job(request)):
+        return _error("Job not found", HTTPStatus.NOT_FOUND)
+    response = web.StreamResponse(
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    await response.prepare(request)
+    async for event in job.events():
+        await response.write(json.dumps(event).encode() + b"\n")
+    await response.write_eof()
+    return response
+
+
+class JobServerClient:
+    """
+    Client of a running `rtube-server`.
+
+    Usage:
+        async with JobServerClient.connect("http://127.0.0.1:8765") as client:
+            job = await client.submit(url)
+            async for event in client.events(job["id"]):
+                ...
+    """
+
+    def __init__(self, session: ClientSession, base_url: str) -> None:
+        self._session = session
+        self.base_url = base_url.rstrip("/")
+
+    @classmethod
+    def connect(cls, address: str) -> Self:
+        """
+        Args:
+            address: URL of the server, or a path to its Unix socket.
+        """
+        if address.startswith(("http://", "https://")):
+            return cls(ClientSession(), address)
+        return cls(
+            ClientSession(connector=UnixConnector(path=address)),
+            "http://localhost",
+        )
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        await self._session.close()
+
+    async def submit(
+        self,
+        url: str,
+        quality: tuple[int, int] | None = None,
+        output: Path | None = None,
+    ) -> dict[str, Any]:
+        body: dict[str, Any] = {"url": url}
+        if quality:
+            body["quality"] = list(quality)
+        if output:
+            body["output"] = str(output.resolve())
+        return await self._request("POST", "/jobs", json=body)
+
+    async def jobs(self) -> list[dict[str, Any]]:
+        return (await self._request("GET", "/jobs"))["jobs"]
+
+    async def status(self, job_id: int) -> dict[str, Any]:
+        return await self._request("GET", f"/jobs/{job_id}")
+
+    async def cancel(self, job_id: int) -> dict[str, Any]:
+        return await self._request("DELETE", f"/jobs/{job_id}")
+
+    async def pause(self, job_id: int) -> dict[str, Any]:
+        return await self._request("POST", f"/jobs/{job_id}/pause", json={})
+
+    async def resume(self, job_id: int) -> dict[str, Any]:
+        return await self._request("POST", f"/jobs/{job_id}/resume", json={})
+
+    async def events(self, job_id: int) -> AsyncIterator[dict[str, Any]]:
+        """Events of the job until it's finished, see `Job.events`."""
+        async with self._session.get(
+            f"{self.base_url}/jobs/{job_id}/events"
+        ) as response:
+            await self.__raise_for_error(response)
+            async for line in response.content:
+                if line.strip():
+                    yield json.loads(line)
+
+    async def _request(
+        self, method: str, path: str, **kwargs
+    ) -> dict[str, Any]:
+        async with self._session.request(
+            method, f"{self.base_url}{path}", **kwargs
+        ) as response:
+            await self.__raise_for_error(response)
+            return await response.json()
+
+    async def __raise_for_error(self, response: ClientResponse) -> None:
+        if response.status < HTTPStatus.BAD_REQUEST:
+            return
+        if response.content_type == "application/json":
+            raise JobServerError((await response.json())["error"])
+        raise JobServerError(response.reason)
@@ -19,10 +19,14 @@ translation.install()
 _ = translation.gettext
 ##################################################################### Constants
 MINUTE: Final[int] = 60
+MIB: Final[int] = 1024 * 1024
 RUTUBE_API_LINK: Final[str] = (
     r"https://rutube.ru/api/play/options/{}/?no_404=true&referer=https%253A%252F%252Frutube.ru&pver=v2"
 )
 VIDEO_FORMAT: Final[str] = "mp4"
+# Unfinished download: video id, width, height and format.
+# Renamed to the video title when the download is complete.
+PART_FILE_TEMPLATE: Final[str] = "{}_{}x{}.{}.part"
 # regex for video id.
 VIDEO_ID_REGEX: Final[str] = r"(?a)(?<=video\/)\w+"
 # regex for video url validation
@@ -31,8 +35,115 @@ URL_PATTERN: Final[str] = (
 )
 ID_PATTERN: Final[str] = r"(?a)^\w+$"
 URL_FOR_ID_TEMPLATE: Final[str] = "https://rutube.ru/video/{}/"
-# Determines how many chunks will be loaded at the same time.
+# Determines how many segments are downloaded at the same time.
+# A new segment request starts as soon as any running one finishes.
 CHUNK_SIZE: Final[int] = 20
+# Videos downloaded at the same time, `rtube-cli -f urls.txt --jobs N`.
+# They share `--concurrency` segment requests in flight.
+MAX_JOBS: Final[int] = 16
+# Videos of the desktop UI queue downloaded at the same time.
+UI_JOBS: Final[int] = 3
+# Adaptive concurrency: `rtube-cli --adaptive-concurrency`.
+# Starts from `CHUNK_SIZE` and never goes higher than this.
+MAX_CONCURRENCY: Final[int] = 64
+# Seconds between changes of the limit.
+ADAPTIVE_CONCURRENCY_INTERVAL: Final[float] = 2.0
+# The limit is halved when latency grows by this factor.
+LATENCY_TOLERANCE: Final[float] = 2.0
+# Bandwidth limit: the token bucket holds at most this many seconds
+# worth of bytes, so downloads are paced smoothly instead of bursts.
+RATE_LIMIT_BURST: Final[float] = 0.1
+# Suffixes of `rtube-cli --limit-rate`, like `500K` or `2M`.
+RATE_SUFFIXES: Final[dict[str, int]] = {
+    "": 1,
+    "K": 1024,
+    "M": 1024**2,
+    "G": 1024**3,
+}
+# How many bytes of a segment body are read from the network
+# and passed to the file writer at once.
+SEGMENT_READ_SIZE: Final[int] = 64 * 1024
+# Range requests, `rtube-cli --split-segments`.
+# Segments bigger than this are downloaded with several requests
+# at the same time, one TCP stream can't fill a high-latency link.
+RANGE_SPLIT_THRESHOLD: Final[int] = 4 * 1024 * 1024
+# How many requests download one such segment.
+RANGE_PARTS: Final[int] = 4
+# Segments finish out of order, but are written in playlist order.
+# Max bytes of finished out-of-order segments kept in memory per download,
+# when it is full new segment requests wait for the head-of-line segment.
+REORDER_BUFFER_SIZE: Final[int] = 64 * 1024 * 1024
+# Low-memory preset, `rtube-cli --low-memory`.
+LOW_MEMORY_REORDER_BUFFER_SIZE: Final[int] = 8 * 1024 * 1024
+# Retries of failed requests, see `RetryPolicy`.
+# Attempts of one request, including the first one.
+RETRY_MAX_ATTEMPTS: Final[int] = 3
+# Seconds, delays are random up to this, doubled with every retry.
+RETRY_BASE_DELAY: Final[float] = 0.5
+RETRY_MAX_DELAY: Final[float] = 30.0
+# Retries of one download: this many plus a share of successful requests.
+RETRY_BUDGET_MINIMUM: Final[int] = 20
+RETRY_BUDGET_RATIO: Final[float] = 0.1
+# Progress events of a download, see `ProgressTracker`.
+# Seconds between events, consumers are not flooded on long videos.
+PROGRESS_INTERVAL: Final[float] = 0.1
+# Seconds of the sliding window the current download rate is measured over.
+PROGRESS_RATE_WINDOW: Final[float] = 3.0
+# Frames per second of the `rtube-cli` progress lines.
+CLI_PROGRESS_FPS: Final[float] = 10.0
+# Connection pool, see `ConnectionProfile`.
+# Seconds resolved addresses of hosts are cached.
+DNS_CACHE_TTL: Final[int] = 5 * MINUTE
+# Seconds an idle connection is kept open for the next request.
+KEEPALIVE_TIMEOUT: Final[float] = MINUTE
+# Circuit breaker of every host, see `CircuitBreaker`.
+# The circuit opens when this share of the last requests failed,
+CIRCUIT_FAILURE_RATE: Final[float] = 0.5
+# counting this many last requests, but not less than `CIRCUIT_MIN_CALLS`.
+CIRCUIT_WINDOW: Final[int] = 20
+CIRCUIT_MIN_CALLS: Final[int] = 5
+# Seconds requests to the host fail at once, then probe requests are sent.
+CIRCUIT_COOLDOWN: Final[float] = 30.0
+CIRCUIT_HALF_OPEN_PROBES: Final[int] = 1
+# Every quality is served by several CDN mirrors.
+# A mirror failing this many requests in a row is disabled for a while,
+# its segments are downloaded from the other mirrors.
+MIRROR_MAX_FAILURES: Final[int] = 3
+MIRROR_COOLDOWN: Final[int] = MINUTE
+# Bytes of the first segment requested from every mirror to measure it.
+MIRROR_PROBE_SIZE: Final[int] = SEGMENT_READ_SIZE
+# Job server, `rtube-server`. Listens on the local host only,
+# `rtube-cli --server` submits downloads to it.
+SERVER_HOST: Final[str] = "127.0.0.1"
+SERVER_PORT: Final[int] = 8765
+# Seconds running jobs get to save their progress when the queue stops.
+JOB_STOP_TIMEOUT: Final[int] = 10
+# Highest TCP port, of `--port` and `--metrics-port`.
+MAX_PORT: Final[int] = 65535
+# Directory of the app in the user cache directory.
+APP_NAME: Final[str] = "async_rutube_downloader"
+# Metadata cache: API responses and playlists, see `MetadataCache`.
+# Seconds an entry is fresh.
+METADATA_CACHE_TTL: Final[int] = 60 * MINUTE
+# Bytes of entries kept, least recently used ones are evicted.
+METADATA_CACHE_SIZE: Final[int] = 16 * MIB
+# Segment cache, see `SegmentCache`. Bytes of segments kept,
+# least recently used ones are evicted.
+SEGMENT_CACHE_SIZE: Final[int] = 2048 * MIB
+# Metrics, `rtube-cli --metrics-port` and `--metrics-file`.
+# Upper bounds of latency histogram buckets, seconds.
+METRICS_LATENCY_BUCKETS: Final[tuple[float, ...]] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)  # fmt: skip
+# Upper bounds of throughput histogram buckets, bytes per second.
+METRICS_THROUGHPUT_BUCKETS: Final[tuple[float, ...]] = tuple(
+    MIB * 2**power for power in range(-3, 7)
+)
+# Seconds between writes of the metrics file.
+METRICS_FILE_INTERVAL: Final[float] = 15.0
+# Seconds before signed playlist URLs expire when they're treated as
+# expired, a download started just before should not fail midway.
+SIGNED_URL_MARGIN: Final[int] = 5 * MINUTE
 FULL_HD_1080p: Final[tuple[int, int]] = (1920, 1080)
 HD_720p: Final[tuple[int, int]] = (1280, 720)
 # CLI_TEXT
@@ -58,6 +169,15 @@ Usage examples:
       [{cli_name}] -f ~/path/to/file2.txt -d ,
 """
 ).format(cli_name=CLI_NAME)
+# SERVER_TEXT
+SERVER_NAME: Final[str] = "rtube-server"
+SERVER_DESCRIPTION: Final[str] = _("""
+Long-running download server for Rutube videos.
+ - One event loop and one connection pool are shared by all downloads.
+ - Jobs are submitted over a local HTTP JSON API or a Unix socket,
+ `rtube-cli --server` submits to it.
+""")
+SERVER_UNAVAILABLE_MSG: Final[str] = _("Server is unavailable: {}")
 API_RESPONSE_ERROR_MSG: Final[str] = _(
     "Resource not found (404) "
     "The URL may be incorrect, or the API might be unavailable."
@@ -1,22 +1,25 @@
 import asyncio
 import tkinter
 from asyncio import AbstractEventLoop, new_event_loop
+from collections.abc import Callable
 from concurrent.futures import Future
+from contextlib import suppress
 from enum import Enum, auto
 from pathlib import Path
-from queue import Queue
 from tkinter import filedialog, messagebox
-from typing import Final
+from typing import Any, Final
 
 import customtkinter as ctk
 
-from async_rutube_downloader.settings import DOWNLOAD_CANCELED, _
+from async_rutube_downloader.server import FINAL_STATES, JobManager, JobState
+from async_rutube_downloader.settings import CHUNK_SIZE, MIB, UI_JOBS, _
+from async_rutube_downloader.utils.concurrency import LatestValue
 from async_rutube_downloader.utils.create_session import create_aiohttp_session
 from async_rutube_downloader.utils.exceptions import (
     APIResponseError,
-    DownloaderIsNotInitializerError,
     FolderDoesNotExistError,
     InvalidURLError,
+    JobServerError,
     M3U8URLNotFoundError,
     MasterPlaylistInitializationError,
     QualityError,
@@ -24,6 +27,9 @@ from async_rutube_downloader.utils.exceptions import (
     UploadDirectoryNotSelectedError,
 )
 from async_rutube_downloader.utils.interfaces import DownloaderABC
+from async_rutube_downloader.utils.metadata_cache import MetadataCache
+from async_rutube_downloader.utils.progress_renderer import format_eta
+from async_rutube_downloader.utils.type_hints import Qualities
 
 INVALID_URL_MSG: Final[str] = _(
     "The provided URL is invalid. Please check and try again."
@@ -38,18 +44,154 @@ SEGMENT_DOWNLOAD_ERROR_MSG: Final[str] = _(
 )
 ERROR_COLOR: Final[str] = "red"
 DOWNLOAD: Final[str] = _("Download")
-CANCEL_DOWNLOAD: Final[str] = _("Cancel download")
+PAUSE: Final[str] = _("Pause")
+RESUME: Final[str] = _("Resume")
+CANCEL: Final[str] = _("Cancel")
+STATE_LABELS: Final[dict[str, str]] = {
+    JobState.queued: _("Queued"),
+    JobState.paused: _("Paused"),
+    JobState.done: _("Done"),
+    JobState.failed: _("Failed"),
+    JobState.cancelled: _("Cancelled"),
+}
+# Virtual events the event loop thread wakes the Tk thread with.
+JOB_UPDATE_EVENT: Final[str] = "<<JobUpdate>>"
+INFO_FETCHED_EVENT: Final[str] = "<<VideoInfoFetched>>"
+# Milliseconds between checks whether the queue stopped, on close.
+STOP_POLL_INTERVAL: Final[int] = 100
 
 
 class State(Enum):
-    cancel = auto()
     disable = auto()
     normal = auto()
 
 
+def _wake_tk(widget: tkinter.Misc, event: str) -> None:
+    """
+    Generate the event from the event loop thread. The window
+    may be closed meanwhile, then there is nobody to wake.
+    """
+    with suppress(tkinter.TclError, RuntimeError):
+        widget.event_generate(event, when="tail")
+
+
+class QueueRow(ctk.CTkFrame):
+    """
+    A download of the queue: title, quality, status,
+    progress bar, Pause/Resume and Cancel buttons.
+
+    Snapshots of the job, see `Job.to_dict`, come from the event loop
+    thread with `post`, the row shows the latest one in the Tk thread.
+    """
+
+    def __init__(
+        self,
+        master: Any,
+        title: str,
+        quality: tuple[int, int],
+        control: Callable[[Callable[[int], object], int], None],
+        manager: JobManager,
+    ) -> None:
+        """
+        Args:
+            control: Calls a `JobManager` method with the job ID
+                in the event loop thread.
+        """
+        super().__init__(master)
+        self._control = control
+        self._manager = manager
+        self._job: dict[str, Any] | None = None
+        self._snapshots: LatestValue[dict[str, Any]] = LatestValue()
+        self.grid_columnconfigure(0, weight=1)
+
+        self._title = ctk.CTkLabel(self, text=title, anchor="w")
+        self._title.grid(column=0, row=0, padx=10, sticky="ew")
+        self._quality = ctk.CTkLabel(self, text="{}x{}".format(*quality))
+        self._quality.grid(column=1, row=0, padx=10)
+        self._status = ctk.CTkLabel(self, text=STATE_LABELS[JobState.queued])
+        self._status.grid(column=2, row=0, padx=10)
+        self._pause_button = ctk.CTkButton(
+            self, text=PAUSE, width=80, command=self.toggle_pause
+        )
+        self._pause_button.grid(column=3, row=0, padx=5, pady=5)
+        self._cancel_button = ctk.CTkButton(
+            self, text=CANCEL, width=80, command=self.cancel
+        )
+        self._cancel_button.grid(column=4, row=0, padx=5, pady=5)
+        self._progress_bar = ctk.CTkProgressBar(self, height=8)
+        self._progress_bar.grid(
+            column=0, columnspan=5, row=1, padx=10, pady=(0, 5), sticky="ew"
+        )
+        self._progress_bar.set(0)
+        self.bind(JOB_UPDATE_EVENT, self._refresh)
+
+    def post(self, job: dict[str, Any]) -> None:
+        """
+        Runs in the event loop thread. Only the latest snapshot is kept,
+        the Tk thread is woken once until it takes it.
+        """
+        if self._snapshots.put(job):
+            _wake_tk(self, JOB_UPDATE_EVENT)
+
+    def toggle_pause(self) -> None:
+        if self._job is None:
+            return
+        if self._job["state"] == JobState.paused:
+            self._control(self._manager.resume, self._job["id"])
+        else:
+            self._control(self._manager.pause, self._job["id"])
+
+    def cancel(self) -> None:
+        if self._job is not None:
+            self._control(self._manager.cancel, self._job["id"])
+
+    def _refresh(self, *args) -> None:
+        """Show the latest snapshot. Runs in the Tk thread."""
+        job = self._snapshots.take()
+        if job is None:
+            return
+        self._job = job
+        if job.get("title"):
+            self._title.configure(text=job["title"])
+        if job["total_segments"]:
+            self._progress_bar.set(
+                job["completed_segments"] / job["total_segments"]
+            )
+        self._status.configure(text=self.__status(job))
+        finished = job["state"] in FINAL_STATES
+        self._pause_button.configure(
+            text=RESUME if job["state"] == JobState.paused else PAUSE,
+            state=tkinter.DISABLED if finished else tkinter.NORMAL,
+        )
+        self._cancel_button.configure(
+            state=tkinter.DISABLED if finished else tkinter.NORMAL
+        )
+
+    @staticmethod
+    def __status(job: dict[str, Any]) -> str:
+        """`42% 3.2 MiB/s ETA 0:42` while running, else the state."""
+        if job["state"] == JobState.running:
+            percent = (
+                job["completed_segments"] * 100 // job["total_segments"]
+                if job["total_segments"]
+                else 0
+            )
+            return "{}% {:.1f} MiB/s ETA {}".format(
+                percent, job["rate"] / MIB, format_eta(job["eta"])
+            )
+        if job["state"] == JobState.failed and job.get("error"):
+            return "{}: {}".format(STATE_LABELS[JobState.failed], job["error"])
+        return STATE_LABELS[job["state"]]
+
+
 class DownloaderUI(ctk.CTk):
     """
     UI for Rutube Downloader created with CustomTKinter.
+
+    Fetched videos are added to the download queue, see `QueueRow`.
+    The queue is a `JobManager` on the event loop thread: `jobs` videos
+    are downloaded at the same time, sharing `concurrency` segment
+    requests in flight and one session.
     """
 
     def __init__(
@@ -57,21 +199,38 @@ class DownloaderUI(ctk.CTk):
         downloader_class: type[DownloaderABC],
         loop: AbstractEventLoop = new_event_loop(),
         *args,
+        jobs: int = UI_JOBS,
+        concurrency: int = CHUNK_SIZE,
         **kwargs,
     ) -> None:
         super().__init__(*args, **kwargs)
-        self._downloader_type = downloader_class
         self._loop = loop
         self._session = create_aiohttp_session(self._loop)
-        self._refresh_ms = 25
-        self._queue: Queue = Queue()
+        # Videos are often fetched again, their info is cached.
+        self._metadata_cache = MetadataCache()
+        self._manager = JobManager(
+            self._session,
+            workers=jobs,
+            concurrency=concurrency,
+            downloader_class=downloader_class,
+            metadata_cache=self._metadata_cache,
+        )
+        self._loop.call_soon_threadsafe(self._manager.start)
+        self.__stop_future: Future | None = None
+        self.protocol("WM_DELETE_WINDOW", self.close)
+        # Fetches info of the video in the URL input,
+        # then downloads it in the queue.
         self._download: DownloaderABC | None = None
+        self.__download_directory: Path | None = None
+        self.__info_future: Future | None = None
+        # Labels of the dropdown and their qualities.
+        self._qualities: dict[str, tuple[int, int]] = {}
         self._upload_directory: Path | None = None
         self.__error_counter: str = ""
 
         # Configure window
         self.title(_("Rutube Downloader"))
-        self.geometry("750x250")
+        self.geometry("750x500")
         self.TEXT_WRAP_LENGTH = 450
         # Column "0" will be extended to full width.
         self.grid_columnconfigure(0, weight=1)
@@ -126,49 +285,40 @@ class DownloaderUI(ctk.CTk):
         )
         self._download_button.grid(column=1, row=3, padx=10, pady=10)
 
-        # Progress bar
-        self._progress_bar = ctk.CTkProgressBar(self)
-        self._progress_bar.grid(
-            column=0, columnspan=2, row=4, padx=10, pady=10, sticky="ew"
+        # Download queue
+        self._queue = ctk.CTkScrollableFrame(self, label_text=_("Downloads"))
+        self._queue.grid(
+            column=0, columnspan=2, row=4, padx=10, pady=10, sticky="nsew"
         )
-        self._progress_bar.set(0)
-        # Customtkinter progress bar have 0-1 range, so we need to divide it
-        self._progress_bar_divider = 100
-
-    def _update_bar(self, progress_bar_value: int) -> None:
-        """Update the progress bar.
-        Call only from main thread."""
-        if progress_bar_value == 100 and self._download:
-            messagebox.showinfo(
-                _("Download Complete"),
-                _("Download Complete"),
-            )
-            #  TODO: A "Download Complete" alert is shown
-            # a little bit before the last downloaded chunk is actually saved.
-            self._download = None
-            self._progress_bar.set(1)
-            self.change_download_button_state(State.normal)
-        else:
-            self._progress_bar.set(
-                progress_bar_value / self._progress_bar_divider
-            )
-            self.after(self._refresh_ms, self._poll_queue)
+        self._queue.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(4, weight=1)
+        self._rows: list[QueueRow] = []
+        self.bind(INFO_FETCHED_EVENT, self._on_video_info_fetched)
 
-    def _queue_update(
-        self, completed_requests: int, total_requests: int
-    ) -> None:
-        """Callback func passed to Downloader.
-        Used to put progress bar update in the queue."""
-        self._queue.put(int((completed_requests / total_requests) * 100))
-
-    def _poll_queue(self) -> None:
-        """Constantly check the queue for a progress bar update."""
-        if not self._queue.empty():
-            percent_complete = self._queue.get()
-            self._update_bar(percent_complete)
-        else:
-            if self._download:
-                self.after(self._refresh_ms, self._poll_queue)
+    def close(self) -> None:
+        """
+        Stop the queue in the event loop thread, running downloads
+        save their progress, then close the caches and the window.
+        """
+        if self.__stop_future:
+            return
+        self.withdraw()
+        self.__stop_future = asyncio.run_coroutine_threadsafe(
+            self.__stop(), self._loop
+        )
+        self.__destroy_when_stopped()
+
+    async def __stop(self) -> None:
+        await self._manager.stop()
+        await self._session.close()
+
+    def __destroy_when_stopped(self) -> None:
+        assert self.__stop_future
+        if not self.__stop_future.done():
+            self.after(STOP_POLL_INTERVAL, self.__destroy_when_stopped)
+            return
+        self._metadata_cache.close()
+        self.destroy()
 
     def fetch_video_info(self, *args) -> None:
         """
@@ -180,7 +330,7 @@ class DownloaderUI(ctk.CTk):
                 this object goes here.
         """
         self._fetch_result_label.configure(text="")
-        self.change_download_button_state(State.normal)
+        self.change_download_button_state(State.disable)
         if not self._url_entry.get():
             messagebox.showerror(
                 _("Error"),
@@ -199,23 +349,24 @@ class DownloaderUI(ctk.CTk):
         """
         1. Creates a Downloader object in the main thread.
         2. Executes its `fetch_video_info` method in a separate thread,
-        where an event loop is running.
+        where an event loop is running. Variant playlists of all qualities
+        are fetched at the same time, so the dropdown shows their sizes.
         """
         try:
             if not self._upload_directory:
                 raise UploadDirectoryNotSelectedError
-            self._download = self._downloader_type(
-                self._url_entry.get(),
-                self._loop,
-                self._queue_update,
-                self._upload_directory,
-                self._session,
-                auto_close_session=False,
+            self._download = self._manager.create_downloader(
+                self._url_entry.get(), self._upload_directory, self._loop
+            )
+            self.__download_directory = self._upload_directory
+            self.__info_future = asyncio.run_coroutine_threadsafe(
+                self._download.fetch_video_info(prefetch=True), self._loop
             )
-            download_future = asyncio.run_coroutine_threadsafe(
-                self._download.fetch_video_info(), self._loop
+            self._video_info_button.configure(state=tkinter.DISABLED)
+            # Done callbacks run in the event loop thread.
+            self.__info_future.add_done_callback(
+                lambda future: _wake_tk(self, INFO_FETCHED_EVENT)
             )
-            download_future.add_done_callback(self._on_video_info_fetched)
         except (InvalidURLError, M3U8URLNotFoundError):
             self._fetch_result_label.configure(
                 text=INVALID_URL_MSG + self.__error_counter,
@@ -223,10 +374,17 @@ class DownloaderUI(ctk.CTk):
             )
             self.__increase_error_counter()
 
-    def _on_video_info_fetched(self, download_future: Future) -> None:
+    def _on_video_info_fetched(self, *args) -> None:
+        """Show the fetched info or the error. Runs in the Tk thread."""
+        download_future = self.__info_future
+        if download_future is None or not download_future.done():
+            return
+        self.__info_future = None
+        self._video_info_button.configure(state=tkinter.NORMAL)
         try:
             self._download_available_qualities = download_future.result()
             self._update_ui_with_video_info()
+            self.change_download_button_state(State.normal)
         except (APIResponseError, MasterPlaylistInitializationError):
             self._fetch_result_label.configure(
                 text=API_RESPONSE_ERROR_MSG + self.__error_counter,
@@ -245,10 +403,27 @@ class DownloaderUI(ctk.CTk):
         self.__fill_title()
 
     def __fill_qualities(self) -> None:
-        fields = [f"{x}x{y}" for x, y in self._download_available_qualities]
+        assert self._download
+        self._qualities = {
+            self.__quality_label(quality): quality
+            for quality in self._download_available_qualities
+        }
+        fields = list(self._qualities)
         self._dropdown.configure(values=fields, state=tkinter.NORMAL)
         self._dropdown.set(fields[-1])
 
+    def __quality_label(self, quality: tuple[int, int]) -> str:
+        """`1920x1080 (~512 MiB, 12:34)`, the size is estimated."""
+        assert self._download
+        label = "{}x{}".format(*quality)
+        variant = self._download.variants.get(quality)
+        if variant is None:
+            return label
+        duration = format_eta(variant.duration)
+        if variant.size is None:
+            return f"{label} ({duration})"
+        return f"{label} (~{variant.size / MIB:.0f} MiB, {duration})"
+
     def __fill_title(self) -> None:
         if self._download:
             self._video_title_dynamic.configure(
@@ -256,22 +431,72 @@ class DownloaderUI(ctk.CTk):
             )
 
     def start_download(self) -> None:
-        """Download the video from the given URL."""
-        if self._download:
-            self.__set_quality()
-            asyncio.run_coroutine_threadsafe(
-                self._download.download_video(), self._loop
+        """Add the fetched video to the download queue."""
+        if self._download is None or self._upload_directory is None:
+            return
+        quality = self.__get_selected_quality()
+        row = QueueRow(
+            self._queue,
+            self._download.video_title or self._url_entry.get(),
+            quality,
+            self._control_job,
+            self._manager,
+        )
+        row.grid(column=0, row=len(self._rows), pady=2, sticky="ew")
+        self._rows.append(row)
+        asyncio.run_coroutine_threadsafe(
+            self._follow_job(
+                row,
+                str(self._download.url),
+                quality,
+                self._upload_directory,
+                # The video info is not fetched again, unless
+                # another folder was selected since.
+                (self._download, self._download_available_qualities)
+                if self.__download_directory == self._upload_directory
+                else None,
+            ),
+            self._loop,
+        )
+        self._download = None
+        self._url_entry.delete(0, tkinter.END)
+        self.change_download_button_state(State.disable)
+        self.clean_ui()
+
+    async def _follow_job(
+        self,
+        row: QueueRow,
+        url: str,
+        quality: tuple[int, int],
+        upload_directory: Path,
+        prefetched: tuple[DownloaderABC, Qualities] | None,
+    ) -> None:
+        """Submit the job and pass its snapshots to the row."""
+        try:
+            job = self._manager.submit(
+                url, quality, upload_directory, prefetched
             )
-            self.change_download_button_state(State.cancel)
-            self.after(self._refresh_ms, self._poll_queue)
+        except JobServerError as e:
+            row.post(
+                {
+                    "state": JobState.failed,
+                    "error": str(e),
+                    "completed_segments": 0,
+                    "total_segments": 0,
+                }
+            )
+            return
+        async for event in job.events():
+            row.post(event["job"])
+
+    def _control_job(
+        self, method: Callable[[int], object], job_id: int
+    ) -> None:
+        """Pause, resume or cancel the job in the event loop thread."""
+        self._loop.call_soon_threadsafe(method, job_id)
 
     def change_download_button_state(self, state: State) -> None:
         states = {
-            State.cancel: {
-                "text": CANCEL_DOWNLOAD,
-                "command": self.cancel_download,
-                "state": tkinter.NORMAL,
-            },
             State.disable: {
                 "text": DOWNLOAD,
                 "command": None,
@@ -285,33 +510,17 @@ class DownloaderUI(ctk.CTk):
         }
         self._download_button.configure(**states[state])
 
-    def cancel_download(self) -> None:
-        assert self._download
-        self._download.interrupt_download()
-        messagebox.showinfo(_("Info"), DOWNLOAD_CANCELED)
-        self.change_download_button_state(State.disable)
-        self.clean_ui()
-
     def clean_ui(self) -> None:
-        """Clean up: title, qualities,progress,bar"""
+        """Clean up: title, qualities"""
         self._video_title_dynamic.configure(text="")
-        self._progress_bar.set(0)
+        self._qualities = {}
         self._dropdown.configure(values=[], state=tkinter.DISABLED)
         self._dropdown.set("")
 
-    def __set_quality(self) -> None:
-        """
-        Set the quality of the video to download.
-        """
-        if self._download is None:
-            raise DownloaderIsNotInitializerError
-        selected_quality = self.__get_selected_quality()
-        quality_future = asyncio.run_coroutine_threadsafe(
-            self._download.select_quality(selected_quality), self._loop
-        )
-        quality_future.result()
-
     def __get_selected_quality(self) -> tuple[int, int]:
+        if quality := self._qualities.get(self._dropdown.get()):
+            return quality
+        # Typed in by hand.
         quality = tuple(map(int, self._dropdown.get().split("x")))
         if len(quality) == 2:
             return quality
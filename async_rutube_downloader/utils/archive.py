@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.sqlite import SQLiteDatabase
+
+logger = get_logger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    video_id TEXT NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    downloaded_at REAL NOT NULL,
+    PRIMARY KEY (video_id, width, height)
+) WITHOUT ROWID;
+"""
+
+
+@dataclass(frozen=True)
+class ArchiveEntry:
+    video_id: str
+    quality: tuple[int, int]
+    path: Path
+    # Bytes of the video file.
+    size: int
+    # SHA-256 of the video file, hex.
+    sha256: str
+
+
+async def file_checksum(path: Path) -> str:
+    """SHA-256 of the file, read in a thread."""
+
+    def digest() -> str:
+        with path.open("rb") as file:
+            return hashlib.file_digest(file, "sha256").hexdigest()
+
+    return await asyncio.to_thread(digest)
+
+
+class DownloadArchive:
+    """
+    Record of downloaded videos, so they are not downloaded again.
+
+    Entries live in SQLite, indexed by video ID and quality,
+    so a lookup stays fast with hundreds of thousands of them.
+    By default an entry is trusted, with `verify` the file must still
+    exist with the recorded size and checksum, else the entry is removed.
+
+    Usage:
+        archive = DownloadArchive(Path("archive.sqlite3"))
+        if entry := await archive.find(video_id):
+            return entry.path
+        ...  # download the video
+        await archive.add(video_id, quality, file)
+    """
+
+    def __init__(self, path: Path, verify: bool = False) -> None:
+        """
+        Args:
+            path: SQLite database, created if missing.
+            verify: Check the file of an entry before trusting it.
+        """
+        self._database = SQLiteDatabase(path, SCHEMA)
+        self.verify = verify
+
+    async def find(
+        self, video_id: str, quality: tuple[int, int] | None = None
+    ) -> ArchiveEntry | None:
+        """
+        The download of the video, the latest one if the quality
+        is not given, `None` if it was not downloaded.
+        A broken archive is a miss, it never fails the download.
+        """
+        try:
+            entry = await self._database.run(self._find, video_id, quality)
+            if entry and self.verify and not await self.__is_intact(entry):
+                logger.info("Archived %s does not match, removing it", entry)
+                await self._database.run(self._remove, entry)
+                return None
+        except (sqlite3.Error, OSError):
+            logger.info("Download archive is unavailable", exc_info=True)
+            return None
+        return entry
+
+    async def add(
+        self, video_id: str, quality: tuple[int, int], path: Path
+    ) -> ArchiveEntry | None:
+        """
+        Record the downloaded file, its checksum is calculated.
+        `None` if it could not be recorded, the error is logged.
+        """
+        try:
+            path = path.resolve()
+            entry = ArchiveEntry(
+                video_id,
+                quality,
+                path,
+                path.stat().st_size,
+                await file_checksum(path),
+            )
+            await self._database.run(self._add, entry)
+        except (sqlite3.Error, OSError):
+            logger.info("Download archive is unavailable", exc_info=True)
+            return None
+        return entry
+
+    def close(self) -> None:
+        self._database.close()
+
+    def _find(
+        self,
+        connection: sqlite3.Connection,
+        video_id: str,
+        quality: tuple[int, int] | None,
+    ) -> ArchiveEntry | None:
+        if quality:
+            row = connection.execute(
+                "SELECT video_id, width, height, path, size, sha256"
+                " FROM downloads WHERE video_id = ? AND width = ?"
+                " AND height = ?",
+                (video_id, *quality),
+            ).fetchone()
+        else:
+            row = connection.execute(
+                "SELECT video_id, width, height, path, size, sha256"
+                " FROM downloads WHERE video_id = ?"
+                " ORDER BY downloaded_at DESC LIMIT 1",
+                (video_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        video_id, width, height, path, size, sha256 = row
+        return ArchiveEntry(
+            video_id, (width, height), Path(path), size, sha256
+        )
+
+    def _add(
+        self, connection: sqlite3.Connection, entry: ArchiveEntry
+    ) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO downloads VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry.video_id,
+                *entry.quality,
+                str(entry.path),
+                entry.size,
+                entry.sha256,
+                time.time(),
+            ),
+        )
+
+    def _remove(
+        self, connection: sqlite3.Connection, entry: ArchiveEntry
+    ) -> None:
+        connection.execute(
+            "DELETE FROM downloads WHERE video_id = ? AND width = ?"
+            " AND height = ?",
+            (entry.video_id, *entry.quality),
+        )
+
+    async def __is_intact(self, entry: ArchiveEntry) -> bool:
+        try:
+            if entry.path.stat().st_size != entry.size:
+                return False
+            return await file_checksum(entry.path) == entry.sha256
+        except OSError:
+            return False
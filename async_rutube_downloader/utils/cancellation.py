@@ -0,0 +1,24 @@
+from dataclasses import dataclass
+from enum import StrEnum
+
+
+class CancelPolicy(StrEnum):
+    # The `.part` file and its journal stay, the download can be resumed.
+    keep = "keep"
+    # The `.part` file and its journal are removed.
+    discard = "discard"
+
+
+@dataclass(frozen=True)
+class CancelReport:
+    """What happened to a download when it was cancelled."""
+
+    policy: CancelPolicy
+    # Segment requests that were aborted in flight.
+    aborted_requests: int
+    # Bytes of the aborted segments, they are thrown away.
+    discarded_bytes: int
+    # Bytes of complete segments left in the `.part` file.
+    kept_bytes: int
+    # Estimated bytes of the video that were not downloaded.
+    saved_bytes: int
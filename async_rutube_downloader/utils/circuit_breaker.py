@@ -0,0 +1,202 @@
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from enum import StrEnum
+from http import HTTPStatus
+from urllib.parse import urlsplit
+from weakref import WeakKeyDictionary
+
+from aiohttp import (
+    ClientConnectionError,
+    ClientPayloadError,
+    ClientResponseError,
+    ClientSession,
+)
+
+from async_rutube_downloader.settings import (
+    CIRCUIT_COOLDOWN,
+    CIRCUIT_FAILURE_RATE,
+    CIRCUIT_HALF_OPEN_PROBES,
+    CIRCUIT_MIN_CALLS,
+    CIRCUIT_WINDOW,
+)
+from async_rutube_downloader.utils.exceptions import CircuitOpenError
+from async_rutube_downloader.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class CircuitState(StrEnum):
+    # Requests go through, results are counted.
+    closed = "closed"
+    # Requests fail at once, until the cooldown is over.
+    open = "open"
+    # A few probe requests go through, they decide the next state.
+    half_open = "half_open"
+
+
+def is_host_failure(error: BaseException) -> bool:
+    """
+    Connection errors, timeouts, broken bodies and 5xx responses
+    mean the host is unhealthy, other errors don't.
+    """
+    if isinstance(error, ClientResponseError):
+        return error.status >= HTTPStatus.INTERNAL_SERVER_ERROR
+    return isinstance(
+        error, ClientConnectionError | ClientPayloadError | TimeoutError
+    ) and not isinstance(error, CircuitOpenError)
+
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a host that keeps failing.
+
+    Closed: results of the last `window` requests are kept, when at
+    least `min_calls` of them are known and `failure_rate` of them
+    failed, the circuit opens. Open: requests fail at once with
+    `CircuitOpenError` for `cooldown` seconds. Half-open: up to
+    `half_open_probes` requests go through, a success closes the
+    circuit, a failure opens it again.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        window: int = CIRCUIT_WINDOW,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        cooldown: float = CIRCUIT_COOLDOWN,
+        half_open_probes: int = CIRCUIT_HALF_OPEN_PROBES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.host = host
+        self._failure_rate = failure_rate
+        self._min_calls = min_calls
+        self._cooldown = cooldown
+        self._half_open_probes = half_open_probes
+        self._clock = clock
+        # True for every failed request.
+        self._results: deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+        self.state = CircuitState.closed
+
+    def is_available(self) -> bool:
+        """Whether a request would be let through, changes nothing."""
+        if self.state is CircuitState.closed:
+            return True
+        if (
+            self.state is CircuitState.open
+            and self._clock() < self._opened_at + self._cooldown
+        ):
+            return False
+        return self._probes < self._half_open_probes
+
+    def acquire(self) -> None:
+        """Let a request through, or raise `CircuitOpenError`."""
+        if not self.is_available():
+            raise CircuitOpenError(self.host)
+        if self.state is CircuitState.open:
+            logger.info("Circuit of %s is half-open", self.host)
+            self.state = CircuitState.half_open
+        if self.state is CircuitState.half_open:
+            self._probes += 1
+
+    def record_success(self) -> None:
+        self.__release()
+        if self.state is CircuitState.half_open:
+            logger.info("Circuit of %s is closed", self.host)
+            self.state = CircuitState.closed
+            self._results.clear()
+        self._results.append(False)
+
+    def record_failure(self) -> None:
+        self.__release()
+        if self.state is CircuitState.half_open:
+            self.__open()
+            return
+        self._results.append(True)
+        if (
+            self.state is CircuitState.closed
+            and len(self._results) >= self._min_calls
+            and sum(self._results) / len(self._results) >= self._failure_rate
+        ):
+            self.__open()
+
+    def record_cancelled(self) -> None:
+        """The request was cancelled, its result is unknown."""
+        self.__release()
+
+    def __release(self) -> None:
+        if self.state is CircuitState.half_open:
+            self._probes = max(self._probes - 1, 0)
+
+    def __open(self) -> None:
+        logger.info(
+            "Circuit of %s is open for %s seconds", self.host, self._cooldown
+        )
+        self.state = CircuitState.open
+        self._opened_at = self._clock()
+        self._probes = 0
+
+
+class CircuitBreakers:
+    """
+    Circuit breakers by host, see `CircuitBreaker`.
+
+    Usage:
+        breakers = breakers_for(session)
+        async with breakers.guard(url):
+            async with session.get(url) as response:
+                ...
+    """
+
+    def __init__(self, **breaker_options) -> None:
+        """
+        Args:
+            breaker_options: Passed to every `CircuitBreaker`.
+        """
+        self._breaker_options = breaker_options
+        self._breakers: dict[str, CircuitBreaker] = {}
+
+    def for_host(self, host: str) -> CircuitBreaker:
+        if host not in self._breakers:
+            self._breakers[host] = CircuitBreaker(
+                host, **self._breaker_options
+            )
+        return self._breakers[host]
+
+    def for_url(self, url: str) -> CircuitBreaker:
+        return self.for_host(urlsplit(url).netloc)
+
+    @asynccontextmanager
+    async def guard(self, url: str) -> AsyncIterator[CircuitBreaker]:
+        """Fail at once if the host circuit is open, else count
+        the result of the request made inside."""
+        breaker = self.for_url(url)
+        breaker.acquire()
+        try:
+            yield breaker
+        except BaseException as e:
+            if is_host_failure(e):
+                breaker.record_failure()
+            elif isinstance(e, Exception):
+                breaker.record_success()
+            else:
+                breaker.record_cancelled()
+            raise
+        breaker.record_success()
+
+
+# Every download on a session shares its breakers,
+# so a dead host found by one of them is skipped by the others.
+_session_breakers: WeakKeyDictionary[ClientSession, CircuitBreakers] = (
+    WeakKeyDictionary()
+)
+
+
+def breakers_for(session: ClientSession) -> CircuitBreakers:
+    if session not in _session_breakers:
+        _session_breakers[session] = CircuitBreakers()
+    return _session_breakers[session]
@@ -0,0 +1,229 @@
+import asyncio
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+
+from async_rutube_downloader.settings import (
+    ADAPTIVE_CONCURRENCY_INTERVAL,
+    LATENCY_TOLERANCE,
+    MAX_CONCURRENCY,
+)
+from async_rutube_downloader.utils.exceptions import ConcurrencyLimitError
+from async_rutube_downloader.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ConcurrencyLimit:
+    """Fixed number of segment requests in flight."""
+
+    def __init__(self, limit: int) -> None:
+        if limit < 1:
+            raise ConcurrencyLimitError
+        self.limit = limit
+
+    def record_success(self, size: int, latency: float) -> None:
+        """
+        Args:
+            size: Bytes of the downloaded segment.
+            latency: Seconds until the response headers arrived.
+        """
+
+    def record_error(self) -> None: ...
+
+
+class AdaptiveConcurrency(ConcurrencyLimit):
+    """
+    Changes the number of segment requests in flight
+    from the observed goodput and latency (AIMD).
+
+    Samples are collected in intervals, at the end of each one:
+    - if the average latency grew above `LATENCY_TOLERANCE` times
+      the lowest seen, the limit is halved, the server or link is
+      queueing the requests;
+    - else if goodput did not drop, the limit grows by one.
+    Errors halve the limit, at most once per interval.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = MAX_CONCURRENCY,
+        interval: float = ADAPTIVE_CONCURRENCY_INTERVAL,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Args:
+            initial: The limit to start with.
+            minimum: The limit never goes lower.
+            maximum: The limit never goes higher.
+            interval: Seconds between limit changes.
+            clock: Source of time, in seconds.
+        """
+        if not 1 <= minimum <= maximum:
+            raise ConcurrencyLimitError
+        super().__init__(min(max(initial, minimum), maximum))
+        self._minimum = minimum
+        self._maximum = maximum
+        self._interval = interval
+        self._clock = clock
+        self._interval_start = clock()
+        self._last_decrease = float("-inf")
+        self._bytes = 0
+        self._latencies: list[float] = []
+        self._previous_goodput = 0.0
+        self._lowest_latency = float("inf")
+
+    def record_success(self, size: int, latency: float) -> None:
+        self._bytes += size
+        self._latencies.append(latency)
+        self._lowest_latency = min(self._lowest_latency, latency)
+        now = self._clock()
+        elapsed = now - self._interval_start
+        if elapsed < self._interval:
+            return
+        goodput = self._bytes / elapsed
+        average_latency = sum(self._latencies) / len(self._latencies)
+        if average_latency > self._lowest_latency * LATENCY_TOLERANCE:
+            self.__decrease(now, "latency is rising")
+        elif goodput >= self._previous_goodput:
+            self.limit = min(self.limit + 1, self._maximum)
+        self._previous_goodput = goodput
+        self._interval_start = now
+        self._bytes = 0
+        self._latencies.clear()
+
+    def record_error(self) -> None:
+        self.__decrease(self._clock(), "request failed")
+
+    def __decrease(self, now: float, reason: str) -> None:
+        if now - self._last_decrease < self._interval:
+            return
+        self._last_decrease = now
+        self.limit = max(self.limit // 2, self._minimum)
+        logger.info("Concurrency is decreased to %s, %s", self.limit, reason)
+
+
+class SegmentBudget:
+    """
+    Segment requests in flight of all downloads running at the same time.
+
+    Every request holds one of `limit` slots, so the total never goes
+    above it, however many downloads run. Every download's window
+    is its even share of the slots, so one download can't take them all.
+    A slot is held only while a request is in flight. A request waiting
+    for space in the reorder buffer gives its slot up with `released`,
+    so a head-of-line segment waiting for a slot can't be blocked
+    by the segments waiting for it, of any download.
+
+    Usage:
+        budget = SegmentBudget(20)
+        with budget.join():
+            window = min(concurrency.limit, budget.share())
+            async with budget.request() as slot:
+                ...  # request a segment
+                async with slot.released():
+                    ...  # wait for something else than the network
+    """
+
+    def __init__(self, limit: int) -> None:
+        if limit < 1:
+            raise ConcurrencyLimitError
+        self.limit = limit
+        self.in_flight = 0
+        self._downloads = 0
+        self._slots = asyncio.Semaphore(limit)
+
+    @contextmanager
+    def join(self) -> Iterator[None]:
+        """Take a share for the duration of a download."""
+        self._downloads += 1
+        try:
+            yield
+        finally:
+            self._downloads -= 1
+
+    def share(self) -> int:
+        return max(self.limit // max(self._downloads, 1), 1)
+
+    @asynccontextmanager
+    async def request(self) -> AsyncIterator["BudgetSlot"]:
+        """Hold a slot while the block runs, wait if there is none."""
+        slot = BudgetSlot(self)
+        await slot.acquire()
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    async def _acquire(self) -> None:
+        await self._slots.acquire()
+        self.in_flight += 1
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+
+
+class BudgetSlot:
+    """A slot of `SegmentBudget`, taken by `SegmentBudget.request`."""
+
+    def __init__(self, budget: SegmentBudget) -> None:
+        self._budget = budget
+        self.held = False
+
+    async def acquire(self) -> None:
+        await self._budget._acquire()
+        self.held = True
+
+    def release(self) -> None:
+        if self.held:
+            self.held = False
+            self._budget._release()
+
+    @asynccontextmanager
+    async def released(self) -> AsyncIterator[None]:
+        """Give the slot up while the block runs, take it back after."""
+        self.release()
+        try:
+            yield
+        finally:
+            await self.acquire()
+
+
+class LatestValue[T]:
+    """
+    Hands values from one thread to another, only the latest one is kept.
+
+    `put` returns `True` only for the first value since the last `take`,
+    so the consumer is woken once however many values arrive meanwhile.
+
+    Usage:
+        # producer thread
+        if latest.put(value):
+            wake_up_consumer()
+        # consumer thread, when woken
+        value = latest.take()
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._value: T | None = None
+        self._pending = False
+
+    def put(self, value: T) -> bool:
+        """Returns: Whether the consumer has to be woken."""
+        with self._lock:
+            self._value = value
+            wake = not self._pending
+            self._pending = True
+            return wake
+
+    def take(self) -> T | None:
+        """The latest value, `None` if there was none since the last call."""
+        with self._lock:
+            value, self._value = self._value, None
+            self._pending = False
+            return value
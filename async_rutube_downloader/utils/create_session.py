@@ -1,21 +1,128 @@
 import ssl
 from asyncio import AbstractEventLoop
+from dataclasses import dataclass
+from functools import cache
+from typing import Self
 
 import certifi
-from aiohttp import ClientSession, ClientTimeout, TCPConnector
+from aiohttp import (
+    AsyncResolver,
+    ClientSession,
+    ClientTimeout,
+    TCPConnector,
+)
+from aiohttp.abc import AbstractResolver
 
+from async_rutube_downloader.settings import (
+    CHUNK_SIZE,
+    DNS_CACHE_TTL,
+    KEEPALIVE_TIMEOUT,
+    RANGE_PARTS,
+)
+from async_rutube_downloader.utils.logger import get_logger
 from async_rutube_downloader.utils.miscellaneous import get_or_create_loop
+from async_rutube_downloader.utils.tracing import PhaseTracer, install_tracer
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class ConnectionProfile:
+    """Tuning of the connection pool of a session."""
+
+    # Connections to all hosts, 0 means unlimited.
+    limit: int = 2 * CHUNK_SIZE
+    # Connections to one host, 0 means unlimited.
+    limit_per_host: int = CHUNK_SIZE
+    # Seconds resolved addresses are cached, `None` means forever.
+    dns_cache_ttl: int | None = DNS_CACHE_TTL
+    # Seconds an idle connection is kept open for the next request.
+    keepalive_timeout: float = KEEPALIVE_TIMEOUT
+    # Resolve with `aiodns` instead of a thread, if it's installed.
+    async_resolver: bool = False
+    # Record timings of request phases, see `get_tracer`.
+    trace_phases: bool = False
+
+    @classmethod
+    def for_concurrency(
+        cls, concurrency: int, split_segments: bool = False, **options
+    ) -> Self:
+        """
+        Every segment request in flight gets its own connection,
+        segments are spread over the two CDN mirrors Rutube lists.
+
+        Args:
+            concurrency: The most segments downloaded at the same time.
+            split_segments: Every segment may take `RANGE_PARTS`
+                connections. A segment holds its first connection while
+                waiting for the others, with a tighter limit
+                the downloads would wait for each other forever.
+            options: Other fields of the profile.
+        """
+        per_host = concurrency * (RANGE_PARTS if split_segments else 1)
+        return cls(limit=2 * per_host, limit_per_host=per_host, **options)
+
+
+@dataclass(frozen=True)
+class PoolStats:
+    # Connections open: acquired and idle.
+    open: int
+    # Open connections waiting in the pool for a request.
+    idle: int
+    # Connections used by requests.
+    acquired: int
+    # Requests waiting for a connection, the pool is at its limit.
+    waiting: int
+
+
+class PoolConnector(TCPConnector):
+    """`TCPConnector` that reports statistics of its pool."""
+
+    def stats(self) -> PoolStats:
+        idle = sum(len(connections) for connections in self._conns.values())
+        acquired = len(self._acquired)
+        return PoolStats(
+            open=idle + acquired,
+            idle=idle,
+            acquired=acquired,
+            waiting=sum(len(waiters) for waiters in self._waiters.values()),
+        )
+
+
+@cache
+def get_ssl_context() -> ssl.SSLContext:
+    """
+    Fixes [SSL: CERTIFICATE_VERIFY_FAILED] in PyInstaller builds,
+    especially on GitHub Actions, where system CA certs may be missing.
+    certifi provides a portable CA bundle for reliable HTTPS.
+
+    Loading the bundle is slow, so one context is shared by all sessions,
+    it also lets them resume TLS sessions.
+    """
+    return ssl.create_default_context(cafile=certifi.where())
+
+
+def get_pool_stats(session: ClientSession) -> PoolStats | None:
+    """`None` if the session was not made by `create_aiohttp_session`."""
+    if isinstance(session.connector, PoolConnector):
+        return session.connector.stats()
+    return None
 
 
 def create_aiohttp_session(
     loop: AbstractEventLoop | None = None,
+    profile: ConnectionProfile | None = None,
 ) -> ClientSession:
     """
     Creating an aiohttp session with preset timeouts.
     If the event loop is not passed, a new one will be created.
+    The connection pool is tuned by the profile,
+    see `ConnectionProfile.for_concurrency`.
     """
     if not loop:
         loop = get_or_create_loop()
+    if not profile:
+        profile = ConnectionProfile()
     session_timeout = ClientTimeout(
         total=None,
         # The video may be really long,
@@ -26,15 +133,36 @@ def create_aiohttp_session(
         # Chunks are small in size,
         # so 3 minutes should be enough to download one chunk.
     )
-
-    # Fixes [SSL: CERTIFICATE_VERIFY_FAILED] in PyInstaller builds,
-    # especially on GitHub Actions, where system CA certs may be missing.
-    # certifi provides a portable CA bundle for reliable HTTPS.
-    ssl_context = ssl.create_default_context(cafile=certifi.where())
-    connector = TCPConnector(ssl=ssl_context, loop=loop)
-    return ClientSession(
+    connector = PoolConnector(
+        ssl=get_ssl_context(),
+        loop=loop,
+        limit=profile.limit,
+        limit_per_host=profile.limit_per_host,
+        ttl_dns_cache=profile.dns_cache_ttl,
+        use_dns_cache=True,
+        keepalive_timeout=profile.keepalive_timeout,
+        resolver=_create_resolver(profile, loop),
+    )
+    tracer = PhaseTracer() if profile.trace_phases else None
+    session = ClientSession(
         loop=loop,
         timeout=session_timeout,
         connector=connector,
         raise_for_status=True,
+        trace_configs=[tracer.trace_config()] if tracer else None,
     )
+    if tracer:
+        install_tracer(tracer, session)
+    return session
+
+
+def _create_resolver(
+    profile: ConnectionProfile, loop: AbstractEventLoop
+) -> AbstractResolver | None:
+    """`None` is the default resolver, it resolves in a thread."""
+    if profile.async_resolver:
+        try:
+            return AsyncResolver(loop=loop)
+        except RuntimeError:
+            logger.info("aiodns is not installed, resolving in a thread")
+    return None
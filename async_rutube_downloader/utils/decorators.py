@@ -6,7 +6,9 @@ from typing import Any, TypeVar, cast
 
 from aiohttp import ClientError
 
+from async_rutube_downloader.utils import metrics
 from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.retry import RetryPolicy
 
 logger = get_logger(__name__)
 
@@ -25,6 +27,11 @@ def retry(
     if it raises an exception.
     If there are no more retries, raise the specified exception .
 
+    Delays and which errors are retried are decided by a `RetryPolicy`:
+    the `retry_policy` attribute of the decorated method's object,
+    so all requests of a download share one, or a policy
+    made from the arguments without a retry budget.
+
     Args:
         exception_text (str):
             The text of the exception that will be raised
@@ -35,29 +42,46 @@ def retry(
         max_retries (int, optional):
             The maximum number of attempts. Defaults to 3.
         retry_delay (float, optional):
-            The delay between attempts in seconds. Defaults to 0.5.
-            The actual delay increases with each attempt as
-            (retry_delay * iteration).
+            The delay limit of the first retry in seconds. Defaults to 0.5.
+            The limit doubles with each attempt, the actual delay
+            is random up to the limit.
         retry_on_exception (type[Exception], optional):
             The exception class that will trigger a retry.
             Defaults to ClientError.
     """
 
+    default_policy = RetryPolicy(max_retries, retry_delay, budget_minimum=None)
+
     def decorator(func: AsyncFunc) -> AsyncFunc:
         @wraps(func)
         async def wrapper(*args, **kwargs) -> Any:
-            for iteration in range(1, max_retries + 1):
+            policy = getattr(args[0], "retry_policy", None) if args else None
+            if not isinstance(policy, RetryPolicy):
+                policy = default_policy
+            attempt = 0
+            while True:
+                attempt += 1
                 try:
-                    return await func(*args, **kwargs)
+                    result = await func(*args, **kwargs)
                 except retry_on_exception as e:
+                    delay = policy.next_delay(e, attempt, func.__name__)
+                    if delay is None:
+                        error = e
+                        break
+                    metrics.retries.inc(
+                        operation=func.__name__, cause=metrics.retry_cause(e)
+                    )
                     logger.info(
-                        "Connection error: %s - Retrying in %s seconds...",
+                        "Connection error: %s - Retrying in %.2f seconds...",
                         e,
-                        retry_delay * iteration,
+                        delay,
                     )
-                    await asyncio.sleep(retry_delay * iteration)
-            logger.info("Failed to connect after %s attempts.", max_retries)
-            raise exception_to_raise(exception_text)
+                    await asyncio.sleep(delay)
+                else:
+                    policy.record_success()
+                    return result
+            logger.info("Failed to connect after %s attempts.", attempt)
+            raise exception_to_raise(exception_text) from error
 
         return cast(AsyncFunc, wrapper)
 
@@ -1,11 +1,56 @@
 from argparse import ArgumentTypeError
 
+from aiohttp import ClientConnectionError, ClientPayloadError
+
+from async_rutube_downloader.settings import (
+    MAX_CONCURRENCY,
+    MAX_JOBS,
+    MAX_PORT,
+)
+
 
 class OutputDirectoryError(ArgumentTypeError):
     def __init__(self, output: str) -> None:
         super().__init__(f"Directory '{output}' does not exist.")
 
 
+class CLIConcurrencyError(ArgumentTypeError):
+    def __init__(self, concurrency: str) -> None:
+        super().__init__(
+            f"Concurrency must be an integer from 1 to {MAX_CONCURRENCY},"
+            f" got '{concurrency}'."
+        )
+
+
+class CLIJobsError(ArgumentTypeError):
+    def __init__(self, jobs: str) -> None:
+        super().__init__(
+            f"Jobs must be an integer from 1 to {MAX_JOBS}, got '{jobs}'."
+        )
+
+
+class CLIPortError(ArgumentTypeError):
+    def __init__(self, port: str) -> None:
+        super().__init__(
+            f"Port must be an integer from 1 to {MAX_PORT}, got '{port}'."
+        )
+
+
+class CLIRateError(ArgumentTypeError):
+    def __init__(self, rate: str) -> None:
+        super().__init__(
+            f"Invalid rate '{rate}', expected bytes per second"
+            " like 500K, 2M or 1.5G."
+        )
+
+
+class CLISizeError(ArgumentTypeError):
+    def __init__(self, size: str) -> None:
+        super().__init__(
+            f"Invalid size '{size}', expected bytes like 500M or 2G."
+        )
+
+
 class RuTubeDownloaderError(Exception):
     """Base class for all errors raised by the downloader."""
 
@@ -32,6 +77,33 @@ class InvalidPlaylistError(RuTubeDownloaderError):
 class SegmentDownloadError(RuTubeDownloaderError): ...
 
 
+class SegmentSizeError(SegmentDownloadError, ClientPayloadError):
+    """The body differs from the size the server reported before,
+    retried like a broken response."""
+
+    def __init__(self, index: int) -> None:
+        super().__init__(f"Segment {index} does not match its Content-Length")
+
+
+class UnknownSegmentSizesError(SegmentDownloadError):
+    def __init__(self) -> None:
+        super().__init__(
+            "Segment sizes are unknown, the partial file written out"
+            " of order is kept to resume later"
+        )
+
+
+class RangeNotSupportedError(SegmentDownloadError):
+    """The server ignored a `Range` request header."""
+
+
+class CircuitOpenError(ClientConnectionError):
+    """Requests to the host fail at once, it keeps failing."""
+
+    def __init__(self, host: str) -> None:
+        super().__init__(f"Circuit of {host} is open")
+
+
 class MasterPlaylistInitializationError(RuTubeDownloaderError):
     def __init__(self) -> None:
         super().__init__(
@@ -44,11 +116,25 @@ class QualityError(RuTubeDownloaderError):
         super().__init__("Quality must be a tuple of two integers")
 
 
+class ConcurrencyLimitError(RuTubeDownloaderError, ValueError):
+    def __init__(self) -> None:
+        super().__init__("Concurrency limit must be a positive integer")
+
+
 class M3U8URLNotFoundError(KeyError):
     def __init__(self) -> None:
         super().__init__("M3U8 playlist URL not found in API response.")
 
 
+class JobServerError(RuTubeDownloaderError):
+    """The job server rejected a request, the message is its reason."""
+
+
+class InvalidJobError(JobServerError):
+    def __init__(self, name: str, value: object) -> None:
+        super().__init__(f"Invalid {name}: {value}")
+
+
 class UIRutubeDownloaderError(Exception):
     """Base class for all errors raised by the UI."""
 
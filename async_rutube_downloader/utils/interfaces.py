@@ -5,27 +5,46 @@ from pathlib import Path
 
 from aiohttp import ClientSession
 
+from async_rutube_downloader.playlist import VariantInfo
+from async_rutube_downloader.settings import CHUNK_SIZE
+from async_rutube_downloader.utils.archive import ArchiveEntry, DownloadArchive
+from async_rutube_downloader.utils.cancellation import CancelPolicy
+from async_rutube_downloader.utils.concurrency import SegmentBudget
 from async_rutube_downloader.utils.descriptors import UrlDescriptor
+from async_rutube_downloader.utils.metadata_cache import MetadataCache
+from async_rutube_downloader.utils.progress import ProgressEvent
+from async_rutube_downloader.utils.segment_cache import SegmentCache
 from async_rutube_downloader.utils.type_hints import Qualities
 
 
 class DownloaderABC(ABC):
     url: str | UrlDescriptor  # it's a nightmare to typehint Descriptor
     video_title: str
+    variants: dict[tuple[int, int], VariantInfo]
+    file: Path
 
     @abstractmethod
     def __init__(
         self,
         url: str,
         loop: asyncio.AbstractEventLoop | None = None,
-        callback: Callable[[int, int], None] | None = None,
+        callback: Callable[[ProgressEvent], None] | None = None,
         upload_directory: Path = Path.cwd(),
         session: ClientSession | None = None,
         auto_close_session: bool = True,
+        concurrency: int = CHUNK_SIZE,
+        split_threshold: int | None = None,
+        segment_budget: SegmentBudget | None = None,
+        metadata_cache: MetadataCache | None = None,
+        archive: DownloadArchive | None = None,
+        segment_cache: SegmentCache | None = None,
     ) -> None: ...
 
     @abstractmethod
-    async def fetch_video_info(self) -> Qualities: ...
+    async def check_archive(self) -> ArchiveEntry | None: ...
+
+    @abstractmethod
+    async def fetch_video_info(self, prefetch: bool = False) -> Qualities: ...
 
     @abstractmethod
     async def download_video(self) -> None: ...
@@ -36,7 +55,9 @@ class DownloaderABC(ABC):
     ) -> None: ...
 
     @abstractmethod
-    def interrupt_download(self) -> None: ...
+    def interrupt_download(
+        self, policy: CancelPolicy = CancelPolicy.keep
+    ) -> None: ...
 
     @abstractmethod
     def is_interrupted(self) -> bool: ...
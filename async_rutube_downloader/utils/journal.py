@@ -0,0 +1,146 @@
+import json
+from collections.abc import AsyncIterator, Iterable
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Self
+
+import aiofiles
+import aiofiles.os
+from aiofiles.threadpool.text import AsyncTextIOWrapper
+
+from async_rutube_downloader.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+JOURNAL_SUFFIX = ".journal"
+
+
+class SegmentJournal:
+    """
+    Sidecar file for a `.part` file with the segments already committed.
+
+    The first line is a JSON header which identifies the download,
+    every next line is `index offset size` of a committed segment.
+    Lines are appended and flushed one by one, so after a crash
+    the journal may miss the last segments, but never lists
+    a segment that was not written.
+
+    Usage:
+        journal = SegmentJournal(part_file, video_id, quality, total)
+        committed = await journal.load()
+        async with journal.open():
+            await journal.record(index, offset, size)
+        await journal.remove()  # when the download is complete
+    """
+
+    def __init__(
+        self,
+        part_file: Path,
+        video_id: str,
+        quality: tuple[int, int],
+        segments_count: int,
+    ) -> None:
+        self.part_file = part_file
+        self.path = part_file.with_name(part_file.name + JOURNAL_SUFFIX)
+        self._header: dict[str, Any] = {
+            "video_id": video_id,
+            "quality": list(quality),
+            "segments": segments_count,
+        }
+        self._file: AsyncTextIOWrapper | None = None
+        self.committed: dict[int, tuple[int, int]] = {}
+
+    async def load(self) -> dict[int, tuple[int, int]]:
+        """
+        Read and validate the journal.
+
+        Returns:
+            Committed segments as `{index: (offset, size)}`.
+            Empty if there is nothing to resume or the journal
+            does not match the download or the `.part` file.
+        """
+        self.committed = {}
+        if not (self.path.exists() and self.part_file.exists()):
+            return self.committed
+        async with aiofiles.open(self.path) as file:
+            lines = (await file.read()).splitlines()
+        try:
+            if not lines or json.loads(lines[0]) != self._header:
+                logger.info("Journal %s is for another download", self.path)
+                return self.committed
+        except json.JSONDecodeError:
+            logger.info("Journal %s is broken", self.path)
+            return self.committed
+        part_file_size = (await aiofiles.os.stat(self.part_file)).st_size
+        for line in lines[1:]:
+            try:
+                index, offset, size = map(int, line.split())
+            except ValueError:
+                # The process died while the line was written.
+                break
+            if (
+                not 0 <= index < self._header["segments"]
+                or offset + size > part_file_size
+            ):
+                break
+            self.committed[index] = (offset, size)
+        return self.committed
+
+    def committed_prefix(self) -> tuple[int, int]:
+        """
+        Returns:
+            Index of the first segment that is not committed and the
+            offset where it starts, assuming segments are written in order.
+        """
+        index, offset = 0, 0
+        while index in self.committed:
+            segment_offset, size = self.committed[index]
+            if segment_offset != offset:
+                break
+            offset += size
+            index += 1
+        return index, offset
+
+    def is_scattered(self) -> bool:
+        """
+        True if segments were committed after the committed prefix,
+        by positional writes. An ordered rewrite would lose them.
+        """
+        first_index, _ = self.committed_prefix()
+        return any(index > first_index for index in self.committed)
+
+    def forget(self, indices: Iterable[int]) -> None:
+        """Forget the committed segments, they will be downloaded again."""
+        for index in indices:
+            self.committed.pop(index, None)
+
+    @asynccontextmanager
+    async def open(self) -> AsyncIterator[Self]:
+        """
+        Start the journal with the header and the loaded segments.
+        It's rewritten rather than appended, so a line cut off
+        by a crash does not stay in the middle of the file.
+        """
+        self._file = await aiofiles.open(self.path, mode="w")
+        await self._file.write(json.dumps(self._header) + "\n")
+        await self._file.writelines(
+            f"{index} {offset} {size}\n"
+            for index, (offset, size) in self.committed.items()
+        )
+        await self._file.flush()
+        try:
+            yield self
+        finally:
+            await self._file.close()
+            self._file = None
+
+    async def record(self, index: int, offset: int, size: int) -> None:
+        """Record a segment that is written to the `.part` file."""
+        assert self._file, "Journal is not opened"
+        self.committed[index] = (offset, size)
+        await self._file.write(f"{index} {offset} {size}\n")
+        await self._file.flush()
+
+    async def remove(self) -> None:
+        if self.path.exists():
+            await aiofiles.os.remove(self.path)
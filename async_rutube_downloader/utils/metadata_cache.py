@@ -0,0 +1,196 @@
+import sqlite3
+import time
+from collections.abc import Callable
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from async_rutube_downloader.settings import (
+    METADATA_CACHE_SIZE,
+    METADATA_CACHE_TTL,
+    SIGNED_URL_MARGIN,
+)
+from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.miscellaneous import get_cache_directory
+from async_rutube_downloader.utils.sqlite import SQLiteDatabase
+
+logger = get_logger(__name__)
+
+METADATA_CACHE_FILE = "metadata.sqlite3"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    video_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    PRIMARY KEY (video_id, kind)
+)
+"""
+
+
+def signed_url_expiry(url: str) -> float | None:
+    """
+    Rutube signs playlist URLs, `expire` of the query is
+    the Unix time they stop working, `None` if it's missing.
+    """
+    values = parse_qs(urlsplit(url).query).get("expire")
+    if values and values[0].isdecimal():
+        return float(values[0])
+    return None
+
+
+class MetadataCache:
+    """
+    On-disk SQLite cache of video metadata: API responses and playlists,
+    keyed by video ID and kind, like `api` or `variant:1920x1080`.
+
+    Entries expire after `ttl` seconds, or earlier if the playlist URLs
+    they hold expire, see `signed_url_expiry`. When the values are bigger
+    than `max_size` bytes, least recently used entries are evicted.
+    Queries run in a thread, so the event loop is never blocked.
+
+    Usage:
+        cache = MetadataCache()
+        text = await cache.get(video_id, "master")
+        if text is None:
+            text = await download()
+            await cache.set(video_id, "master", text)
+    """
+
+    def __init__(
+        self,
+        path: Path | None = None,
+        ttl: float = METADATA_CACHE_TTL,
+        max_size: int = METADATA_CACHE_SIZE,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        Args:
+            path: SQLite database, created if missing.
+                Defaults to a file in the user cache directory.
+            ttl: Seconds an entry is fresh.
+            max_size: Bytes of values kept, `0` means unlimited.
+            clock: Returns the current Unix time.
+        """
+        self._database = SQLiteDatabase(
+            path or get_cache_directory() / METADATA_CACHE_FILE, SCHEMA
+        )
+        self._ttl = ttl
+        self._max_size = max_size
+        self._clock = clock
+
+    async def get(self, video_id: str, kind: str) -> str | None:
+        """
+        The fresh value, `None` if it's missing or expired.
+        A broken cache is a miss, it never fails the download.
+        """
+        try:
+            return await self._database.run(self._get, video_id, kind)
+        except (sqlite3.Error, OSError):
+            logger.info("Metadata cache is unavailable", exc_info=True)
+            return None
+
+    async def set(
+        self,
+        video_id: str,
+        kind: str,
+        value: str,
+        expires_at: float | None = None,
+    ) -> None:
+        """
+        Args:
+            expires_at: Unix time the value stops being valid,
+                the entry expires at it or after `ttl`, what is first.
+        """
+        try:
+            await self._database.run(
+                self._set, video_id, kind, value, expires_at
+            )
+        except (sqlite3.Error, OSError):
+            logger.info("Metadata cache is unavailable", exc_info=True)
+
+    async def invalidate(self, video_id: str) -> None:
+        """Remove all entries of the video."""
+        try:
+            await self._database.run(self._invalidate, video_id)
+        except (sqlite3.Error, OSError):
+            logger.info("Metadata cache is unavailable", exc_info=True)
+
+    def close(self) -> None:
+        self._database.close()
+
+    def _get(
+        self, connection: sqlite3.Connection, video_id: str, kind: str
+    ) -> str | None:
+        now = self._clock()
+        row = connection.execute(
+            "SELECT value, expires_at FROM entries"
+            " WHERE video_id = ? AND kind = ?",
+            (video_id, kind),
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at <= now:
+            connection.execute(
+                "DELETE FROM entries WHERE video_id = ? AND kind = ?",
+                (video_id, kind),
+            )
+            return None
+        connection.execute(
+            "UPDATE entries SET used_at = ? WHERE video_id = ? AND kind = ?",
+            (now, video_id, kind),
+        )
+        return value
+
+    def _set(
+        self,
+        connection: sqlite3.Connection,
+        video_id: str,
+        kind: str,
+        value: str,
+        expires_at: float | None,
+    ) -> None:
+        now = self._clock()
+        expires_at = min(
+            now + self._ttl,
+            expires_at - SIGNED_URL_MARGIN if expires_at else float("inf"),
+        )
+        if expires_at <= now:
+            return
+        connection.execute(
+            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+            (video_id, kind, value, len(value.encode()), expires_at, now),
+        )
+        self.__evict(connection, now)
+
+    def _invalidate(
+        self, connection: sqlite3.Connection, video_id: str
+    ) -> None:
+        connection.execute(
+            "DELETE FROM entries WHERE video_id = ?", (video_id,)
+        )
+
+    def __evict(self, connection: sqlite3.Connection, now: float) -> None:
+        """Remove expired entries, then least recently used ones,
+        until the values fit into `max_size`."""
+        connection.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+        if not self._max_size:
+            return
+        (total,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()
+        if total <= self._max_size:
+            return
+        rows = connection.execute(
+            "SELECT rowid, size FROM entries ORDER BY used_at"
+        ).fetchall()
+        evicted = []
+        for rowid, size in rows:
+            if total <= self._max_size:
+                break
+            evicted.append((rowid,))
+            total -= size
+        connection.executemany("DELETE FROM entries WHERE rowid = ?", evicted)
+        logger.debug("Evicted %s metadata cache entries", len(evicted))
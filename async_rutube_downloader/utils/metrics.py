@@ -0,0 +1,504 @@
+import asyncio
+import bisect
+import math
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Self
+
+from aiohttp import ClientResponseError, ClientSession, web
+
+from async_rutube_downloader.settings import (
+    METRICS_FILE_INTERVAL,
+    METRICS_LATENCY_BUCKETS,
+    METRICS_THROUGHPUT_BUCKETS,
+    SERVER_HOST,
+)
+from async_rutube_downloader.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Prometheus text exposition format, OpenMetrics scrapers accept it too.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_PATH = "/metrics"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape(value)}"'
+        for name, value in zip(names, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+class Metric(ABC):
+    """
+    A metric family: one value per combination of label values.
+    Recording does nothing until the registry is enabled.
+    """
+
+    type = "untyped"
+
+    def __init__(
+        self,
+        registry: "MetricsRegistry",
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+    ) -> None:
+        self._registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        with self._lock:
+            yield from self._samples()
+
+    @abstractmethod
+    def _samples(self) -> Iterable[str]:
+        """Lines of the values, called with the lock held."""
+
+
+class Counter(Metric):
+    """A value that only grows, like bytes downloaded."""
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class Gauge(Metric):
+    """A value that goes up and down, like requests in flight."""
+
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels: object) -> None:
+        if not self._registry.enabled:
+            return
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: object) -> None:
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def get(self, **labels: object) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track(self, **labels: object) -> Iterator[None]:
+        """Increase the gauge while the block runs."""
+        # Checked once, a block doesn't decrease a gauge it didn't increase.
+        enabled = self._registry.enabled
+        if enabled:
+            self.inc(**labels)
+        try:
+            yield
+        finally:
+            if enabled:
+                self.dec(**labels)
+
+    def _samples(self) -> Iterable[str]:
+        for key, value in self._values.items():
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+@dataclass(frozen=True)
+class Distribution:
+    """Values observed by a histogram, for one combination of labels."""
+
+    # Upper bounds of the buckets, the last one is infinity.
+    buckets: tuple[float, ...]
+    counts: tuple[int, ...]
+    total: float
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket the quantile falls into."""
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts, strict=True):
+            cumulative += count
+            if count and cumulative >= rank:
+                return bound
+        return 0.0
+
+    def __sub__(self, other: Self) -> Self:
+        """Values observed after `other` was taken."""
+        return type(self)(
+            self.buckets,
+            tuple(
+                a - b for a, b in zip(self.counts, other.counts, strict=True)
+            ),
+            self.total - other.total,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {
+                str(bound): count
+                for bound, count in zip(self.buckets, self.counts, strict=True)
+            },
+        }
+
+
+class Histogram(Metric):
+    """Distribution of observed values, counted in buckets."""
+
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float], **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = (*sorted(buckets), math.inf)
+        # Per label values: count of every bucket, the sum.
+        self._values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        if not self._registry.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(
+                key, ([0] * len(self.buckets), 0.0)
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        """Observe the seconds the block takes."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - start, **labels)
+
+    def get(self, **labels: object) -> Distribution:
+        with self._lock:
+            counts, total = self._values.get(
+                self._key(labels), ([0] * len(self.buckets), 0.0)
+            )
+            return Distribution(self.buckets, tuple(counts), total)
+
+    def series(self) -> dict[tuple[str, ...], Distribution]:
+        """Values of every combination of labels observed so far."""
+        with self._lock:
+            return {
+                key: Distribution(self.buckets, tuple(counts), total)
+                for key, (counts, total) in self._values.items()
+            }
+
+    def _samples(self) -> Iterable[str]:
+        bucket_labels = (*self.label_names, "le")
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts, strict=True):
+                cumulative += count
+                labels = _format_labels(
+                    bucket_labels, (*key, _format_value(bound))
+                )
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum{labels} {_format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Metrics of the process, rendered in the Prometheus text format.
+
+    Disabled by default, then recording costs a flag check.
+    Collectors are called before rendering,
+    they set gauges that are cheaper to read than to track.
+
+    Usage:
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "Requests made")
+        registry.enabled = True
+        requests.inc()
+        text = registry.render()
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._metrics: list[Metric] = []
+        self._collectors: list[Callable[[], None]] = []
+
+    def counter(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> Counter:
+        return self.__register(Counter(self, name, documentation, labels))
+
+    def gauge(
+        self, name: str, documentation: str, labels: Sequence[str] = ()
+    ) -> Gauge:
+        return self.__register(Gauge(self, name, documentation, labels))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float],
+        labels: Sequence[str] = (),
+    ) -> Histogram:
+        return self.__register(
+            Histogram(self, name, documentation, labels, buckets=buckets)
+        )
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        lines = [line for metric in self._metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: Path) -> None:
+        """
+        Write the metrics for the node-exporter textfile collector.
+        The file is replaced at once, a scrape never reads half of it.
+        """
+        temporary = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        temporary.write_text(self.render())
+        os.replace(temporary, path)
+
+    def __register[M: Metric](self, metric: M) -> M:
+        self._metrics.append(metric)
+        return metric
+
+
+@contextmanager
+def timer(histogram: Histogram, **labels: object) -> Iterator[None]:
+    """Observe the seconds the block takes."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        histogram.observe(time.monotonic() - start, **labels)
+
+
+def retry_cause(error: BaseException) -> str:
+    """`503` for HTTP errors, else the name of the exception type."""
+    if isinstance(error, ClientResponseError):
+        return str(error.status)
+    return type(error).__name__
+
+
+def collect_pool_stats(session: ClientSession) -> None:
+    """Report connections of the session pool when metrics are rendered."""
+    # Imported here: `create_session` imports `tracing`,
+    # which imports this module.
+    from async_rutube_downloader.utils.create_session import get_pool_stats
+
+    def collect() -> None:
+        if stats := get_pool_stats(session):
+            for state in ("open", "idle", "acquired"):
+                connections.set(getattr(stats, state), state=state)
+            connection_waiters.set(stats.waiting)
+
+    process_metrics.add_collector(collect)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(
+        body=process_metrics.render().encode(),
+        headers={"Content-Type": CONTENT_TYPE},
+    )
+
+
+class MetricsExporter:
+    """
+    Exports `process_metrics` while downloads run: serves `/metrics`
+    on the port and writes the file every `interval` seconds,
+    for the node-exporter textfile collector. Metrics are recorded
+    only if there is somewhere to export them.
+
+    Usage:
+        exporter = MetricsExporter(port=9100)
+        await exporter.start(session)
+        ...  # download
+        await exporter.stop()
+    """
+
+    def __init__(
+        self,
+        port: int | None = None,
+        file: Path | None = None,
+        host: str = SERVER_HOST,
+        interval: float = METRICS_FILE_INTERVAL,
+    ) -> None:
+        self.port = port
+        self.file = file
+        self.host = host
+        self.interval = interval
+        self._runner: web.AppRunner | None = None
+        self._writer: asyncio.Task | None = None
+
+    async def start(self, session: ClientSession | None = None) -> None:
+        """
+        Args:
+            session: Connections of its pool are exported too.
+        """
+        if self.port is None and self.file is None:
+            return
+        process_metrics.enabled = True
+        if session:
+            collect_pool_stats(session)
+        if self.port is not None:
+            app = web.Application()
+            app.router.add_get(METRICS_PATH, handle_metrics)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        if self.file is not None:
+            self._writer = asyncio.create_task(self.__write_periodically())
+
+    async def stop(self) -> None:
+        """Stop serving, the file is written the last time."""
+        if self._writer:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+            await self.__write()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __write_periodically(self) -> None:
+        while True:
+            await self.__write()
+            await asyncio.sleep(self.interval)
+
+    async def __write(self) -> None:
+        assert self.file
+        try:
+            await asyncio.to_thread(process_metrics.write_textfile, self.file)
+        except OSError:
+            logger.info(
+                "Failed to write metrics to %s", self.file, exc_info=True
+            )
+
+
+# Shared by all downloads of the process.
+process_metrics = MetricsRegistry()
+downloaded_bytes = process_metrics.counter(
+    "rutube_downloaded_bytes_total", "Bytes of segments downloaded."
+)
+segments_completed = process_metrics.counter(
+    "rutube_segments_completed_total", "Segments downloaded and written."
+)
+segments_failed = process_metrics.counter(
+    "rutube_segments_failed_total",
+    "Segment requests that failed, retried or not.",
+)
+retries = process_metrics.counter(
+    "rutube_retries_total",
+    "Retried requests by operation and cause: HTTP status or error.",
+    ("operation", "cause"),
+)
+requests_in_flight = process_metrics.gauge(
+    "rutube_segment_requests_in_flight", "Segment requests in flight."
+)
+active_downloads = process_metrics.gauge(
+    "rutube_active_downloads", "Videos being downloaded."
+)
+segment_latency = process_metrics.histogram(
+    "rutube_segment_latency_seconds",
+    "Seconds from a segment request to its response headers.",
+    METRICS_LATENCY_BUCKETS,
+)
+segment_throughput = process_metrics.histogram(
+    "rutube_segment_throughput_bytes_per_second",
+    "Bytes per second of a segment request, until its last byte.",
+    METRICS_THROUGHPUT_BUCKETS,
+)
+write_latency = process_metrics.histogram(
+    "rutube_file_write_seconds",
+    "Seconds of one write or flush of a video file,"
+    " waiting for reorder buffer space is not included.",
+    METRICS_LATENCY_BUCKETS,
+)
+playlist_latency = process_metrics.histogram(
+    "rutube_playlist_fetch_seconds",
+    "Seconds to download a playlist.",
+    METRICS_LATENCY_BUCKETS,
+    ("kind",),
+)
+connections = process_metrics.gauge(
+    "rutube_connections", "Connections of the session pool.", ("state",)
+)
+connection_waiters = process_metrics.gauge(
+    "rutube_connection_waiters", "Requests waiting for a connection."
+)
+request_phases = process_metrics.histogram(
+    "rutube_request_phase_seconds",
+    "Seconds of request phases by host, see --trace-phases.",
+    METRICS_LATENCY_BUCKETS,
+    ("host", "phase"),
+)
@@ -0,0 +1,139 @@
+import random
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from urllib.parse import urljoin, urlsplit
+
+import m3u8
+
+from async_rutube_downloader.settings import (
+    MIRROR_COOLDOWN,
+    MIRROR_MAX_FAILURES,
+)
+from async_rutube_downloader.utils.circuit_breaker import CircuitBreakers
+from async_rutube_downloader.utils.exceptions import InvalidPlaylistError
+from async_rutube_downloader.utils.logger import get_logger
+
+logger = get_logger(__name__)
+# Weight of the latest measurement in the throughput moving average.
+SMOOTHING = 0.3
+
+
+@dataclass
+class Mirror:
+    """One CDN serving the video playlist."""
+
+    playlist_uri: str
+    # Bytes per second, exponential moving average.
+    throughput: float = 0.0
+    # Seconds until the response headers arrive.
+    latency: float = 0.0
+    failures_in_row: int = 0
+    disabled_until: float = 0.0
+
+    @property
+    def host(self) -> str:
+        return urlsplit(self.playlist_uri).netloc
+
+    def is_healthy(self, now: float) -> bool:
+        return self.disabled_until <= now
+
+    def segment_url(self, segment: m3u8.Segment) -> str:
+        """Segment URIs are relative to the variant playlist."""
+        return urljoin(self.playlist_uri, segment.uri)
+
+
+class MirrorPool:
+    """
+    Spreads segment requests across CDN mirrors of the same playlist.
+
+    Mirrors are chosen at random, weighted by observed throughput.
+    A mirror that fails `MIRROR_MAX_FAILURES` times in a row
+    is disabled for `MIRROR_COOLDOWN` seconds and its requests go to
+    the others. If every mirror is disabled, the one to recover first
+    is still used, so the pool itself never fails a download.
+
+    Usage:
+        pool = MirrorPool(variant_playlist_uris)
+        mirror = pool.choose()
+        url = mirror.segment_url(segment)
+        pool.report_success(mirror, size, latency, duration)
+        pool.report_failure(mirror)
+    """
+
+    def __init__(
+        self,
+        playlist_uris: Iterable[str],
+        breakers: CircuitBreakers | None = None,
+    ) -> None:
+        """
+        Args:
+            playlist_uris: Variant playlist of every mirror.
+            breakers: Mirrors with an open circuit are not chosen.
+        """
+        self.mirrors = [Mirror(uri) for uri in dict.fromkeys(playlist_uris)]
+        if not self.mirrors:
+            raise InvalidPlaylistError
+        self._breakers = breakers
+
+    def choose(self, avoid: Mirror | None = None) -> Mirror:
+        """
+        Args:
+            avoid: Mirror that just failed the request, used only
+                if there is nothing else.
+        """
+        now = time.monotonic()
+        healthy = [
+            mirror
+            for mirror in self.mirrors
+            if mirror.is_healthy(now)
+            and (
+                self._breakers is None
+                or self._breakers.for_host(mirror.host).is_available()
+            )
+        ]
+        if len(healthy) > 1 and avoid in healthy:
+            healthy.remove(avoid)
+        if not healthy:
+            return min(self.mirrors, key=lambda mirror: mirror.disabled_until)
+        # Not measured mirrors get the average weight,
+        # so they still receive requests.
+        measured = [m.throughput for m in healthy if m.throughput]
+        default_weight = sum(measured) / len(measured) if measured else 1.0
+        return random.choices(
+            healthy,
+            weights=[m.throughput or default_weight for m in healthy],
+        )[0]
+
+    def report_success(
+        self, mirror: Mirror, size: int, latency: float, duration: float
+    ) -> None:
+        """
+        Args:
+            size: Bytes received.
+            latency: Seconds until the response headers arrived.
+            duration: Seconds the whole request took.
+        """
+        mirror.failures_in_row = 0
+        mirror.disabled_until = 0.0
+        mirror.latency = latency
+        throughput = size / max(duration, 1e-6)
+        mirror.throughput = (
+            throughput
+            if not mirror.throughput
+            else SMOOTHING * throughput + (1 - SMOOTHING) * mirror.throughput
+        )
+
+    def report_failure(self, mirror: Mirror) -> None:
+        mirror.failures_in_row += 1
+        if mirror.failures_in_row >= MIRROR_MAX_FAILURES:
+            self.disable(mirror)
+
+    def disable(self, mirror: Mirror) -> None:
+        """Stop sending requests to the mirror for `MIRROR_COOLDOWN`."""
+        logger.info(
+            "Mirror %s is disabled for %s seconds",
+            mirror.host,
+            MIRROR_COOLDOWN,
+        )
+        mirror.disabled_until = time.monotonic() + MIRROR_COOLDOWN
@@ -1,8 +1,11 @@
 import asyncio
+import os
+import sys
 import tomllib
 from pathlib import Path
 from typing import Literal
 
+from async_rutube_downloader.settings import APP_NAME
 from async_rutube_downloader.utils.logger import get_logger
 
 logger = get_logger(__name__)
@@ -41,3 +44,16 @@ def get_or_create_loop() -> asyncio.AbstractEventLoop:
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         return loop
+
+
+def get_cache_directory() -> Path:
+    """The app directory in the per-user cache directory of the OS."""
+    if sys.platform == "win32":
+        base = Path(
+            os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")
+        )
+    elif sys.platform == "darwin":
+        base = Path.home() / "Library" / "Caches"
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache"))
+    return base / APP_NAME
@@ -0,0 +1,194 @@
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass
+
+from async_rutube_downloader.settings import (
+    PROGRESS_INTERVAL,
+    PROGRESS_RATE_WINDOW,
+)
+from async_rutube_downloader.utils.tracing import PhaseTimings
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    """Progress of a download, see `ProgressTracker`."""
+
+    # Segments written to the file, including resumed ones.
+    completed_segments: int
+    total_segments: int
+    # Bytes of segment bodies received from the network.
+    bytes_received: int = 0
+    # Bytes per second over the last `PROGRESS_RATE_WINDOW` seconds.
+    rate: float = 0.0
+    # Bytes per second since the download started.
+    average_rate: float = 0.0
+    # Seconds until the download is complete, `None` if it's unknown.
+    eta: float | None = None
+    # Retried requests of the download.
+    retries: int = 0
+    # Segment requests allowed in flight.
+    concurrency: int = 0
+    # Seconds since the download started.
+    elapsed: float = 0.0
+    # Request phases per host since the download started,
+    # `None` if the session doesn't trace them, see `PhaseTracer`.
+    phases: PhaseTimings | None = None
+
+    @property
+    def percent(self) -> float:
+        if not self.total_segments:
+            return 0.0
+        return self.completed_segments / self.total_segments * 100
+
+    @property
+    def finished(self) -> bool:
+        return self.completed_segments == self.total_segments
+
+
+class ProgressTracker:
+    """
+    Counts received bytes and completed segments of a download
+    and passes `ProgressEvent` to the callback,
+    at most once per `interval` seconds.
+
+    The first event and the one of the last segment are always passed,
+    so a consumer sees the download start and finish.
+
+    Usage:
+        tracker = ProgressTracker(len(segments), print)
+        tracker.receive(len(chunk))  # every chunk of a segment body
+        tracker.complete()  # the segment is written
+        tracker.emit(retries, concurrency)
+    """
+
+    def __init__(
+        self,
+        total_segments: int,
+        callback: Callable[[ProgressEvent], None] | None,
+        interval: float = PROGRESS_INTERVAL,
+        rate_window: float = PROGRESS_RATE_WINDOW,
+        clock: Callable[[], float] = time.monotonic,
+        phases: Callable[[], PhaseTimings | None] | None = None,
+    ) -> None:
+        """
+        Args:
+            total_segments: Segments of the download.
+            callback: Called with every event,
+                `None` means the progress is only counted.
+            interval: Seconds between events, `0` passes every one.
+            rate_window: Seconds the current rate is measured over.
+            clock: Returns monotonic time in seconds.
+            phases: Returns request phase timings of the download,
+                called only for events that are passed.
+        """
+        self.total_segments = total_segments
+        self.completed_segments = 0
+        self.bytes_received = 0
+        self._callback = callback
+        self._interval = interval
+        self._rate_window = rate_window
+        self._clock = clock
+        self._phases = phases
+        self._started = clock()
+        self._last_event: float | None = None
+        # Segments and their bytes received by this download,
+        # the size of the remaining ones is estimated from them.
+        self._segments_received = 0
+        self._segment_bytes = 0
+        # Moments and totals of received bytes, the first one
+        # is the last before `rate_window`.
+        self._samples: deque[tuple[float, int]] = deque([(self._started, 0)])
+
+    def resume(self, completed_segments: int) -> None:
+        """Segments already written by a previous download."""
+        self.completed_segments = completed_segments
+
+    def receive(self, size: int) -> None:
+        self.bytes_received += size
+        now = self._clock()
+        self._samples.append((now, self.bytes_received))
+        self.__forget_samples(now)
+
+    def complete(self, size: int | None = None) -> None:
+        """
+        A segment is written.
+
+        Args:
+            size: Bytes of it received from the network, `None` if it
+                didn't come from the network, like from a cache.
+        """
+        self.completed_segments += 1
+        if size is not None:
+            self._segments_received += 1
+            self._segment_bytes += size
+
+    def emit(
+        self, retries: int = 0, concurrency: int = 0, force: bool = False
+    ) -> ProgressEvent | None:
+        """
+        Pass the event to the callback, unless the last one
+        was less than `interval` seconds ago.
+
+        Args:
+            force: Pass the event anyway.
+        """
+        if self._callback is None:
+            return None
+        now = self._clock()
+        if not (
+            force
+            or self._last_event is None
+            or now - self._last_event >= self._interval
+            or self.completed_segments == self.total_segments
+        ):
+            return None
+        self._last_event = now
+        event = self.event(retries, concurrency, now)
+        self._callback(event)
+        return event
+
+    def event(
+        self, retries: int = 0, concurrency: int = 0, now: float | None = None
+    ) -> ProgressEvent:
+        now = self._clock() if now is None else now
+        elapsed = now - self._started
+        rate = self.rate(now)
+        return ProgressEvent(
+            completed_segments=self.completed_segments,
+            total_segments=self.total_segments,
+            bytes_received=self.bytes_received,
+            rate=rate,
+            average_rate=self.bytes_received / elapsed if elapsed else 0.0,
+            eta=self.__eta(rate),
+            retries=retries,
+            concurrency=concurrency,
+            elapsed=elapsed,
+            phases=self._phases() if self._phases else None,
+        )
+
+    def rate(self, now: float | None = None) -> float:
+        """Bytes per second over the last `rate_window` seconds."""
+        now = self._clock() if now is None else now
+        self.__forget_samples(now)
+        since, total = self._samples[0]
+        if now <= since:
+            return 0.0
+        return (self.bytes_received - total) / (now - since)
+
+    def __forget_samples(self, now: float) -> None:
+        """Keep samples of the window and the last one before it."""
+        while (
+            len(self._samples) > 1
+            and self._samples[1][0] <= now - self._rate_window
+        ):
+            self._samples.popleft()
+
+    def __eta(self, rate: float) -> float | None:
+        remaining = self.total_segments - self.completed_segments
+        if not remaining:
+            return 0.0
+        if not (rate and self._segments_received):
+            return None
+        segment_size = self._segment_bytes / self._segments_received
+        return remaining * segment_size / rate
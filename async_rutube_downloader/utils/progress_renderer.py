@@ -0,0 +1,183 @@
+import asyncio
+import shutil
+import sys
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import TextIO
+
+from async_rutube_downloader.settings import CLI_PROGRESS_FPS, MIB
+from async_rutube_downloader.utils.progress import ProgressEvent
+
+WIDTH_OF_PROGRESS_BAR = 20
+# Without a terminal, a line is printed every this many percent.
+LINE_STEP_PERCENT = 10
+# ANSI escape codes: move the cursor to the start of the line n lines up,
+# erase from the cursor to the end of the screen.
+CURSOR_UP = "\x1b[{}F"
+ERASE_DOWN = "\x1b[J"
+
+
+def format_eta(seconds: float | None) -> str:
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
+
+
+def format_progress(
+    title: str, event: ProgressEvent | None, bar: bool = True
+) -> str:
+    """`[title] [#####               ] 25% 3.2 MiB/s ETA 0:42`"""
+    percent = int(event.percent) if event else 0
+    text = f"[{title}]"
+    if bar:
+        filled = percent * WIDTH_OF_PROGRESS_BAR // 100
+        text += f" [{'#' * filled}{' ' * (WIDTH_OF_PROGRESS_BAR - filled)}]"
+    if event is None:
+        return text
+    return (
+        f"{text} {percent}%"
+        f" {event.rate / MIB:.1f} MiB/s ETA {format_eta(event.eta)}"
+    )
+
+
+@dataclass(eq=False)
+class ProgressLine:
+    """Progress of one download, `update` is its progress callback."""
+
+    title: str
+    event: ProgressEvent | None = None
+    # Percent of the last line printed without a terminal.
+    _printed_percent: int = field(default=-1, repr=False)
+
+    def update(self, event: ProgressEvent) -> None:
+        """Only keeps the event, the renderer samples it."""
+        self.event = event
+
+
+class ProgressRenderer:
+    """
+    Draws the progress of active downloads at a fixed frame rate.
+
+    Downloads only store their latest event in a `ProgressLine`,
+    so the cost of rendering doesn't grow with their segments.
+    In a terminal every download has a line redrawn in place,
+    otherwise a plain line is printed every `LINE_STEP_PERCENT` percent.
+
+    Messages printed while lines are drawn must go through `echo`,
+    else the next frame overwrites them.
+
+    Usage:
+        renderer = ProgressRenderer()
+        line = ProgressLine("title")
+        async with renderer.running():
+            renderer.add(line)
+            await download(callback=line.update)
+            renderer.remove(line)
+    """
+
+    def __init__(
+        self,
+        stream: TextIO | None = None,
+        fps: float = CLI_PROGRESS_FPS,
+        interactive: bool | None = None,
+    ) -> None:
+        """
+        Args:
+            stream: Defaults to `sys.stdout` at the time of writing.
+            fps: Frames per second.
+            interactive: Redraw lines in place,
+                defaults to whether the stream is a terminal.
+        """
+        self._stream = stream
+        self._fps = fps
+        self._interactive = interactive
+        self._lines: list[ProgressLine] = []
+        # Lines of the last frame, erased before the next one.
+        self._drawn = 0
+        self._users = 0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def stream(self) -> TextIO:
+        return self._stream or sys.stdout
+
+    @property
+    def interactive(self) -> bool:
+        if self._interactive is None:
+            return self.stream.isatty()
+        return self._interactive
+
+    def add(self, line: ProgressLine) -> None:
+        self._lines.append(line)
+
+    def remove(self, line: ProgressLine) -> None:
+        """Stop drawing the line, its last state stays printed."""
+        if line not in self._lines:
+            return
+        if self.interactive:
+            self.__erase()
+            self.__write(format_progress(line.title, line.event))
+        else:
+            self.__print_step(line)
+        self._lines.remove(line)
+
+    def echo(self, message: str) -> None:
+        """Print the message above the progress lines."""
+        self.__erase()
+        self.__write(message)
+
+    def draw(self) -> None:
+        """Draw one frame."""
+        if not self.interactive:
+            for line in self._lines:
+                self.__print_step(line)
+            return
+        self.__erase()
+        width = shutil.get_terminal_size().columns - 1
+        for line in self._lines:
+            # A wrapped line would break moving the cursor up.
+            self.__write(format_progress(line.title, line.event)[:width])
+        self._drawn = len(self._lines)
+
+    async def run(self) -> None:
+        """Draw frames until cancelled."""
+        while True:
+            self.draw()
+            await asyncio.sleep(1 / self._fps)
+
+    @asynccontextmanager
+    async def running(self) -> AsyncIterator["ProgressRenderer"]:
+        """Draw frames while any user is inside, it can be nested."""
+        self._users += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+        try:
+            yield self
+        finally:
+            self._users -= 1
+            if not self._users and self._task:
+                self._task.cancel()
+                self._task = None
+                self.draw()
+
+    def __print_step(self, line: ProgressLine) -> None:
+        if line.event is None:
+            return
+        step = int(line.event.percent) // LINE_STEP_PERCENT
+        if step * LINE_STEP_PERCENT > line._printed_percent:
+            line._printed_percent = step * LINE_STEP_PERCENT
+            self.__write(format_progress(line.title, line.event, bar=False))
+
+    def __erase(self) -> None:
+        if self._drawn:
+            self.stream.write(CURSOR_UP.format(self._drawn) + ERASE_DOWN)
+            self._drawn = 0
+
+    def __write(self, text: str) -> None:
+        self.stream.write(text + "\n")
+        self.stream.flush()
@@ -0,0 +1,193 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from contextlib import nullcontext
+from http import HTTPStatus
+
+from aiohttp import (
+    ClientError,
+    ClientPayloadError,
+    ClientResponse,
+    ClientResponseError,
+    ClientSession,
+)
+from aiohttp.streams import StreamReader
+
+from async_rutube_downloader.settings import SEGMENT_READ_SIZE
+from async_rutube_downloader.utils import metrics
+from async_rutube_downloader.utils.circuit_breaker import CircuitBreakers
+from async_rutube_downloader.utils.exceptions import RangeNotSupportedError
+from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.retry import RetryPolicy
+
+logger = get_logger(__name__)
+
+type OnChunk = Callable[[int], Awaitable[None]]
+
+
+def supports_ranges(response: ClientResponse) -> bool:
+    return response.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+
+def split_range(size: int, parts: int) -> list[tuple[int, int]]:
+    """
+    Split `size` bytes into `parts` ranges of almost equal length.
+
+    Returns:
+        Start and end (exclusive) of every range.
+    """
+    parts = max(1, min(parts, size))
+    step, rest = divmod(size, parts)
+    ranges = []
+    start = 0
+    for part in range(parts):
+        end = start + step + (part < rest)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+
+async def read_in_ranges(
+    response: ClientResponse,
+    session: ClientSession,
+    url: str,
+    parts: int,
+    on_chunk: OnChunk,
+    breakers: CircuitBreakers | None = None,
+    retry_policy: RetryPolicy | None = None,
+) -> bytearray:
+    """
+    Read the response body with `parts` requests in parallel.
+
+    The first part is read from `response` itself, the others
+    are requested with `Range` headers at the same time and put in
+    their places of a buffer preallocated for the whole body.
+    If the server ignores the ranges or answers them with 416
+    or a wrong `Content-Range`, they are cancelled and the rest
+    of the body is read from `response` as usual.
+
+    Args:
+        response: Response with `Content-Length`,
+            its body is not read yet.
+        session: Session for the range requests.
+        url: URL of the response.
+        parts: How many requests read the body at the same time.
+        on_chunk: Awaited with the size of every chunk received,
+            to limit bandwidth.
+        breakers: Circuit breakers the range requests go through,
+            like the request of `response`.
+        retry_policy: Retries of failed range requests,
+            they are not retried without it.
+    """
+    size = response.content_length
+    assert size is not None
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    (_, first_end), *other_ranges = split_range(size, parts)
+    tasks = [
+        asyncio.create_task(
+            _read_range(
+                session,
+                url,
+                view,
+                start,
+                end,
+                on_chunk,
+                breakers,
+                retry_policy,
+            )
+        )
+        for start, end in other_ranges
+    ]
+    try:
+        await _read_into(response.content, view, 0, first_end, on_chunk)
+        try:
+            await asyncio.gather(*tasks)
+        except RangeNotSupportedError:
+            await _cancel(tasks)
+            logger.info("Server ignores ranges, reading %s as a whole", url)
+            await _read_into(response.content, view, first_end, size, on_chunk)
+    finally:
+        await _cancel(tasks)
+    return buffer
+
+
+async def _cancel(tasks: list[asyncio.Task[None]]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _read_range(
+    session: ClientSession,
+    url: str,
+    view: memoryview,
+    start: int,
+    end: int,
+    on_chunk: OnChunk,
+    breakers: CircuitBreakers | None,
+    retry_policy: RetryPolicy | None,
+) -> None:
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            async with (
+                breakers.guard(url) if breakers else nullcontext(),
+                session.get(
+                    url, headers={"Range": f"bytes={start}-{end - 1}"}
+                ) as response,
+            ):
+                if (
+                    response.status != HTTPStatus.PARTIAL_CONTENT
+                    or response.content_length != end - start
+                    or not response.headers.get(
+                        "Content-Range", ""
+                    ).startswith(f"bytes {start}-{end - 1}/")
+                ):
+                    raise RangeNotSupportedError
+                await _read_into(response.content, view, start, end, on_chunk)
+        except ClientResponseError as e:
+            # Raised instead of returned by sessions with `raise_for_status`.
+            if e.status == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE:
+                raise RangeNotSupportedError from e
+            error: ClientError = e
+        except ClientError as e:
+            error = e
+        else:
+            if retry_policy:
+                retry_policy.record_success()
+            return
+        delay = (
+            retry_policy.next_delay(error, attempt, "read_range")
+            if retry_policy
+            else None
+        )
+        if delay is None:
+            raise error
+        metrics.retries.inc(
+            operation="read_range", cause=metrics.retry_cause(error)
+        )
+        logger.info(
+            "Range request failed: %s - Retrying in %.2f seconds...",
+            error,
+            delay,
+        )
+        await asyncio.sleep(delay)
+
+
+async def _read_into(
+    content: StreamReader,
+    view: memoryview,
+    start: int,
+    end: int,
+    on_chunk: OnChunk,
+) -> None:
+    """Read exactly `end - start` bytes into the view at `start`."""
+    position = start
+    while position < end:
+        chunk = await content.read(min(SEGMENT_READ_SIZE, end - position))
+        if not chunk:
+            raise ClientPayloadError
+        view[position : position + len(chunk)] = chunk
+        position += len(chunk)
+        await on_chunk(len(chunk))
@@ -0,0 +1,94 @@
+import asyncio
+import time
+from collections.abc import Callable
+
+from async_rutube_downloader.settings import RATE_LIMIT_BURST
+
+
+class TokenBucket:
+    """
+    Token bucket bandwidth limiter, one token is one byte.
+
+    Tokens are taken right after data is received, the caller
+    waits until the bucket is refilled, so pacing is smooth:
+    the bucket holds at most `RATE_LIMIT_BURST` seconds worth of tokens
+    and callers wait their turn one by one.
+    The rate can be changed at any time, waiting callers
+    are woken up to use the new rate.
+
+    Not thread-safe, use it from the event loop thread.
+
+    Usage:
+        bucket = TokenBucket(rate=1024 * 1024)  # 1 MiB/s
+        await bucket.acquire(len(chunk))
+        bucket.set_rate(None)  # unlimited
+    """
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        burst: float = RATE_LIMIT_BURST,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """
+        Args:
+            rate: Bytes per second, `None` means unlimited.
+            burst: Seconds worth of tokens the bucket can hold.
+            clock: Source of time, in seconds.
+        """
+        self._burst = burst
+        self._clock = clock
+        self._rate: float | None = None
+        self._tokens = 0.0
+        self._updated_at = clock()
+        self._lock: asyncio.Lock | None = None
+        self._rate_changed = asyncio.Event()
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> float | None:
+        return self._rate
+
+    def set_rate(self, rate: float | None) -> None:
+        """Bytes per second, `None` or 0 means unlimited."""
+        self.__refill()
+        self._rate = rate or None
+        self._tokens = min(self._tokens, self.__capacity())
+        # Wake up waiting callers, they recalculate the delay.
+        self._rate_changed.set()
+        self._rate_changed = asyncio.Event()
+
+    async def acquire(self, amount: int) -> None:
+        """Take `amount` tokens, waiting until they are available."""
+        if self._rate is None:
+            return
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self.__refill()
+            self._tokens -= amount
+            while self._tokens < 0 and self._rate is not None:
+                try:
+                    await asyncio.wait_for(
+                        self._rate_changed.wait(),
+                        timeout=-self._tokens / self._rate,
+                    )
+                except TimeoutError:
+                    pass
+                self.__refill()
+
+    def __capacity(self) -> float:
+        return self._rate * self._burst if self._rate else 0.0
+
+    def __refill(self) -> None:
+        now = self._clock()
+        if self._rate:
+            self._tokens = min(
+                self._tokens + (now - self._updated_at) * self._rate,
+                self.__capacity(),
+            )
+        self._updated_at = now
+
+
+# Shared by all downloads of the process, `rtube-cli --limit-rate`.
+process_rate_limiter = TokenBucket()
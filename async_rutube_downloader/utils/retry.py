@@ -0,0 +1,151 @@
+import random
+import time
+from collections import Counter
+from collections.abc import Callable, Mapping
+from datetime import UTC
+from email.utils import parsedate_to_datetime
+from http import HTTPStatus
+
+from aiohttp import ClientResponseError
+
+from async_rutube_downloader.settings import (
+    RETRY_BASE_DELAY,
+    RETRY_BUDGET_MINIMUM,
+    RETRY_BUDGET_RATIO,
+    RETRY_MAX_ATTEMPTS,
+    RETRY_MAX_DELAY,
+)
+from async_rutube_downloader.utils.exceptions import CircuitOpenError
+
+# Client errors worth retrying, the others mean the request is wrong.
+RETRIABLE_CLIENT_STATUSES = frozenset(
+    {HTTPStatus.REQUEST_TIMEOUT, HTTPStatus.TOO_MANY_REQUESTS}
+)
+
+
+class RetryPolicy:
+    """
+    Decides whether and when a failed request is retried.
+
+    - Delays grow exponentially with full jitter: a random delay from 0
+      to `base_delay * 2 ** (attempt - 1)`, so workers that failed
+      together don't retry together.
+    - Responses with 5xx, 408 and 429 statuses are retried,
+      other 4xx statuses like 403 or 404 are not.
+    - `Retry-After` of a response is respected, up to `max_delay`.
+    - Retries share a budget: `budget_minimum` retries plus
+      `budget_ratio` of successful calls. When a server is down,
+      requests fail fast instead of every one of them retrying.
+
+    One policy is shared by all requests of a download,
+    `retries` counts retries by operation.
+
+    Usage:
+        policy = RetryPolicy()
+        delay = policy.next_delay(error, attempt, "download_segment")
+        if delay is None:
+            raise error
+        await asyncio.sleep(delay)
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        base_delay: float = RETRY_BASE_DELAY,
+        max_delay: float = RETRY_MAX_DELAY,
+        budget_minimum: int | None = RETRY_BUDGET_MINIMUM,
+        budget_ratio: float = RETRY_BUDGET_RATIO,
+        jitter: Callable[[float, float], float] = random.uniform,
+    ) -> None:
+        """
+        Args:
+            max_attempts: Attempts of one call, including the first one.
+            base_delay: Seconds, the delay limit of the first retry.
+            max_delay: Seconds, the longest delay, even with `Retry-After`.
+            budget_minimum: Retries allowed before any call succeeds,
+                `None` means the budget is unlimited.
+            budget_ratio: Retries earned by every successful call.
+            jitter: Returns a random number between its arguments.
+        """
+        self.max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._budget_minimum = budget_minimum
+        self._budget_ratio = budget_ratio
+        self._jitter = jitter
+        self._successes = 0
+        self.retries: Counter[str] = Counter()
+
+    @property
+    def budget(self) -> float:
+        """Retries left, `inf` if the budget is unlimited."""
+        if self._budget_minimum is None:
+            return float("inf")
+        return (
+            self._budget_minimum
+            + self._successes * self._budget_ratio
+            - self.retries.total()
+        )
+
+    def record_success(self) -> None:
+        self._successes += 1
+
+    def next_delay(
+        self, error: Exception, attempt: int, operation: str
+    ) -> float | None:
+        """
+        Args:
+            error: Raised by the attempt.
+            attempt: Number of the failed attempt, starting from 1.
+            operation: Name of the call, to count its retries.
+
+        Returns:
+            Seconds to wait before the next attempt,
+            or `None` if the call must fail.
+        """
+        if (
+            not self.is_retriable(error)
+            or attempt >= self.max_attempts
+            or self.budget < 1
+        ):
+            return None
+        self.retries[operation] += 1
+        backoff = min(self._max_delay, self._base_delay * 2 ** (attempt - 1))
+        delay = self._jitter(0, backoff)
+        if isinstance(error, ClientResponseError) and error.headers:
+            retry_after = parse_retry_after(error.headers)
+            if retry_after is not None:
+                delay = min(max(delay, retry_after), self._max_delay)
+        return delay
+
+    def is_retriable(self, error: Exception) -> bool:
+        """Every error passed here is retried, except useless statuses
+        and requests to a host with an open circuit."""
+        if isinstance(error, CircuitOpenError):
+            return False
+        if isinstance(error, ClientResponseError):
+            return (
+                error.status >= HTTPStatus.INTERNAL_SERVER_ERROR
+                or error.status in RETRIABLE_CLIENT_STATUSES
+            )
+        return True
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float | None:
+    """
+    Returns:
+        Seconds from the `Retry-After` header, given in seconds
+        or as an HTTP date, `None` if it's missing or invalid.
+    """
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=UTC)
+    return max(retry_at.timestamp() - time.time(), 0.0)
@@ -0,0 +1,88 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Iterable
+
+from async_rutube_downloader.utils.exceptions import ConcurrencyLimitError
+from async_rutube_downloader.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SlidingWindowScheduler[T, R]:
+    """
+    Keeps up to `window` jobs in flight at all times.
+
+    Unlike batching with `asyncio.gather`, a new job is started
+    the moment any running job finishes, so one slow job
+    does not stall the others.
+
+    Usage:
+        scheduler = SlidingWindowScheduler(worker, window=20)
+        await scheduler.run(jobs, on_done)
+    """
+
+    def __init__(
+        self,
+        worker: Callable[[T], Awaitable[R]],
+        window: int | Callable[[], int],
+        is_stopped: Callable[[], bool] = lambda: False,
+    ) -> None:
+        """
+        Args:
+            worker: Coroutine function that processes a single job.
+            window: Maximum number of jobs in flight, or a function
+                returning it, checked before starting every new job.
+            is_stopped: Checked before starting every new job,
+                when it returns True no more jobs are started.
+        """
+        if isinstance(window, int):
+            if window < 1:
+                raise ConcurrencyLimitError
+            self._window: Callable[[], int] = lambda: window
+        else:
+            self._window = window
+        self._worker = worker
+        self._is_stopped = is_stopped
+
+    async def run(
+        self,
+        jobs: Iterable[T],
+        on_done: Callable[[T, R], Awaitable[None]] | None = None,
+    ) -> None:
+        """
+        Run the worker for every job.
+
+        `on_done`, if given, is awaited with the job and its result
+        in completion order, one call at a time. If a job raises,
+        the remaining jobs are cancelled and the exception is propagated.
+        """
+        jobs_iterator = iter(jobs)
+        in_flight: dict[asyncio.Task[R], T] = {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < self._window():
+                    if self._is_stopped():
+                        exhausted = True
+                        break
+                    try:
+                        job = next(jobs_iterator)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    in_flight[asyncio.create_task(self._worker(job))] = job
+                if not in_flight:
+                    break
+                done, _ = await asyncio.wait(
+                    in_flight, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    job = in_flight.pop(task)
+                    result = task.result()
+                    if on_done:
+                        await on_done(job, result)
+        finally:
+            if in_flight:
+                logger.info("Cancelling %s unfinished jobs", len(in_flight))
+                for task in in_flight:
+                    task.cancel()
+                await asyncio.gather(*in_flight, return_exceptions=True)
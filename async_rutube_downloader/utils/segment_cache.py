@@ -0,0 +1,257 @@
+import asyncio
+import hashlib
+import sqlite3
+import time
+import uuid
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager, suppress
+from pathlib import Path, PurePosixPath
+from urllib.parse import urlsplit
+
+import aiofiles
+import aiofiles.os
+from aiofiles.threadpool.binary import AsyncBufferedIOBase
+
+from async_rutube_downloader.settings import SEGMENT_CACHE_SIZE
+from async_rutube_downloader.utils.logger import get_logger
+from async_rutube_downloader.utils.miscellaneous import get_cache_directory
+from async_rutube_downloader.utils.sqlite import SQLiteDatabase
+
+logger = get_logger(__name__)
+
+SEGMENT_CACHE_DIRECTORY = "segments"
+INDEX_FILE = "index.sqlite3"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS segments_used_at ON segments (used_at);
+-- Bytes of all segments, kept by the triggers, eviction doesn't sum them.
+CREATE TABLE IF NOT EXISTS total (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO total SELECT 0, COALESCE(SUM(size), 0) FROM segments;
+CREATE TRIGGER IF NOT EXISTS segments_inserted AFTER INSERT ON segments
+BEGIN
+    UPDATE total SET size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS segments_updated AFTER UPDATE OF size ON segments
+BEGIN
+    UPDATE total SET size = size - OLD.size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS segments_deleted AFTER DELETE ON segments
+BEGIN
+    UPDATE total SET size = size - OLD.size;
+END;
+"""
+
+
+def segment_key(video_id: str, quality: tuple[int, int], uri: str) -> str:
+    """
+    Key of a segment, the same on every mirror and after the playlist
+    URLs are signed again: only the file name of the URI is used.
+    """
+    name = PurePosixPath(urlsplit(uri).path).name
+    width, height = quality
+    return hashlib.sha256(
+        f"{video_id}/{width}x{height}/{name}".encode()
+    ).hexdigest()
+
+
+class SegmentCacheEntry:
+    """
+    A segment streamed to a temporary file, see `SegmentCache.entry`.
+    A failed write is logged and drops the segment from the cache.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.size = 0
+        self._file: AsyncBufferedIOBase | None = None
+        self._failed = False
+
+    async def write(self, data: bytes) -> None:
+        if self._failed:
+            return
+        try:
+            if self._file is None:
+                await aiofiles.os.makedirs(self.path.parent, exist_ok=True)
+                self._file = await aiofiles.open(self.path, mode="wb")
+            await self._file.write(data)
+        except OSError:
+            logger.info("Segment cache is unavailable", exc_info=True)
+            self._failed = True
+        else:
+            self.size += len(data)
+
+    async def close(self) -> bool:
+        """
+        Returns:
+            Whether the whole segment is in the file.
+        """
+        if self._file is None:
+            return False
+        try:
+            await self._file.close()
+        except OSError:
+            logger.info("Segment cache is unavailable", exc_info=True)
+            self._failed = True
+        self._file = None
+        return not self._failed
+
+    async def discard(self) -> None:
+        await self.close()
+        self._failed = True
+        with suppress(OSError):
+            await aiofiles.os.remove(self.path)
+
+
+class SegmentCache:
+    """
+    On-disk cache of video segments, shared by downloads and processes.
+
+    Every segment is a file named by its key, see `segment_key`.
+    A SQLite index keeps their sizes and last use, when the files are
+    bigger than `max_size` bytes, least recently used ones are evicted.
+    Files are written to a temporary name and renamed, so a reader
+    never sees a partial segment. Queries run in a thread,
+    files are read and written outside of them.
+
+    Usage:
+        cache = SegmentCache()
+        key = segment_key(video_id, quality, segment.uri)
+        data = await cache.get(key)
+        if data is None:
+            async with cache.entry(key) as entry:
+                async for chunk in download(segment):
+                    await entry.write(chunk)
+    """
+
+    def __init__(
+        self,
+        directory: Path | None = None,
+        max_size: int = SEGMENT_CACHE_SIZE,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """
+        Args:
+            directory: Created if missing.
+                Defaults to a directory in the user cache directory.
+            max_size: Bytes of segments kept, `0` means unlimited.
+            clock: Returns the current Unix time.
+        """
+        self.directory = directory or (
+            get_cache_directory() / SEGMENT_CACHE_DIRECTORY
+        )
+        self._database = SQLiteDatabase(self.directory / INDEX_FILE, SCHEMA)
+        self._max_size = max_size
+        self._clock = clock
+
+    async def get(self, key: str) -> bytes | None:
+        """
+        The segment, `None` if it's missing.
+        A broken cache is a miss, it never fails the download.
+        """
+        try:
+            size = await self._database.run(self._touch, key)
+            if size is None:
+                return None
+            data = await asyncio.to_thread(self.__read, key)
+            if data is None or len(data) != size:
+                # Removed or damaged by something else than the cache.
+                await self._database.run(self._remove, key)
+                return None
+        except (sqlite3.Error, OSError):
+            logger.info("Segment cache is unavailable", exc_info=True)
+            return None
+        return data
+
+    @asynccontextmanager
+    async def entry(self, key: str) -> AsyncIterator[SegmentCacheEntry]:
+        """
+        Stream a segment to the cache, it's added if the block
+        doesn't raise. A broken cache never fails the download.
+        """
+        path = self.__path(key)
+        entry = SegmentCacheEntry(
+            path.with_name(f"{key}.{uuid.uuid4().hex}.tmp")
+        )
+        try:
+            yield entry
+        except BaseException:
+            await entry.discard()
+            raise
+        try:
+            if await entry.close():
+                await aiofiles.os.replace(entry.path, path)
+                await self._database.run(self._add, key, entry.size)
+        except (sqlite3.Error, OSError):
+            logger.info("Segment cache is unavailable", exc_info=True)
+        finally:
+            await entry.discard()
+
+    async def put(self, key: str, data: bytes) -> None:
+        async with self.entry(key) as entry:
+            await entry.write(data)
+
+    def close(self) -> None:
+        self._database.close()
+
+    def _touch(self, connection: sqlite3.Connection, key: str) -> int | None:
+        """Mark the segment as used, returns its size."""
+        row = connection.execute(
+            "SELECT size FROM segments WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE segments SET used_at = ? WHERE key = ?",
+            (self._clock(), key),
+        )
+        return row[0]
+
+    def _add(
+        self, connection: sqlite3.Connection, key: str, size: int
+    ) -> None:
+        connection.execute(
+            "INSERT INTO segments VALUES (?, ?, ?) ON CONFLICT (key)"
+            " DO UPDATE SET size = excluded.size, used_at = excluded.used_at",
+            (key, size, self._clock()),
+        )
+        self.__evict(connection)
+
+    def _remove(self, connection: sqlite3.Connection, key: str) -> None:
+        self.__path(key).unlink(missing_ok=True)
+        connection.execute("DELETE FROM segments WHERE key = ?", (key,))
+
+    def __path(self, key: str) -> Path:
+        """Segments are spread over subdirectories by the key prefix."""
+        return self.directory / key[:2] / key
+
+    def __read(self, key: str) -> bytes | None:
+        try:
+            return self.__path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def __evict(self, connection: sqlite3.Connection) -> None:
+        """Remove least recently used segments,
+        until they fit into `max_size`."""
+        if not self._max_size:
+            return
+        (total,) = connection.execute("SELECT size FROM total").fetchone()
+        if total <= self._max_size:
+            return
+        evicted = 0
+        for key, size in connection.execute(
+            "SELECT key, size FROM segments ORDER BY used_at"
+        ).fetchall():
+            if total <= self._max_size:
+                break
+            self._remove(connection, key)
+            total -= size
+            evicted += 1
+        logger.debug("Evicted %s segments from the cache", evicted)
@@ -0,0 +1,301 @@
+import asyncio
+import itertools
+import os
+from collections import defaultdict
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
+from contextlib import (
+    AbstractAsyncContextManager,
+    asynccontextmanager,
+    nullcontext,
+)
+from enum import StrEnum
+from pathlib import Path
+from typing import Self
+
+from aiofiles.threadpool.binary import AsyncBufferedIOBase
+
+from async_rutube_downloader.utils import metrics
+from async_rutube_downloader.utils.exceptions import SegmentSizeError
+
+type OnCommit = Callable[[int, int, int], Awaitable[None]]
+# Entered while a write waits for space in the reorder buffer.
+type Idle = Callable[[], AbstractAsyncContextManager[object]]
+
+
+class WriteMode(StrEnum):
+    # Segments are appended to the file in playlist order.
+    ordered = "ordered"
+    # Segments are written at their final offsets in any order,
+    # requires sizes of all segments, falls back to `ordered`.
+    positional = "positional"
+
+
+class OrderedSegmentWriter:
+    """
+    Streams video segments to a file in playlist order.
+
+    Chunks of the head-of-line segment (the first one that is not
+    written yet) go straight to the file as they arrive.
+    Chunks of the segments after it are kept in a reorder buffer
+    until all their predecessors are committed.
+
+    The reorder buffer is capped by `max_buffered_bytes`: when it is full,
+    writes of other segments wait until the head-of-line segment
+    is committed. The head itself never waits, so the download
+    always makes progress.
+
+    Usage:
+        writer = OrderedSegmentWriter(file, max_buffered_bytes=2**20)
+        await writer.wait_for_space(index)  # before starting a request
+        await writer.reset(index)  # before every download attempt
+        await writer.write(index, chunk)
+        await writer.commit(index)  # when the segment is complete
+    """
+
+    def __init__(
+        self,
+        file: AsyncBufferedIOBase,
+        first_index: int = 0,
+        max_buffered_bytes: int | None = None,
+        first_offset: int = 0,
+        on_commit: OnCommit | None = None,
+    ):
+        """
+        Args:
+            file: Binary file opened for writing.
+            first_index: Index of the segment to be written first.
+            max_buffered_bytes: Cap of the reorder buffer,
+                `None` means unlimited.
+            first_offset: File position of the first segment.
+            on_commit: Awaited with index, offset and size of every
+                segment, once it's written and flushed to the file.
+        """
+        self._file = file
+        self._head = first_index
+        self._head_offset = first_offset
+        self._max_buffered_bytes = max_buffered_bytes
+        self._on_commit = on_commit
+        # Bytes of the head segment already written to the file,
+        # needed to roll them back if the download is retried.
+        self._head_written = 0
+        self._pending: defaultdict[int, list[bytes]] = defaultdict(list)
+        self._completed: set[int] = set()
+        self._state_changed = asyncio.Condition()
+        self.buffered_bytes = 0
+        self.peak_buffered_bytes = 0
+
+    @property
+    def head(self) -> int:
+        """Index of the first segment that is not written yet."""
+        return self._head
+
+    async def wait_for_space(self, index: int) -> None:
+        """Wait until the reorder buffer can accept data for the segment."""
+        async with self._state_changed:
+            await self._state_changed.wait_for(
+                lambda: index == self._head
+                or self._max_buffered_bytes is None
+                or self.buffered_bytes < self._max_buffered_bytes
+            )
+
+    async def reset(self, index: int) -> None:
+        """Discard everything received for the segment so far."""
+        async with self._state_changed:
+            if index == self._head and self._head_written:
+                await self._file.seek(self._head_offset)
+                await self._file.truncate()
+                self._head_written = 0
+            if chunks := self._pending.pop(index, None):
+                self.buffered_bytes -= sum(len(chunk) for chunk in chunks)
+                self._state_changed.notify_all()
+
+    async def write(
+        self, index: int, chunk: bytes, idle: Idle = nullcontext
+    ) -> None:
+        """
+        Args:
+            idle: Entered while the write waits for space in the reorder
+                buffer, outside of the writer lock. Gives up what
+                the head-of-line segment may need meanwhile,
+                like a request slot.
+        """
+        while True:
+            async with self._state_changed:
+                if self.__fits(index, len(chunk)):
+                    if index == self._head:
+                        with metrics.write_latency.time():
+                            await self._file.write(chunk)
+                        self._head_written += len(chunk)
+                    else:
+                        self._pending[index].append(chunk)
+                        self.buffered_bytes += len(chunk)
+                        self.peak_buffered_bytes = max(
+                            self.peak_buffered_bytes, self.buffered_bytes
+                        )
+                    return
+            async with idle(), self._state_changed:
+                await self._state_changed.wait_for(
+                    lambda: self.__fits(index, len(chunk))
+                )
+
+    async def commit(self, index: int) -> None:
+        """Mark the segment as complete and flush every segment
+        that is ready to be written after it."""
+        async with self._state_changed:
+            self._completed.add(index)
+            if self._head not in self._completed:
+                return
+            while self._head in self._completed:
+                self._completed.remove(self._head)
+                if self._on_commit:
+                    with metrics.write_latency.time():
+                        await self._file.flush()
+                    await self._on_commit(
+                        self._head, self._head_offset, self._head_written
+                    )
+                self._head_offset += self._head_written
+                self._head += 1
+                self._head_written = 0
+                for chunk in self._pending.pop(self._head, ()):
+                    with metrics.write_latency.time():
+                        await self._file.write(chunk)
+                    self._head_written += len(chunk)
+                    self.buffered_bytes -= len(chunk)
+            self._state_changed.notify_all()
+
+    def __fits(self, index: int, size: int) -> bool:
+        return (
+            index == self._head
+            or self._max_buffered_bytes is None
+            # A single chunk bigger than the cap is still accepted.
+            or not self.buffered_bytes
+            or self.buffered_bytes + size <= self._max_buffered_bytes
+        )
+
+
+class PositionalSegmentWriter:
+    """
+    Writes every segment at its final offset as soon as data arrives.
+
+    Sizes of all segments must be known up front. The file is
+    preallocated and chunks are written with `os.pwrite` on worker
+    threads, so segments are written in any order and in parallel,
+    without a reorder buffer. Has the same interface
+    as `OrderedSegmentWriter`.
+
+    Usage:
+        async with PositionalSegmentWriter.open(path, sizes) as writer:
+            await writer.reset(index)  # before every download attempt
+            await writer.write(index, chunk)
+            await writer.commit(index)  # when the segment is complete
+    """
+
+    def __init__(
+        self,
+        fd: int,
+        sizes: Sequence[int],
+        on_commit: OnCommit | None = None,
+    ) -> None:
+        """
+        Args:
+            fd: File descriptor opened for writing.
+            sizes: Size of every segment in bytes.
+            on_commit: Awaited with index, offset and size of every
+                segment, once it's completely written to the file.
+        """
+        self._fd = fd
+        self._sizes = sizes
+        self._offsets = list(itertools.accumulate(sizes, initial=0))
+        self._written: defaultdict[int, int] = defaultdict(int)
+        # A thread can't be cancelled, writes of cancelled segments
+        # keep running and must finish before the file is closed.
+        self._writes: set[asyncio.Future[None]] = set()
+        self._on_commit = on_commit
+        self.total_size = self._offsets.pop()
+
+    @classmethod
+    @asynccontextmanager
+    async def open(
+        cls,
+        path: Path,
+        sizes: Sequence[int],
+        on_commit: OnCommit | None = None,
+    ) -> AsyncIterator[Self]:
+        """
+        Open the file, keeping its content up to `total_size`,
+        and preallocate it.
+        """
+        fd = await asyncio.to_thread(os.open, path, os.O_RDWR | os.O_CREAT)
+        writer = cls(fd, sizes, on_commit)
+        try:
+            await asyncio.to_thread(writer.__preallocate)
+            yield writer
+        finally:
+            await asyncio.gather(*writer._writes, return_exceptions=True)
+            await asyncio.to_thread(os.close, fd)
+
+    @staticmethod
+    def is_supported() -> bool:
+        """`os.pwrite` is not available on Windows."""
+        return hasattr(os, "pwrite")
+
+    def layout(self, index: int) -> tuple[int, int]:
+        """Returns: offset and size of the segment."""
+        return self._offsets[index], self._sizes[index]
+
+    async def wait_for_space(self, index: int) -> None:
+        """Nothing is buffered, so there is always space."""
+
+    async def reset(self, index: int) -> None:
+        """Start writing the segment from its beginning."""
+        self._written.pop(index, None)
+
+    async def write(
+        self, index: int, chunk: bytes, idle: Idle = nullcontext
+    ) -> None:
+        """Never waits for space, `idle` is for the same interface
+        as `OrderedSegmentWriter`."""
+        written = self._written[index]
+        if written + len(chunk) > self._sizes[index]:
+            raise SegmentSizeError(index)
+        self._written[index] += len(chunk)
+        future = asyncio.ensure_future(
+            asyncio.to_thread(
+                self.__pwrite, chunk, self._offsets[index] + written
+            )
+        )
+        self._writes.add(future)
+        future.add_done_callback(self._writes.discard)
+        await asyncio.shield(future)
+
+    async def commit(self, index: int) -> None:
+        if self._written.pop(index, 0) != self._sizes[index]:
+            raise SegmentSizeError(index)
+        if self._on_commit:
+            await self._on_commit(index, *self.layout(index))
+
+    def __pwrite(self, chunk: bytes, offset: int) -> None:
+        view = memoryview(chunk)
+        with metrics.write_latency.time():
+            while view:
+                written = os.pwrite(self._fd, view, offset)
+                view = view[written:]
+                offset += written
+
+    def __preallocate(self) -> None:
+        # A stale `.part` file may be longer, its tail would stay.
+        if os.fstat(self._fd).st_size > self.total_size:
+            os.ftruncate(self._fd, self.total_size)
+        if hasattr(os, "posix_fallocate") and self.total_size:
+            try:
+                os.posix_fallocate(self._fd, 0, self.total_size)
+            except OSError:
+                # Not supported by the file system.
+                pass
+            else:
+                return
+        if os.fstat(self._fd).st_size < self.total_size:
+            os.ftruncate(self._fd, self.total_size)
+
+
+type SegmentWriter = OrderedSegmentWriter | PositionalSegmentWriter
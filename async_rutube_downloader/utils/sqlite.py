@@ -0,0 +1,70 @@
+import asyncio
+import sqlite3
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Concatenate
+
+
+class SQLiteDatabase:
+    """
+    SQLite database used from the event loop: queries run in a thread
+    of the default executor, one at a time, every query is a transaction.
+
+    Usage:
+        database = SQLiteDatabase(path, "CREATE TABLE IF NOT EXISTS ...")
+
+        def count(connection: sqlite3.Connection) -> int:
+            return connection.execute("SELECT COUNT(*) FROM ...").fetchone()[0]
+
+        await database.run(count)
+    """
+
+    def __init__(self, path: Path, schema: str) -> None:
+        """
+        Args:
+            path: The database file, created with its directory if missing.
+            schema: SQL script run when the database is opened.
+        """
+        self.path = path
+        self._schema = schema
+        self._connection: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    async def run[**P, T](
+        self,
+        query: Callable[Concatenate[sqlite3.Connection, P], T],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> T:
+        """
+        Call `query(connection, *args, **kwargs)` in a thread,
+        its changes are committed, or rolled back if it raises.
+        """
+        return await asyncio.to_thread(self.run_sync, query, *args, **kwargs)
+
+    def run_sync[**P, T](
+        self,
+        query: Callable[Concatenate[sqlite3.Connection, P], T],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> T:
+        """`run` in the calling thread, it blocks."""
+        with self._lock, self.__connect() as connection:
+            return query(connection, *args, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    def __connect(self) -> sqlite3.Connection:
+        """The connection, opened on first use."""
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False
+            )
+            self._connection.executescript(self._schema)
+        return self._connection
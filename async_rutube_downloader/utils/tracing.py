@@ -0,0 +1,250 @@
+import json
+import time
+from collections.abc import Callable
+from enum import StrEnum
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+from weakref import WeakKeyDictionary
+
+from aiohttp import (
+    ClientSession,
+    TraceConfig,
+    TraceConnectionCreateEndParams,
+    TraceConnectionCreateStartParams,
+    TraceConnectionQueuedEndParams,
+    TraceConnectionQueuedStartParams,
+    TraceDnsResolveHostEndParams,
+    TraceDnsResolveHostStartParams,
+    TraceRequestEndParams,
+    TraceRequestHeadersSentParams,
+    TraceRequestStartParams,
+    TraceResponseChunkReceivedParams,
+)
+
+from async_rutube_downloader.utils import metrics
+from async_rutube_downloader.utils.metrics import Distribution, MetricsRegistry
+
+
+class Phase(StrEnum):
+    # Waiting for a free connection of the pool.
+    queue = "queue"
+    dns = "dns"
+    # TCP and TLS handshakes, aiohttp reports them as one step.
+    connect = "connect"
+    # From the request headers sent to the response headers received.
+    ttfb = "ttfb"
+    # From the response headers to the last byte of the body.
+    body = "body"
+
+
+class PhaseTimings:
+    """Durations of request phases per host, taken from a `PhaseTracer`."""
+
+    def __init__(
+        self, hosts: dict[str, dict[Phase, Distribution]] | None = None
+    ) -> None:
+        self.hosts = hosts or {}
+
+    def since(self, earlier: "PhaseTimings") -> "PhaseTimings":
+        """Timings recorded after `earlier` was taken."""
+        timings = PhaseTimings()
+        for host, phases in self.hosts.items():
+            for phase, stats in phases.items():
+                before = earlier.hosts.get(host, {}).get(phase)
+                difference = stats - before if before else stats
+                if difference.count:
+                    timings.hosts.setdefault(host, {})[phase] = difference
+        return timings
+
+    def to_dict(self) -> dict[str, dict[str, dict[str, Any]]]:
+        return {
+            host: {
+                phase: stats.to_dict()
+                for phase, stats in sorted(phases.items())
+            }
+            for host, phases in self.hosts.items()
+        }
+
+    def dump(self, path: Path) -> None:
+        path.write_text(json.dumps(self.to_dict(), indent=2))
+
+    def summary(self) -> list[str]:
+        """
+        A line per host, mean and 95th percentile of every phase:
+        `cdn.example.com, 40 requests: dns 3/10 ms, ttfb 80/250 ms`
+        """
+        lines = []
+        for host, phases in self.hosts.items():
+            requests = phases[Phase.ttfb].count if Phase.ttfb in phases else 0
+            durations = ", ".join(
+                f"{phase} {stats.mean * 1000:.0f}"
+                f"/{stats.quantile(0.95) * 1000:.0f} ms"
+                for phase in Phase
+                if (stats := phases.get(phase))
+            )
+            lines.append(f"{host}, {requests} requests: {durations}")
+        return lines
+
+
+class PhaseTracer:
+    """
+    Records phases of every request of a session, see `Phase`,
+    with aiohttp tracing. Pass `trace_config()` to the session.
+
+    A body read with `response.read()` or `text()` is timed here,
+    a streamed one by its reader with `record`, aiohttp doesn't
+    report chunks of streamed bodies.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic) -> None:
+        # Recorded even when `process_metrics` are not exported.
+        registry = MetricsRegistry()
+        registry.enabled = True
+        self._histogram = registry.histogram(
+            metrics.request_phases.name,
+            metrics.request_phases.documentation,
+            metrics.request_phases.buckets[:-1],
+            metrics.request_phases.label_names,
+        )
+        self._clock = clock
+
+    @property
+    def timings(self) -> PhaseTimings:
+        """Timings recorded so far, they don't change afterwards."""
+        timings = PhaseTimings()
+        for (host, phase), stats in self._histogram.series().items():
+            timings.hosts.setdefault(host, {})[Phase(phase)] = stats
+        return timings
+
+    def record(self, host: str, phase: Phase, seconds: float) -> None:
+        seconds = max(seconds, 0.0)
+        self._histogram.observe(seconds, host=host, phase=phase)
+        metrics.request_phases.observe(seconds, host=host, phase=phase)
+
+    def trace_config(self) -> TraceConfig:
+        config = TraceConfig()
+        config.on_request_start.append(self._on_request_start)
+        config.on_connection_queued_start.append(self._on_queued_start)
+        config.on_connection_queued_end.append(self._on_queued_end)
+        config.on_dns_resolvehost_start.append(self._on_dns_start)
+        config.on_dns_resolvehost_end.append(self._on_dns_end)
+        config.on_connection_create_start.append(self._on_connect_start)
+        config.on_connection_create_end.append(self._on_connect_end)
+        config.on_request_headers_sent.append(self._on_headers_sent)
+        config.on_request_end.append(self._on_request_end)
+        config.on_response_chunk_received.append(self._on_chunk_received)
+        return config
+
+    async def _on_request_start(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceRequestStartParams,
+    ) -> None:
+        context.host = params.url.host or ""
+        context.sent_at = context.response_at = None
+        context.dns = 0.0
+
+    async def _on_queued_start(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceConnectionQueuedStartParams,
+    ) -> None:
+        context.queued_at = self._clock()
+
+    async def _on_queued_end(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceConnectionQueuedEndParams,
+    ) -> None:
+        self.record(
+            context.host, Phase.queue, self._clock() - context.queued_at
+        )
+
+    async def _on_dns_start(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceDnsResolveHostStartParams,
+    ) -> None:
+        context.resolving_at = self._clock()
+
+    async def _on_dns_end(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceDnsResolveHostEndParams,
+    ) -> None:
+        context.dns = self._clock() - context.resolving_at
+        self.record(context.host, Phase.dns, context.dns)
+
+    async def _on_connect_start(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceConnectionCreateStartParams,
+    ) -> None:
+        context.connecting_at = self._clock()
+
+    async def _on_connect_end(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceConnectionCreateEndParams,
+    ) -> None:
+        # Host names are resolved while the connection is created.
+        self.record(
+            context.host,
+            Phase.connect,
+            self._clock() - context.connecting_at - context.dns,
+        )
+
+    async def _on_headers_sent(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceRequestHeadersSentParams,
+    ) -> None:
+        context.sent_at = self._clock()
+
+    async def _on_request_end(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceRequestEndParams,
+    ) -> None:
+        context.response_at = self._clock()
+        if context.sent_at is not None:
+            self.record(
+                context.host, Phase.ttfb, context.response_at - context.sent_at
+            )
+
+    async def _on_chunk_received(
+        self,
+        session: ClientSession,
+        context: SimpleNamespace,
+        params: TraceResponseChunkReceivedParams,
+    ) -> None:
+        # `read()` reports the whole body as one chunk.
+        if context.response_at is not None:
+            self.record(
+                context.host, Phase.body, self._clock() - context.response_at
+            )
+
+
+_session_tracers: WeakKeyDictionary[ClientSession, PhaseTracer] = (
+    WeakKeyDictionary()
+)
+
+
+def install_tracer(tracer: PhaseTracer, session: ClientSession) -> None:
+    """Make the tracer of the session available with `get_tracer`."""
+    _session_tracers[session] = tracer
+
+
+def get_tracer(session: ClientSession) -> PhaseTracer | None:
+    """`None` if the session doesn't trace request phases."""
+    return _session_tracers.get(session)
@@ -1,6 +1,19 @@
 from pathlib import Path
 
-from async_rutube_downloader.utils.exceptions import OutputDirectoryError
+from async_rutube_downloader.settings import (
+    MAX_CONCURRENCY,
+    MAX_JOBS,
+    MAX_PORT,
+    RATE_SUFFIXES,
+)
+from async_rutube_downloader.utils.exceptions import (
+    CLIConcurrencyError,
+    CLIJobsError,
+    CLIPortError,
+    CLIRateError,
+    CLISizeError,
+    OutputDirectoryError,
+)
 
 
 def cli_quality_validator(
@@ -42,6 +55,57 @@ def cli_validate_path(output: str) -> Path:
     return path
 
 
+def cli_validate_concurrency(concurrency: str) -> int:
+    if concurrency.isdecimal() and 1 <= int(concurrency) <= MAX_CONCURRENCY:
+        return int(concurrency)
+    raise CLIConcurrencyError(concurrency)
+
+
+def cli_validate_jobs(jobs: str) -> int:
+    if jobs.isdecimal() and 1 <= int(jobs) <= MAX_JOBS:
+        return int(jobs)
+    raise CLIJobsError(jobs)
+
+
+def cli_validate_port(port: str) -> int:
+    if port.isdecimal() and 1 <= int(port) <= MAX_PORT:
+        return int(port)
+    raise CLIPortError(port)
+
+
+def cli_validate_rate(rate: str) -> int:
+    """
+    Bytes per second, with an optional suffix: `500K`, `1.5M`, `1G`.
+    """
+    result = parse_bytes(rate)
+    if result is None:
+        raise CLIRateError(rate)
+    return result
+
+
+def cli_validate_size(size: str) -> int:
+    """Bytes, with an optional suffix: `500M`, `2G`."""
+    result = parse_bytes(size)
+    if result is None:
+        raise CLISizeError(size)
+    return result
+
+
+def parse_bytes(text: str) -> int | None:
+    """
+    Positive number of bytes with an optional K, M or G suffix,
+    `None` if it's invalid.
+    """
+    value, suffix = text.strip(), ""
+    if value and value[-1].upper() in RATE_SUFFIXES:
+        value, suffix = value[:-1], value[-1].upper()
+    try:
+        result = int(float(value) * RATE_SUFFIXES[suffix])
+    except (ValueError, OverflowError):
+        return None
+    return result if result > 0 else None
+
+
 def is_quality_valid(selected_quality: tuple[int, int]) -> bool:
     if (
         isinstance(selected_quality, tuple)
@@ -0,0 +1,105 @@
+"""
+Benchmark of parallel range requests for big segments.
+
+A local server stands in for the CDN. It emulates a high-latency link:
+every response starts after one round trip and a single stream sends
+at most `WINDOW` bytes per round trip, like TCP with a fixed window.
+Every segment is downloaded with one request and with
+`RANGE_PARTS` range requests, the table shows when splitting helps.
+
+Usage:
+    python -m benchmarks.range_requests
+"""
+
+import asyncio
+import time
+from collections.abc import Iterable
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+
+from async_rutube_downloader.settings import RANGE_PARTS, SEGMENT_READ_SIZE
+from async_rutube_downloader.utils.ranges import read_in_ranges
+
+MIB = 1024 * 1024
+# Bytes a single stream sends per round trip.
+WINDOW = 256 * 1024
+SEGMENT_SIZES = (MIB // 2, 2 * MIB, 8 * MIB)
+ROUND_TRIPS = (0.005, 0.05, 0.15)
+REPEATS = 3
+
+
+def create_app(body: bytes, round_trip: float) -> web.Application:
+    async def segment(request: web.Request) -> web.StreamResponse:
+        await asyncio.sleep(round_trip)
+        requested = request.http_range
+        start = requested.start or 0
+        part = body[requested]
+        response = web.StreamResponse(
+            status=206 if requested.start is not None else 200,
+            headers={"Accept-Ranges": "bytes"},
+        )
+        response.content_length = len(part)
+        if requested.start is not None:
+            response.headers["Content-Range"] = (
+                f"bytes {start}-{start + len(part) - 1}/{len(body)}"
+            )
+        await response.prepare(request)
+        for offset in range(0, len(part), WINDOW):
+            await response.write(part[offset : offset + WINDOW])
+            await asyncio.sleep(round_trip)
+        return response
+
+    app = web.Application()
+    app.router.add_get("/segment.ts", segment)
+    return app
+
+
+async def no_limit(size: int) -> None: ...
+
+
+async def download(session: ClientSession, url: str, parts: int) -> int:
+    async with session.get(url) as response:
+        if parts > 1:
+            return len(
+                await read_in_ranges(response, session, url, parts, no_limit)
+            )
+        size = 0
+        async for chunk in response.content.iter_chunked(SEGMENT_READ_SIZE):
+            size += len(chunk)
+        return size
+
+
+async def measure(session: ClientSession, url: str, parts: int) -> float:
+    """Returns: the best time of `REPEATS` downloads, in seconds."""
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        await download(session, url, parts)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+async def run(
+    segment_sizes: Iterable[int], round_trips: Iterable[float]
+) -> None:
+    print(
+        f"{'segment':>8} {'rtt':>6} {'single':>8} "
+        f"{f'{RANGE_PARTS} ranges':>9} {'speedup':>8}"
+    )
+    for size in segment_sizes:
+        body = bytes(size)
+        for round_trip in round_trips:
+            app = create_app(body, round_trip)
+            async with TestServer(app) as server, ClientSession() as session:
+                url = str(server.make_url("/segment.ts"))
+                single = await measure(session, url, 1)
+                split = await measure(session, url, RANGE_PARTS)
+            print(
+                f"{size / MIB:>6.1f}Mi {round_trip * 1000:>4.0f}ms"
+                f" {single:>7.3f}s {split:>8.3f}s {single / split:>7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(run(SEGMENT_SIZES, ROUND_TRIPS))
@@ -1,8 +1,8 @@
 import json
-from collections.abc import Callable
+from collections.abc import AsyncIterator, Callable
 from pathlib import Path
 from typing import Final
-from unittest.mock import AsyncMock, create_autospec
+from unittest.mock import AsyncMock, MagicMock, create_autospec
 
 import pytest
 from aiohttp import ClientSession
@@ -39,6 +39,13 @@ EXCEPTION_TO_RAISE = RetryTestError
 RETRY_ON_EXCEPTION = RetryTestRaisingError
 MAX_RETRIES = 4
 RETRY_DELAY = 0.01
+# Body of every mocked segment response, split into chunks.
+SEGMENT_CHUNKS: Final[tuple[bytes, ...]] = (b"seg", b"ment")
+
+
+async def iterate_chunks(chunks: tuple[bytes, ...]) -> AsyncIterator[bytes]:
+    for chunk in chunks:
+        yield chunk
 
 
 @pytest.fixture(scope="function")
@@ -53,7 +60,12 @@ def get_response_mock(mocked_session: AsyncMock) -> AsyncMock:
     Modify this fixture to return different responses for different tests."""
     get_response_mock = AsyncMock(name="get_method_response_fixture")
     get_response_mock.__aenter__.return_value = get_response_mock
+    get_response_mock.content.iter_chunked = MagicMock(
+        side_effect=lambda _: iterate_chunks(SEGMENT_CHUNKS)
+    )
+    get_response_mock.content_length = len(b"".join(SEGMENT_CHUNKS))
     mocked_session.get.return_value = get_response_mock
+    mocked_session.head.return_value = get_response_mock
     return get_response_mock
 
 
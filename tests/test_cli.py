@@ -1,38 +1,35 @@
 import sys
 from argparse import Namespace, RawDescriptionHelpFormatter
 from pathlib import Path
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import AsyncMock, patch
 
 import pytest
+from aiohttp import ClientConnectionError
 
 from async_rutube_downloader.run_cli import (
     CLI_DESCRIPTION,
     CLI_EPILOG,
     CLI_NAME,
     REPORT_MULTIPLE_URLS,
-    WIDTH_OF_PROGRESS_BAR,
     CLIDownloader,
     create_parser,
-    create_progress_bar,
     parse_args,
 )
 from async_rutube_downloader.run_cli import main as cli_main
 from async_rutube_downloader.settings import (
     AVAILABLE_QUALITIES,
+    CHUNK_SIZE,
     DOWNLOAD_DIR,
     SELECT_QUALITY,
+    SERVER_UNAVAILABLE_MSG,
     FULL_HD_1080p,
     HD_720p,
 )
+from async_rutube_downloader.ui import SEGMENT_DOWNLOAD_ERROR_MSG
+from async_rutube_downloader.utils.cancellation import CancelPolicy
 from tests.conftest import RUTUBE_ID
 
 
-def test_create_progress_bar() -> None:
-    progress_bar = create_progress_bar()
-    assert len(progress_bar) == WIDTH_OF_PROGRESS_BAR
-    assert all(char == " " for char in progress_bar)
-
-
 def test_create_parser() -> None:
     parser = create_parser()
     assert parser.description == CLI_DESCRIPTION
@@ -47,11 +44,17 @@ def test_create_parser() -> None:
         (f"https://rutube.ru/video/{RUTUBE_ID}/", []),
         (RUTUBE_ID, []),
         (RUTUBE_ID, ["-q"]),
+        (RUTUBE_ID, ["--low-memory"]),
+        (RUTUBE_ID, ["-c", "5", "--adaptive-concurrency"]),
+        (RUTUBE_ID, ["--limit-rate", "2M"]),
+        (RUTUBE_ID, ["--split-segments", "--async-dns"]),
+        (RUTUBE_ID, ["--on-cancel", "discard"]),
         (RUTUBE_ID, ["-o", str(Path.cwd())]),
         (RUTUBE_ID, ["-d", ";"]),
         (RUTUBE_ID, ["-f", "./path/to/file"]),
         (RUTUBE_ID, ["-f", "./path/to/file", "-q"]),
         (RUTUBE_ID, ["-f", "./path/to/file", "-d", ";"]),
+        (RUTUBE_ID, ["-f", "./path/to/file", "-j", "3"]),
         (RUTUBE_ID, ["-f", "./path/to/file", "-d", ";", "-q"]),
         (
             RUTUBE_ID,
@@ -75,6 +78,30 @@ def test_parse_args(
     assert cli_args.url == url
     assert cli_args.output == Path.cwd()
     assert cli_args.quality is ("-q" in optional_arg)
+    assert cli_args.low_memory is ("--low-memory" in optional_arg)
+    assert cli_args.adaptive_concurrency is (
+        "--adaptive-concurrency" in optional_arg
+    )
+    assert cli_args.concurrency == (
+        int(optional_arg[optional_arg.index("-c") + 1])
+        if "-c" in optional_arg
+        else CHUNK_SIZE
+    )
+    assert cli_args.on_cancel is (
+        CancelPolicy.discard
+        if "--on-cancel" in optional_arg
+        else CancelPolicy.keep
+    )
+    assert cli_args.jobs == (
+        int(optional_arg[optional_arg.index("-j") + 1])
+        if "-j" in optional_arg
+        else 1
+    )
+    assert cli_args.async_dns is ("--async-dns" in optional_arg)
+    assert cli_args.split_segments is ("--split-segments" in optional_arg)
+    assert cli_args.limit_rate == (
+        2 * 1024 * 1024 if "--limit-rate" in optional_arg else None
+    )
     assert (
         cli_args.file is None
         if "-f" not in optional_arg
@@ -137,6 +164,70 @@ def test_cli_download_from_file(
     assert captured.err == ""
 
 
+@pytest.mark.parametrize("server", (None, "http://127.0.0.1:1"))
+def test_connection_error_message(
+    server: str | None,
+    cli_single_url_fixture: None,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    if server:
+        monkeypatch.setattr("sys.argv", [*sys.argv, "--server", server])
+    with (
+        patch(
+            "async_rutube_downloader.run_cli.CLIDownloader"
+            ".download_single_video",
+            side_effect=ClientConnectionError,
+        ),
+        patch(
+            "async_rutube_downloader.run_cli.CLIDownloader"
+            ".download_with_server",
+            side_effect=ClientConnectionError,
+        ),
+    ):
+        cli_main()
+    expected = (
+        SERVER_UNAVAILABLE_MSG.format(server)
+        if server
+        else SEGMENT_DOWNLOAD_ERROR_MSG
+    )
+    assert expected in capsys.readouterr().out
+
+
+def test_parse_args_jobs_with_quality(
+    monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    test_args = ["async_rutube_downloader", "-f", "file", "-j", "2", "-q"]
+    monkeypatch.setattr("sys.argv", test_args)
+    with pytest.raises(SystemExit):
+        parse_args(create_parser())
+    assert "--jobs" in capsys.readouterr().err
+
+
+@patch(
+    "async_rutube_downloader.run_cli.CLIDownloader.download_single_video",
+    autospec=True,
+)
+def test_cli_download_from_file_with_jobs(
+    mocked_method: AsyncMock,
+    cli_file_fixture: None,
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    urls_in_fixture = 3
+    monkeypatch.setattr("sys.argv", [*sys.argv, "--jobs", "2"])
+    cli_main()
+    assert mocked_method.call_count == urls_in_fixture
+    jobs = [call.args[0] for call in mocked_method.call_args_list]
+    # Progress of all videos is drawn together.
+    assert len({id(job.renderer) for job in jobs}) == 1
+    assert len({id(job.segment_budget) for job in jobs}) == 1
+    captured = capsys.readouterr()
+    assert captured.out.endswith(
+        f"{REPORT_MULTIPLE_URLS.format(urls_in_fixture, 0, 0, 0)}\n"
+    )
+
+
 @pytest.mark.parametrize(
     "entry_point",
     [
@@ -175,23 +266,6 @@ def test_cli_help_text(
     assert captured.err == ""
 
 
-def test_print_progress_bar(
-    capsys: pytest.CaptureFixture[str], cli_downloader: CLIDownloader
-) -> None:
-    progress_bar = create_progress_bar()
-    progress_bar[0] = "#"
-    # 1
-    cli_downloader._print_progress_bar(progress_bar)
-    captured = capsys.readouterr()
-    assert captured.out == f"\r[#{' ' * 19}]"
-    assert captured.err == ""
-    # 2
-    cli_downloader._print_progress_bar(progress_bar, last=True)
-    captured = capsys.readouterr()
-    assert captured.out == f"\r[#{' ' * 19}]\n"
-    assert captured.err == ""
-
-
 def test_ask_for_quality(
     capsys: pytest.CaptureFixture[str],
     cli_downloader: CLIDownloader,
@@ -208,25 +282,3 @@ def test_ask_for_quality(
 """
     assert captured.out == expected_output
     assert captured.err == ""
-
-
-@patch(
-    "async_rutube_downloader.run_cli.CLIDownloader._print_progress_bar",
-    autospec=True,
-)
-@pytest.mark.parametrize(
-    "completed_chunks, total_chunks, is_end",
-    ((1, 16, False), (16, 16, True)),
-)
-@pytest.mark.asyncio
-async def test_cli_progress_callback(
-    mocked_print_func: MagicMock,
-    cli_downloader: CLIDownloader,
-    completed_chunks: int,
-    total_chunks: int,
-    is_end: bool,
-) -> None:
-    await cli_downloader._cli_progress_callback(completed_chunks, total_chunks)
-    mocked_print_func.assert_called_once_with(
-        cli_downloader, cli_downloader.progress_bar, is_end
-    )
@@ -23,7 +23,7 @@ async def test_successful_master_playlist_creation(
     master_playlist = MasterPlaylist(master_playlist_url, mocked_session)
 
     with pytest.raises(MasterPlaylistInitializationError):
-        master_playlist._MasterPlaylist__get_qualities()  # type: ignore
+        master_playlist._MasterPlaylist__get_mirrors()  # type: ignore
 
     assert await master_playlist.run() == master_playlist
     assert isinstance(master_playlist._master_playlist, M3U8)
@@ -31,3 +31,10 @@ async def test_successful_master_playlist_creation(
     mocked_session.get.assert_called_once_with(master_playlist_url)
     assert master_playlist.qualities
     assert is_valid_qualities_with_playlist(master_playlist.qualities)
+    # The fixture lists every quality on two CDNs.
+    assert master_playlist.mirrors
+    assert master_playlist.mirrors.keys() == master_playlist.qualities.keys()
+    for resolution, playlists in master_playlist.mirrors.items():
+        assert len(playlists) == 2
+        assert playlists[0] is master_playlist.qualities[resolution]
+        assert playlists[0].uri != playlists[1].uri
@@ -1,30 +1,60 @@
 import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from http import HTTPStatus
 from pathlib import Path
 from typing import Any
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
+from urllib.parse import urlsplit
 
-import aiofiles
 import pytest
+from aiohttp import ClientError, ClientResponseError, ServerDisconnectedError
 from m3u8 import M3U8
 
 from async_rutube_downloader.rutube_downloader import RutubeDownloader
 from async_rutube_downloader.settings import (
+    MIRROR_MAX_FAILURES,
+    MIRROR_PROBE_SIZE,
+    PART_FILE_TEMPLATE,
     TEST_VIDEO_ID,
     URL_FOR_ID_TEMPLATE,
     VIDEO_FORMAT,
     FULL_HD_1080p,
 )
+from async_rutube_downloader.utils import metrics
+from async_rutube_downloader.utils.archive import DownloadArchive
+from async_rutube_downloader.utils.cancellation import CancelPolicy
+from async_rutube_downloader.utils.circuit_breaker import CircuitBreakers
+from async_rutube_downloader.utils.concurrency import (
+    ConcurrencyLimit,
+    SegmentBudget,
+)
 from async_rutube_downloader.utils.exceptions import (
     APIResponseError,
     InvalidURLError,
     M3U8URLNotFoundError,
     MasterPlaylistInitializationError,
     QualityError,
+    SegmentDownloadError,
+    UnknownSegmentSizesError,
+)
+from async_rutube_downloader.utils.journal import JOURNAL_SUFFIX
+from async_rutube_downloader.utils.metadata_cache import MetadataCache
+from async_rutube_downloader.utils.progress import ProgressEvent
+from async_rutube_downloader.utils.segment_cache import SegmentCache
+from async_rutube_downloader.utils.segment_writers import (
+    PositionalSegmentWriter,
+    WriteMode,
 )
 from async_rutube_downloader.utils.type_hints import APIResponseDict, Qualities
-from tests.conftest import RUTUBE_LINK
+from tests.conftest import RUTUBE_LINK, SEGMENT_CHUNKS, iterate_chunks
 from tests.utils.validators import is_valid_qualities
 
+# The fixture lists every quality on two CDNs,
+# each one is probed with a request before the download.
+MIRROR_PROBES = 2
+
 # FIXME:
 # There is few private methods calls, through mangled names,
 # there should be better way to test it.
@@ -38,15 +68,448 @@ async def test_download_video(
     # 3 is _get_api_response, __get_master_playlist, and __get_selected_quality
     downloader._upload_directory = tmp_path
     await downloader.fetch_video_info()
-    with patch.object(aiofiles, "open") as aiofiles_open:
-        await downloader.download_video()
-        aiofiles_open.assert_called_once_with(
-            tmp_path / f"{downloader._filename}.{VIDEO_FORMAT}", mode="wb"
+    await downloader.download_video()
+    assert (
+        downloader._session.get.call_count  # type: ignore
+        == len(downloader._selected_quality.segments)  # type: ignore
+        + get_calls
+        + MIRROR_PROBES
+    )
+    # The `.part` file is renamed, the journal is removed.
+    assert (
+        downloader.file == tmp_path / f"{downloader._filename}.{VIDEO_FORMAT}"
+    )
+    assert list(tmp_path.iterdir()) == [downloader.file]
+
+
+@pytest.mark.asyncio
+async def test_download_video_resumes_from_journal(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    segment = b"".join(SEGMENT_CHUNKS)
+    downloader._upload_directory = tmp_path
+    qualities = await downloader.fetch_video_info()
+    await downloader.select_quality(max(qualities))
+    part_file = tmp_path / PART_FILE_TEMPLATE.format(
+        TEST_VIDEO_ID, *max(qualities), VIDEO_FORMAT
+    )
+    segments_count = len(downloader._selected_quality.segments)  # type: ignore
+    # Two segments are committed, the third one was cut off by a crash.
+    part_file.write_bytes(segment * 2 + b"cut off")
+    journal = part_file.with_name(part_file.name + JOURNAL_SUFFIX)
+    journal.write_text(
+        json.dumps(
+            {
+                "video_id": TEST_VIDEO_ID,
+                "quality": list(max(qualities)),
+                "segments": segments_count,
+            }
         )
-        assert (
-            downloader._session.get.call_count  # type: ignore
-            == len(downloader._selected_quality.segments) + get_calls  # type: ignore
+        + f"\n0 0 {len(segment)}\n1 {len(segment)} {len(segment)}\n2 1"
+    )
+    downloader._session.get.reset_mock()  # type: ignore
+    await downloader.download_video()
+    assert (
+        downloader._session.get.call_count  # type: ignore
+        == segments_count - 2 + MIRROR_PROBES
+    )
+    assert downloader.file.read_bytes() == segment * segments_count
+    assert not part_file.exists()
+    assert not journal.exists()
+
+
+@pytest.mark.asyncio
+async def test_download_video_positional(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    downloader._upload_directory = tmp_path
+    downloader._write_mode = WriteMode.positional
+    await downloader.fetch_video_info()
+    await downloader.download_video()
+    segments_count = len(downloader._selected_quality.segments)  # type: ignore
+    assert downloader._session.head.call_count == segments_count  # type: ignore
+    assert downloader.file.read_bytes() == (
+        b"".join(SEGMENT_CHUNKS) * segments_count
+    )
+    assert list(tmp_path.iterdir()) == [downloader.file]
+
+
+async def _write_scattered_part_file(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> tuple[Path, Path]:
+    """Segments 1 and 3 were written out of order before the crash."""
+    segment = b"".join(SEGMENT_CHUNKS)
+    downloader._upload_directory = tmp_path
+    qualities = await downloader.fetch_video_info()
+    await downloader.select_quality(max(qualities))
+    part_file = tmp_path / PART_FILE_TEMPLATE.format(
+        TEST_VIDEO_ID, *max(qualities), VIDEO_FORMAT
+    )
+    part_file.write_bytes(
+        b"\0" * len(segment) + segment + b"\0" * len(segment) + segment
+    )
+    journal = part_file.with_name(part_file.name + JOURNAL_SUFFIX)
+    journal.write_text(
+        json.dumps(
+            {
+                "video_id": TEST_VIDEO_ID,
+                "quality": list(max(qualities)),
+                "segments": len(downloader._selected_quality.segments),  # type: ignore
+            }
         )
+        + f"\n1 {len(segment)} {len(segment)}"
+        + f"\n3 {len(segment) * 3} {len(segment)}\n"
+    )
+    return part_file, journal
+
+
+@pytest.mark.asyncio
+async def test_download_video_positional_resumes_from_journal(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    segment = b"".join(SEGMENT_CHUNKS)
+    downloader._write_mode = WriteMode.positional
+    await _write_scattered_part_file(downloader, tmp_path)
+    segments_count = len(downloader._selected_quality.segments)  # type: ignore
+    downloader._session.get.reset_mock()  # type: ignore
+    await downloader.download_video()
+    assert (
+        downloader._session.get.call_count  # type: ignore
+        == segments_count - 2 + MIRROR_PROBES
+    )
+    assert downloader.file.read_bytes() == segment * segments_count
+
+
+@pytest.mark.asyncio
+async def test_cancel_during_size_sweep_keeps_scattered_segments(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    downloader._write_mode = WriteMode.positional
+    part_file, journal = await _write_scattered_part_file(downloader, tmp_path)
+    content, lines = part_file.read_bytes(), journal.read_text()
+
+    async def get_segment_size(segment: Any) -> int:
+        downloader.interrupt_download()
+        return 1
+
+    downloader._get_segment_size = get_segment_size  # type: ignore
+    await downloader.download_video()
+    assert downloader.cancel_report
+    assert downloader.cancel_report.kept_bytes == 2 * len(
+        b"".join(SEGMENT_CHUNKS)
+    )
+    assert part_file.read_bytes() == content
+    assert journal.read_text() == lines
+
+
+@pytest.mark.asyncio
+async def test_scattered_segments_are_not_rewritten_in_order(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    tmp_path: Path,
+) -> None:
+    # Appending would overwrite segments 1 and 3, sizes can't be learned.
+    part_file, journal = await _write_scattered_part_file(downloader, tmp_path)
+    content, lines = part_file.read_bytes(), journal.read_text()
+    get_response_mock.content_length = None
+    with pytest.raises(UnknownSegmentSizesError):
+        await downloader.download_video()
+    assert part_file.read_bytes() == content
+    assert journal.read_text() == lines
+
+
+@pytest.mark.asyncio
+async def test_download_video_positional_retries_segment_of_other_size(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    tmp_path: Path,
+) -> None:
+    downloader._upload_directory = tmp_path
+    downloader._write_mode = WriteMode.positional
+    await downloader.fetch_video_info()
+    bodies = iter([SEGMENT_CHUNKS] * MIRROR_PROBES + [(*SEGMENT_CHUNKS, b"!")])
+    get_response_mock.content.iter_chunked.side_effect = (
+        lambda _: iterate_chunks(next(bodies, SEGMENT_CHUNKS))
+    )
+    await downloader.download_video()
+    assert downloader.file.read_bytes() == b"".join(SEGMENT_CHUNKS) * len(
+        downloader.segments
+    )
+
+
+@pytest.mark.asyncio
+async def test_download_video_positional_falls_back_to_ordered(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    tmp_path: Path,
+) -> None:
+    get_response_mock.content_length = None
+    downloader._upload_directory = tmp_path
+    downloader._write_mode = WriteMode.positional
+    await downloader.fetch_video_info()
+    with patch.object(PositionalSegmentWriter, "open") as positional_open:
+        await downloader.download_video()
+    positional_open.assert_not_called()
+    assert downloader.file.read_bytes() == b"".join(SEGMENT_CHUNKS) * len(
+        downloader.segments
+    )
+
+
+@pytest.mark.asyncio
+async def test_download_video_moves_segments_from_failing_mirror(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    tmp_path: Path,
+) -> None:
+    downloader._upload_directory = tmp_path
+    qualities = await downloader.fetch_video_info()
+    await downloader.select_quality(max(qualities))
+    assert downloader._mirrors
+    failing, working = downloader._mirrors.mirrors
+    requested_hosts: list[str] = []
+
+    def get(url: str, **kwargs: Any) -> AsyncMock:
+        requested_hosts.append(urlsplit(url).netloc)
+        if urlsplit(url).netloc == failing.host:
+            raise ClientError
+        return get_response_mock
+
+    downloader._session.get.side_effect = get  # type: ignore
+    await downloader.download_video()
+    assert downloader.file.read_bytes() == b"".join(SEGMENT_CHUNKS) * len(
+        downloader.segments
+    )
+    # The failing mirror is disabled after `MIRROR_MAX_FAILURES`
+    # requests in a row, the rest go to the other one.
+    assert requested_hosts.count(failing.host) <= MIRROR_MAX_FAILURES
+    assert requested_hosts.count(working.host) >= len(downloader.segments)
+
+
+@pytest.mark.asyncio
+async def test_mirror_probe_requests_start_of_segment(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+) -> None:
+    qualities = await downloader.fetch_video_info()
+    await downloader.select_quality(max(qualities))
+    downloader.segments = downloader._selected_quality.segments  # type: ignore
+    assert downloader._mirrors
+    failing, working = downloader._mirrors.mirrors
+    ranges: list[str] = []
+
+    def get(url: str, headers: dict[str, str]) -> AsyncMock:
+        ranges.append(headers["Range"])
+        if urlsplit(url).netloc == failing.host:
+            raise ClientError
+        return get_response_mock
+
+    downloader._session.get.side_effect = get  # type: ignore
+    await downloader._RutubeDownloader__probe_mirrors(  # type: ignore
+        downloader._mirrors
+    )
+    assert ranges == [f"bytes=0-{MIRROR_PROBE_SIZE - 1}"] * 2
+    assert working.throughput
+    # One failed probe doesn't disable the mirror.
+    assert failing.failures_in_row == 1
+    assert failing.is_healthy(time.monotonic())
+
+
+@pytest.mark.asyncio
+async def test_interrupted_download_keeps_part_file(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    downloader._upload_directory = tmp_path
+    await downloader.fetch_video_info()
+    downloader.interrupt_download()
+    await downloader.download_video()
+    assert downloader.file.suffix == ".part"
+    assert downloader.file.exists()
+    assert downloader.file.with_name(
+        downloader.file.name + JOURNAL_SUFFIX
+    ).exists()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("policy", tuple(CancelPolicy))
+async def test_interrupt_download_aborts_requests_in_flight(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    tmp_path: Path,
+    policy: CancelPolicy,
+) -> None:
+    downloader._upload_directory = tmp_path
+    await downloader.fetch_video_info()
+    complete_requests = MIRROR_PROBES + 2
+    requests = 0
+    stalled = asyncio.Event()
+
+    async def stall(chunks: tuple[bytes, ...]) -> AsyncIterator[bytes]:
+        nonlocal requests
+        requests += 1
+        request = requests
+        yield chunks[0]
+        if request <= complete_requests:
+            yield chunks[1]
+            return
+        stalled.set()
+        await asyncio.Event().wait()
+        yield chunks[1]  # pragma: no cover
+
+    get_response_mock.content.iter_chunked.side_effect = lambda _: stall(
+        SEGMENT_CHUNKS
+    )
+    download = asyncio.create_task(downloader.download_video())
+    await stalled.wait()
+    # Let the complete segments be committed.
+    await asyncio.sleep(0.1)
+    downloader.interrupt_download(policy)
+    await asyncio.wait_for(download, timeout=1)
+    report = downloader.cancel_report
+    assert report
+    assert report.policy is policy
+    assert report.aborted_requests == requests - complete_requests
+    assert report.discarded_bytes == report.aborted_requests * len(
+        SEGMENT_CHUNKS[0]
+    )
+    assert report.saved_bytes > 0
+    segment_size = len(b"".join(SEGMENT_CHUNKS))
+    if policy is CancelPolicy.keep:
+        assert report.kept_bytes == 2 * segment_size
+        assert downloader.file.read_bytes()[: 2 * segment_size] == (
+            b"".join(SEGMENT_CHUNKS) * 2
+        )
+    else:
+        assert report.kept_bytes == 0
+        assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_downloads_share_requests_in_flight(
+    downloader: RutubeDownloader,
+    mocked_session: AsyncMock,
+    get_response_mock: AsyncMock,
+    master_playlist_fixture: str,
+    video_file_playlist_fixture: str,
+    tmp_path: Path,
+) -> None:
+    budget = SegmentBudget(3)
+    get_response_mock.text.side_effect = (
+        *[master_playlist_fixture] * 2,
+        *[video_file_playlist_fixture] * 2,
+    )
+    downloads = [
+        downloader,
+        RutubeDownloader(RUTUBE_LINK, session=mocked_session),
+    ]
+    in_flight = peak = 0
+
+    async def slow(chunks: tuple[bytes, ...]) -> AsyncIterator[bytes]:
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        try:
+            for chunk in chunks:
+                await asyncio.sleep(0.001)
+                yield chunk
+        finally:
+            in_flight -= 1
+
+    get_response_mock.content.iter_chunked.side_effect = lambda _: slow(
+        SEGMENT_CHUNKS
+    )
+    for number, download in enumerate(downloads):
+        download._upload_directory = tmp_path / str(number)
+        download._upload_directory.mkdir()
+        download._concurrency = ConcurrencyLimit(8)
+        download._segment_budget = budget
+        await download.fetch_video_info()
+    await asyncio.gather(
+        *(download.download_video() for download in downloads)
+    )
+    assert peak == budget.limit
+    assert budget.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_segments_waiting_for_slot_skip_opened_circuit(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    tmp_path: Path,
+) -> None:
+    downloader._upload_directory = tmp_path
+    downloader._breakers = CircuitBreakers(min_calls=1)
+    downloader._concurrency = ConcurrencyLimit(8)
+    downloader._segment_budget = SegmentBudget(1)
+    # Segments of the window wait for the only slot.
+    downloader._segment_budget.share = lambda: 8  # type: ignore
+    qualities = await downloader.fetch_video_info()
+    await downloader.select_quality(max(qualities))
+    assert downloader._mirrors
+    failing, working = downloader._mirrors.mirrors
+    segment_hosts: list[str] = []
+
+    def get(url: str, **kwargs: Any) -> AsyncMock:
+        # Probes request a range.
+        if "headers" not in kwargs:
+            segment_hosts.append(urlsplit(url).netloc)
+        if len(segment_hosts) == 4:
+            # The other segments of the window wait for the slot
+            # held by this one, when the circuit opens.
+            breaker = downloader._breakers.for_host(failing.host)
+            while breaker.is_available():
+                breaker.record_failure()
+        return get_response_mock
+
+    downloader._session.get.side_effect = get  # type: ignore
+    await downloader.download_video()
+    assert downloader.file.read_bytes() == b"".join(SEGMENT_CHUNKS) * len(
+        downloader.segments
+    )
+    assert set(segment_hosts[4:]) == {working.host}
+
+
+@pytest.mark.asyncio
+async def test_segments_waiting_for_buffer_give_up_slot(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    tmp_path: Path,
+) -> None:
+    downloader._upload_directory = tmp_path
+    downloader._concurrency = ConcurrencyLimit(2)
+    downloader._segment_budget = SegmentBudget(1)
+    downloader._segment_budget.share = lambda: 2  # type: ignore
+    # The second chunk of a segment after the head doesn't fit.
+    downloader._buffer_size = 1
+    qualities = await downloader.fetch_video_info()
+    await downloader.select_quality(max(qualities))
+    head_failed = False
+
+    def get(url: str, **kwargs: Any) -> AsyncMock:
+        nonlocal head_failed
+        if "headers" not in kwargs and not head_failed:
+            head_failed = True
+            raise ClientError
+        return get_response_mock
+
+    downloader._session.get.side_effect = get  # type: ignore
+    # The head waits for the slot during its retry.
+    await asyncio.wait_for(downloader.download_video(), timeout=5)
+    assert downloader.file.read_bytes() == b"".join(SEGMENT_CHUNKS) * len(
+        downloader.segments
+    )
+    assert downloader._segment_budget.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_download_video_writes_segments(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    downloader._upload_directory = tmp_path
+    await downloader.fetch_video_info()
+    await downloader.download_video()
+    assert downloader.file.read_bytes() == b"".join(SEGMENT_CHUNKS) * len(
+        downloader.segments
+    )
 
 
 @pytest.mark.asyncio
@@ -99,6 +562,29 @@ async def test_fetch_video_info(downloader: RutubeDownloader) -> None:
     assert is_valid_qualities(result)
 
 
+@pytest.mark.asyncio
+async def test_fetch_video_info_prefetches_variants(
+    downloader: RutubeDownloader,
+    mocked_session: AsyncMock,
+    get_response_mock: AsyncMock,
+    master_playlist_fixture: str,
+    video_file_playlist_fixture: str,
+) -> None:
+    get_response_mock.text.side_effect = (
+        master_playlist_fixture,
+        *[video_file_playlist_fixture] * 5,
+    )
+    qualities = await downloader.fetch_video_info(prefetch=True)
+    assert set(downloader.variants) == set(qualities)
+    variant = downloader.variants[(256, 136)]
+    assert variant.duration == pytest.approx(59.32)
+    assert variant.size == int(419000 / 8 * variant.duration)
+    requests = mocked_session.get.call_count
+    await downloader.select_quality((256, 136))
+    assert mocked_session.get.call_count == requests
+    assert downloader._selected_quality is not None
+
+
 @pytest.mark.asyncio
 async def test_fetch_video_info_raise_error(
     downloader: RutubeDownloader,
@@ -167,7 +653,7 @@ async def test_get_api_response(
 async def test_create_downloader(mocked_session: AsyncMock) -> None:
     """Create correct RutubeDownloader object."""
 
-    def dummy_callback(arg: int, arg2: int): ...
+    def dummy_callback(event: ProgressEvent): ...
 
     loop = asyncio.new_event_loop()
 
@@ -271,3 +757,256 @@ def test_interrupt_download(downloader: RutubeDownloader) -> None:
     assert downloader.is_interrupted() is False
     downloader.interrupt_download()
     assert downloader.is_interrupted() is True
+
+
+@pytest.mark.asyncio
+async def test_download_video_fails_fast_on_dead_hosts(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    downloader._upload_directory = tmp_path
+    qualities = await downloader.fetch_video_info()
+    await downloader.select_quality(max(qualities))
+    downloader._session.get.side_effect = ServerDisconnectedError  # type: ignore
+    downloader._session.get.reset_mock()  # type: ignore
+    with pytest.raises(SegmentDownloadError):
+        await asyncio.wait_for(downloader.download_video(), timeout=5)
+    # Circuits of both mirrors open after a few failures,
+    # other segments are not even requested.
+    assert downloader._session.get.call_count < len(downloader.segments)  # type: ignore
+
+
+# Before `expire` of the playlist URLs in the API response fixture.
+FIXTURE_TIME = 1733400000.0
+
+
+def create_metadata_cache(tmp_path: Path) -> MetadataCache:
+    return MetadataCache(
+        tmp_path / "metadata.sqlite3", clock=lambda: FIXTURE_TIME
+    )
+
+
+@pytest.mark.asyncio
+async def test_fetch_video_info_uses_metadata_cache(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    cache = MetadataCache(
+        tmp_path / "cache.sqlite3", clock=lambda: FIXTURE_TIME
+    )
+    downloader._metadata_cache = cache
+    qualities = await downloader.fetch_video_info()
+    await downloader.select_quality(max(qualities))
+    requests = downloader._session.get.call_count  # type: ignore
+    warm = RutubeDownloader(
+        RUTUBE_LINK, session=downloader._session, metadata_cache=cache
+    )
+    assert await warm.fetch_video_info() == qualities
+    await warm.select_quality(max(qualities))
+    assert warm.video_title == downloader.video_title
+    assert (
+        warm._selected_quality.dumps()  # type: ignore
+        == downloader._selected_quality.dumps()  # type: ignore
+    )
+    assert downloader._session.get.call_count == requests  # type: ignore
+
+
+@pytest.mark.asyncio
+async def test_expired_cached_playlists_are_revalidated(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    master_playlist_fixture: str,
+    video_file_playlist_fixture: str,
+    tmp_path: Path,
+) -> None:
+    get_response_mock.text.side_effect = (
+        master_playlist_fixture,
+        video_file_playlist_fixture,
+    ) * 2
+    cache = MetadataCache(
+        tmp_path / "cache.sqlite3", clock=lambda: FIXTURE_TIME
+    )
+    downloader._metadata_cache = cache
+    quality = max(await downloader.fetch_video_info())
+    await downloader.select_quality(quality)
+    warm = RutubeDownloader(
+        RUTUBE_LINK,
+        session=downloader._session,
+        upload_directory=tmp_path,
+        metadata_cache=cache,
+    )
+    await warm.fetch_video_info()
+    await warm.select_quality(quality)
+    expired = True
+
+    def get(url: str, **kwargs: Any) -> AsyncMock:
+        nonlocal expired
+        if "api/play/options" in url:
+            expired = False
+        if expired and url.endswith(".ts"):
+            raise ClientResponseError(
+                MagicMock(), (), status=HTTPStatus.FORBIDDEN
+            )
+        return get_response_mock
+
+    downloader._session.get.side_effect = get  # type: ignore
+    await warm.download_video()
+    assert not expired
+    assert warm.file == tmp_path / f"{warm._filename}.{VIDEO_FORMAT}"
+    assert await cache.get(warm._video_id, "api") is not None
+
+
+@pytest.mark.asyncio
+async def test_archived_video_is_not_downloaded_again(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    archive = DownloadArchive(tmp_path / "archive.sqlite3")
+    downloader._archive = archive
+    downloader._upload_directory = tmp_path
+    quality = max(await downloader.fetch_video_info())
+    await downloader.select_quality(quality)
+    await downloader.download_video()
+    entry = await archive.find(downloader._video_id, quality)
+    assert entry
+    assert entry.path == downloader.file
+    again = RutubeDownloader(
+        RUTUBE_LINK,
+        session=downloader._session,
+        upload_directory=tmp_path,
+        archive=archive,
+    )
+    downloader._session.get.reset_mock()  # type: ignore
+    assert await again.check_archive() == entry
+    assert again.file == entry.path
+    downloader._session.get.assert_not_called()  # type: ignore
+    archive.close()
+
+
+@pytest.mark.asyncio
+async def test_segments_are_served_from_segment_cache(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    master_playlist_fixture: str,
+    video_file_playlist_fixture: str,
+    tmp_path: Path,
+) -> None:
+    get_response_mock.text.side_effect = (
+        master_playlist_fixture,
+        video_file_playlist_fixture,
+    ) * 2
+    cache = SegmentCache(tmp_path / "segments")
+    downloader._segment_cache = cache
+    downloader._upload_directory = tmp_path / "first"
+    downloader._upload_directory.mkdir()
+    quality = max(await downloader.fetch_video_info())
+    await downloader.select_quality(quality)
+    await downloader.download_video()
+    again = RutubeDownloader(
+        RUTUBE_LINK,
+        session=downloader._session,
+        upload_directory=tmp_path,
+        segment_cache=cache,
+    )
+    await again.fetch_video_info()
+    await again.select_quality(quality)
+    downloader._session.get.reset_mock()  # type: ignore
+    await again.download_video()
+    assert again._mirrors
+    # Only the first segment is downloaded, to probe the mirrors.
+    assert downloader._session.get.call_count == len(  # type: ignore
+        again._mirrors.mirrors
+    )
+    assert again.file.read_bytes() == downloader.file.read_bytes()
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_progress_events_are_throttled(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    events: list[ProgressEvent] = []
+    downloader._callback = events.append
+    downloader._progress_interval = 60
+    downloader._upload_directory = tmp_path
+    await downloader.fetch_video_info()
+    await downloader.download_video()
+    # The first segment and the last one, the others are too soon.
+    assert len(events) == 2
+    assert events[-1].finished
+    assert events[-1].completed_segments == len(downloader.segments)
+    assert events[-1].bytes_received == downloader.file.stat().st_size
+    assert events[-1].eta == 0
+
+
+@pytest.mark.asyncio
+async def test_progress_is_reported_after_segment_is_written(
+    downloader: RutubeDownloader, tmp_path: Path
+) -> None:
+    events: list[ProgressEvent] = []
+    downloader._callback = events.append
+    downloader._progress_interval = 0
+    downloader._upload_directory = tmp_path
+    await downloader.fetch_video_info()
+    await downloader.download_video()
+    assert [event.completed_segments for event in events] == list(
+        range(1, len(downloader.segments) + 1)
+    )
+    assert all(event.bytes_received for event in events)
+
+
+@pytest.mark.asyncio
+async def test_progress_counts_segments_flushed_in_order(
+    downloader: RutubeDownloader,
+    get_response_mock: AsyncMock,
+    tmp_path: Path,
+) -> None:
+    segment_size = len(b"".join(SEGMENT_CHUNKS))
+    flushed: list[tuple[int, int]] = []
+    downloader._callback = lambda event: flushed.append(
+        (event.completed_segments, downloader.file.stat().st_size)
+    )
+    downloader._progress_interval = 0
+    downloader._upload_directory = tmp_path
+    await downloader.fetch_video_info()
+    requests = 0
+
+    async def stall_first_segment(
+        chunks: tuple[bytes, ...],
+    ) -> AsyncIterator[bytes]:
+        nonlocal requests
+        requests += 1
+        if requests == MIRROR_PROBES + 1:
+            # The segments after it wait in the reorder buffer.
+            await asyncio.sleep(0.05)
+        for chunk in chunks:
+            yield chunk
+
+    get_response_mock.content.iter_chunked.side_effect = (
+        lambda _: stall_first_segment(SEGMENT_CHUNKS)
+    )
+    await downloader.download_video()
+    assert [completed for completed, _ in flushed] == list(
+        range(1, len(downloader.segments) + 1)
+    )
+    assert all(size >= completed * segment_size for completed, size in flushed)
+
+
+@pytest.mark.asyncio
+async def test_download_records_metrics(
+    downloader: RutubeDownloader,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(metrics.process_metrics, "enabled", True)
+    completed = metrics.segments_completed.get()
+    downloaded = metrics.downloaded_bytes.get()
+    downloader._upload_directory = tmp_path
+    await downloader.fetch_video_info()
+    await downloader.download_video()
+    assert metrics.segments_completed.get() - completed == len(
+        downloader.segments
+    )
+    assert (
+        metrics.downloaded_bytes.get() - downloaded
+        == downloader.file.stat().st_size
+    )
+    assert metrics.requests_in_flight.get() == 0
+    assert metrics.active_downloads.get() == 0
@@ -0,0 +1,230 @@
+import asyncio
+import json
+from argparse import Namespace
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from http import HTTPStatus
+from pathlib import Path
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestServer
+
+from async_rutube_downloader.run_cli import CLIDownloader
+from async_rutube_downloader.rutube_downloader import RutubeDownloader
+from async_rutube_downloader.server import (
+    JobManager,
+    JobServerClient,
+    JobState,
+    create_app,
+)
+from async_rutube_downloader.settings import FULL_HD_1080p, HD_720p
+from async_rutube_downloader.utils.exceptions import JobServerError
+from async_rutube_downloader.utils.progress import ProgressEvent
+from tests.conftest import RUTUBE_ID
+
+SEGMENTS = 4
+SEGMENT_DELAY = 0.01
+
+
+class FakeDownloader(RutubeDownloader):
+    """Reports `SEGMENTS` segments instead of downloading them."""
+
+    async def fetch_video_info(self) -> tuple[tuple[int, int], ...]:
+        self.video_title = "Fake video"
+        return (HD_720p, FULL_HD_1080p)
+
+    async def select_quality(self, selected_quality: tuple[int, int]) -> None:
+        self._quality = selected_quality
+
+    async def download_video(self) -> None:
+        assert self._callback
+        for completed in range(1, SEGMENTS + 1):
+            await asyncio.sleep(SEGMENT_DELAY)
+            if self.is_interrupted():
+                return
+            self._callback(ProgressEvent(completed, SEGMENTS))
+        self.file = self._upload_directory / "Fake_video.mp4"
+
+
+@asynccontextmanager
+async def job_server(
+    tmp_path: Path, workers: int = 1
+) -> AsyncIterator[JobServerClient]:
+    manager = JobManager(
+        AsyncMock(ClientSession),
+        tmp_path,
+        workers=workers,
+        downloader_class=FakeDownloader,
+    )
+    async with (
+        TestServer(create_app(manager)) as server,
+        JobServerClient(ClientSession(), str(server.make_url("/"))) as client,
+    ):
+        yield client
+
+
+@pytest.mark.asyncio
+async def test_job_is_downloaded(tmp_path: Path) -> None:
+    async with job_server(tmp_path) as client:
+        job = await client.submit(RUTUBE_ID, quality=HD_720p)
+        assert job["state"] == JobState.queued
+        events = [event async for event in client.events(job["id"])]
+        status = await client.status(job["id"])
+        assert await client.jobs() == [status]
+    progress = [event for event in events if event["event"] == "progress"]
+    assert [event["job"]["completed_segments"] for event in progress] == list(
+        range(1, SEGMENTS + 1)
+    )
+    assert events[-1]["job"]["state"] == JobState.done
+    assert status["state"] == JobState.done
+    assert status["title"] == "Fake video"
+    assert status["quality"] == list(HD_720p)
+    assert status["file"] == str(tmp_path / "Fake_video.mp4")
+
+
+@pytest.mark.asyncio
+async def test_jobs_are_cancelled(tmp_path: Path) -> None:
+    async with job_server(tmp_path) as client:
+        running = await client.submit(RUTUBE_ID)
+        queued = await client.submit(RUTUBE_ID)
+        await asyncio.sleep(SEGMENT_DELAY * 2)
+        assert (await client.cancel(queued["id"]))["state"] == (
+            JobState.cancelled
+        )
+        await client.cancel(running["id"])
+        events = [event async for event in client.events(running["id"])]
+    assert events[-1]["job"]["state"] == JobState.cancelled
+    assert events[-1]["job"]["completed_segments"] < SEGMENTS
+
+
+@pytest.mark.asyncio
+async def test_job_is_paused_and_resumed(tmp_path: Path) -> None:
+    async with job_server(tmp_path) as client:
+        running = await client.submit(RUTUBE_ID)
+        queued = await client.submit(RUTUBE_ID)
+        await asyncio.sleep(SEGMENT_DELAY * 2)
+        assert (await client.pause(queued["id"]))["state"] == JobState.paused
+        assert (await client.pause(running["id"]))["state"] == JobState.paused
+        await asyncio.sleep(SEGMENT_DELAY * 2)
+        assert (await client.status(running["id"]))["state"] == (
+            JobState.paused
+        )
+        await client.resume(running["id"])
+        await client.resume(queued["id"])
+        events = [event async for event in client.events(queued["id"])]
+        status = await client.status(running["id"])
+    assert events[-1]["job"]["state"] == JobState.done
+    assert status["state"] == JobState.done
+
+
+class SavingDownloader(FakeDownloader):
+    """Takes a while to save its progress when it's interrupted."""
+
+    saved = False
+
+    async def download_video(self) -> None:
+        await super().download_video()
+        if self.is_interrupted():
+            await asyncio.sleep(SEGMENT_DELAY)
+            self.saved = True
+
+
+@pytest.mark.asyncio
+async def test_stopped_manager_lets_jobs_save_progress(
+    tmp_path: Path,
+) -> None:
+    manager = JobManager(
+        AsyncMock(ClientSession),
+        tmp_path,
+        downloader_class=SavingDownloader,
+    )
+    manager.start()
+    running = manager.submit(RUTUBE_ID)
+    queued = manager.submit(RUTUBE_ID)
+    await asyncio.sleep(SEGMENT_DELAY * 2)
+    downloader = running.downloader
+    assert isinstance(downloader, SavingDownloader)
+    await manager.stop()
+    assert downloader.saved
+    assert running.state is JobState.cancelled
+    assert queued.state is JobState.cancelled
+
+
+@pytest.mark.asyncio
+async def test_prefetched_job_does_not_fetch_info_again(
+    tmp_path: Path,
+) -> None:
+    manager = JobManager(
+        AsyncMock(ClientSession), tmp_path, downloader_class=FakeDownloader
+    )
+    manager.start()
+    downloader = manager.create_downloader(RUTUBE_ID)
+    qualities = await downloader.fetch_video_info()
+    with patch.object(
+        FakeDownloader, "fetch_video_info", side_effect=AssertionError
+    ):
+        job = manager.submit(
+            RUTUBE_ID, HD_720p, prefetched=(downloader, qualities)
+        )
+        events = [event async for event in job.events()]
+    await manager.stop()
+    assert events[-1]["job"]["state"] == JobState.done
+    assert events[-1]["job"]["title"] == "Fake video"
+    assert events[-1]["job"]["completed_segments"] == SEGMENTS
+
+
+@pytest.mark.asyncio
+async def test_unavailable_quality_fails_job(tmp_path: Path) -> None:
+    async with job_server(tmp_path) as client:
+        job = await client.submit(RUTUBE_ID, quality=(640, 360))
+        events = [event async for event in client.events(job["id"])]
+    assert events[-1]["job"]["state"] == JobState.failed
+    assert "quality" in events[-1]["job"]["error"]
+
+
+@pytest.mark.asyncio
+async def test_invalid_requests_are_rejected(tmp_path: Path) -> None:
+    async with job_server(tmp_path) as client:
+        with pytest.raises(JobServerError, match="Invalid URL"):
+            await client.submit("https://example.com/video")
+        with pytest.raises(JobServerError, match="Invalid output"):
+            await client.submit(RUTUBE_ID, output=tmp_path / "missing")
+        with pytest.raises(JobServerError, match="not found"):
+            await client.status(42)
+
+
+@pytest.mark.asyncio
+async def test_post_requests_must_be_json(tmp_path: Path) -> None:
+    async with (
+        job_server(tmp_path) as client,
+        ClientSession() as session,
+    ):
+        # A form a web page can post cross-origin.
+        response = await session.post(
+            f"{client.base_url}/jobs",
+            data=json.dumps({"url": RUTUBE_ID}),
+            headers={"Content-Type": "text/plain"},
+        )
+        assert response.status == HTTPStatus.UNSUPPORTED_MEDIA_TYPE
+        assert not await client.jobs()
+
+
+@pytest.mark.asyncio
+async def test_cli_submits_to_server(
+    tmp_path: Path, capsys: pytest.CaptureFixture[str]
+) -> None:
+    async with job_server(tmp_path, workers=2) as client:
+        cli_args = Namespace(
+            url=RUTUBE_ID,
+            file=None,
+            output=tmp_path,
+            server=client.base_url,
+        )
+        await CLIDownloader(
+            cli_args, AsyncMock(ClientSession)
+        ).download_with_server()
+    output = capsys.readouterr().out
+    assert "[Fake video] 100%" in output
+    assert f"saved to {tmp_path / 'Fake_video.mp4'}" in output
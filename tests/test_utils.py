@@ -1,10 +1,105 @@
+import asyncio
+import io
+import json
+import random
+from argparse import ArgumentTypeError
 from collections.abc import Callable
-from unittest.mock import AsyncMock
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+from http import HTTPStatus
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock
 
+import aiofiles
 import pytest
+from aiohttp import (
+    ClientError,
+    ClientPayloadError,
+    ClientResponseError,
+    ClientSession,
+    ServerDisconnectedError,
+    TCPConnector,
+    web,
+)
+from aiohttp.test_utils import TestServer
+from m3u8 import M3U8
+from multidict import CIMultiDict
 
-from async_rutube_downloader.settings import FULL_HD_1080p, HD_720p
-from async_rutube_downloader.utils.validators import is_quality_valid
+from async_rutube_downloader.settings import (
+    MIB,
+    MIRROR_MAX_FAILURES,
+    RANGE_PARTS,
+    FULL_HD_1080p,
+    HD_720p,
+)
+from async_rutube_downloader.utils import metrics
+from async_rutube_downloader.utils.archive import DownloadArchive
+from async_rutube_downloader.utils.circuit_breaker import (
+    CircuitBreaker,
+    CircuitBreakers,
+    CircuitState,
+    breakers_for,
+)
+from async_rutube_downloader.utils.concurrency import (
+    AdaptiveConcurrency,
+    LatestValue,
+    SegmentBudget,
+)
+from async_rutube_downloader.utils.create_session import (
+    ConnectionProfile,
+    PoolStats,
+    create_aiohttp_session,
+    get_pool_stats,
+    get_ssl_context,
+)
+from async_rutube_downloader.utils.decorators import retry
+from async_rutube_downloader.utils.exceptions import (
+    CircuitOpenError,
+    ConcurrencyLimitError,
+    SegmentSizeError,
+)
+from async_rutube_downloader.utils.journal import SegmentJournal
+from async_rutube_downloader.utils.metadata_cache import (
+    MetadataCache,
+    signed_url_expiry,
+)
+from async_rutube_downloader.utils.metrics import MetricsRegistry
+from async_rutube_downloader.utils.mirrors import MirrorPool
+from async_rutube_downloader.utils.progress import (
+    ProgressEvent,
+    ProgressTracker,
+)
+from async_rutube_downloader.utils.progress_renderer import (
+    CURSOR_UP,
+    ERASE_DOWN,
+    ProgressLine,
+    ProgressRenderer,
+)
+from async_rutube_downloader.utils.ranges import (
+    read_in_ranges,
+    split_range,
+    supports_ranges,
+)
+from async_rutube_downloader.utils.rate_limiter import TokenBucket
+from async_rutube_downloader.utils.retry import RetryPolicy
+from async_rutube_downloader.utils.scheduler import SlidingWindowScheduler
+from async_rutube_downloader.utils.segment_cache import (
+    SegmentCache,
+    segment_key,
+)
+from async_rutube_downloader.utils.segment_writers import (
+    OrderedSegmentWriter,
+    PositionalSegmentWriter,
+)
+from async_rutube_downloader.utils.tracing import Phase, get_tracer
+from async_rutube_downloader.utils.validators import (
+    cli_validate_concurrency,
+    cli_validate_jobs,
+    cli_validate_port,
+    cli_validate_rate,
+    cli_validate_size,
+    is_quality_valid,
+)
 from tests.conftest import (
     EXCEPTION_TEXT,
     EXCEPTION_TO_RAISE,
@@ -60,3 +155,1136 @@ def test_is_quality_valid(quality) -> None:
 )
 def test_is_quality_invalid(quality) -> None:
     assert is_quality_valid(quality) is False
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_keeps_window_full() -> None:
+    window = 3
+    in_flight = 0
+    max_in_flight = 0
+    started: list[int] = []
+
+    async def worker(job: int) -> int:
+        nonlocal in_flight, max_in_flight
+        started.append(job)
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # The first job is slow, others must not wait for it.
+        await asyncio.sleep(0.05 if job == 0 else 0)
+        in_flight -= 1
+        return job * 2
+
+    results: dict[int, int] = {}
+
+    async def on_done(job: int, result: int) -> None:
+        results[job] = result
+
+    await SlidingWindowScheduler(worker, window).run(range(10), on_done)
+    assert max_in_flight == window
+    assert results == {job: job * 2 for job in range(10)}
+    # All jobs were started while the slow first job was still running.
+    assert started == list(range(10))
+    assert next(iter(results)) != 0
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_stops_starting_new_jobs() -> None:
+    started: list[int] = []
+    stopped = False
+
+    async def worker(job: int) -> None:
+        nonlocal stopped
+        started.append(job)
+        stopped = job == 4
+
+    await SlidingWindowScheduler(
+        worker, window=1, is_stopped=lambda: stopped
+    ).run(range(10), AsyncMock())
+    assert started == [0, 1, 2, 3, 4]
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_cancels_jobs_on_error() -> None:
+    cancelled: list[int] = []
+
+    async def worker(job: int) -> None:
+        if job == 0:
+            raise RETRY_ON_EXCEPTION
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(job)
+            raise
+
+    with pytest.raises(RETRY_ON_EXCEPTION):
+        await SlidingWindowScheduler(worker, window=3).run(
+            range(10), AsyncMock()
+        )
+    assert cancelled == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_follows_changing_limit() -> None:
+    limit = 1
+    in_flight = 0
+    max_in_flight = 0
+
+    async def worker(job: int) -> None:
+        nonlocal limit, in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        limit = 4 if job >= 3 else 1
+        await asyncio.sleep(0)
+        in_flight -= 1
+
+    await SlidingWindowScheduler(worker, lambda: limit).run(range(20))
+    assert max_in_flight == 4
+
+
+def test_sliding_window_invalid_size() -> None:
+    with pytest.raises(ConcurrencyLimitError):
+        SlidingWindowScheduler(AsyncMock(), window=0)
+
+
+@pytest.mark.asyncio
+async def test_ordered_writer_writes_in_playlist_order(tmp_path: Path) -> None:
+    output = tmp_path / "video.mp4"
+    async with aiofiles.open(output, mode="wb") as file:
+        writer = OrderedSegmentWriter(file)
+        await writer.write(2, b"cc")
+        await writer.write(1, b"b")
+        await writer.commit(2)
+        assert writer.buffered_bytes == 3
+        await writer.write(0, b"a")
+        await writer.commit(0)
+        # Segment 1 became the head, its chunks are on disk now.
+        assert writer.head == 1
+        assert writer.buffered_bytes == 2
+        await writer.write(1, b"b")
+        await writer.commit(1)
+        assert writer.head == 3
+        assert writer.buffered_bytes == 0
+    assert output.read_bytes() == b"abbcc"
+
+
+@pytest.mark.asyncio
+async def test_ordered_writer_reset_rolls_back_head(tmp_path: Path) -> None:
+    output = tmp_path / "video.mp4"
+    async with aiofiles.open(output, mode="wb") as file:
+        writer = OrderedSegmentWriter(file)
+        await writer.write(0, b"a")
+        await writer.commit(0)
+        await writer.write(1, b"broken")
+        await writer.write(2, b"broken")
+        await writer.reset(1)
+        await writer.reset(2)
+        assert writer.buffered_bytes == 0
+        await writer.write(2, b"c")
+        await writer.write(1, b"b")
+        await writer.commit(1)
+        await writer.commit(2)
+    assert output.read_bytes() == b"abc"
+
+
+@pytest.mark.asyncio
+async def test_ordered_writer_times_only_file_writes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(metrics.process_metrics, "enabled", True)
+    before = metrics.write_latency.get()
+    wait = 0.05
+    async with aiofiles.open(tmp_path / "video.mp4", mode="wb") as file:
+        writer = OrderedSegmentWriter(file, max_buffered_bytes=1)
+        await writer.write(1, b"b")
+        # Waits for the reorder buffer until segment 1 is the head.
+        blocked = asyncio.create_task(writer.write(1, b"bb"))
+        await asyncio.sleep(wait)
+        await writer.write(0, b"a")
+        await writer.commit(0)
+        await blocked
+    timings = metrics.write_latency.get() - before
+    assert timings.count == 3
+    assert timings.total < wait
+
+
+@pytest.mark.asyncio
+async def test_ordered_writer_byte_cap_holds_on_long_playlist(
+    tmp_path: Path,
+) -> None:
+    segments_count = 5_000
+    max_buffered_bytes = 4096
+    read_size = 256
+    rng = random.Random(42)
+    segments = [
+        rng.randbytes(rng.randint(1, 1024)) for _ in range(segments_count)
+    ]
+    # Every slow segment blocks the head of the line for a while.
+    slow_segments = set(range(0, segments_count, 97))
+    output = tmp_path / "video.mp4"
+
+    async with aiofiles.open(output, mode="wb") as file:
+        writer = OrderedSegmentWriter(
+            file, max_buffered_bytes=max_buffered_bytes
+        )
+
+        async def download_segment(index: int) -> None:
+            await writer.wait_for_space(index)
+            await writer.reset(index)
+            body = segments[index]
+            for start in range(0, len(body), read_size):
+                await asyncio.sleep(0.001 if index in slow_segments else 0)
+                await writer.write(index, body[start : start + read_size])
+            await writer.commit(index)
+
+        await SlidingWindowScheduler(download_segment, window=20).run(
+            range(segments_count)
+        )
+
+    assert 0 < writer.peak_buffered_bytes <= max_buffered_bytes
+    assert writer.buffered_bytes == 0
+    assert output.read_bytes() == b"".join(segments)
+
+
+@pytest.mark.asyncio
+async def test_journal_round_trip(tmp_path: Path) -> None:
+    part_file = tmp_path / "video.part"
+    part_file.write_bytes(b"abbccc")
+    journal = SegmentJournal(part_file, "video_id", FULL_HD_1080p, 4)
+    assert await journal.load() == {}
+    async with journal.open():
+        await journal.record(0, 0, 1)
+        await journal.record(2, 3, 3)
+        await journal.record(1, 1, 2)
+    assert await journal.load() == {0: (0, 1), 1: (1, 2), 2: (3, 3)}
+    assert journal.committed_prefix() == (3, 6)
+    # Another quality of the same video must not be resumed.
+    assert await SegmentJournal(part_file, "video_id", HD_720p, 4).load() == {}
+    await journal.remove()
+    assert not journal.path.exists()
+
+
+@pytest.mark.asyncio
+async def test_journal_ignores_segments_beyond_part_file(
+    tmp_path: Path,
+) -> None:
+    part_file = tmp_path / "video.part"
+    part_file.write_bytes(b"ab")
+    journal = SegmentJournal(part_file, "video_id", FULL_HD_1080p, 4)
+    async with journal.open():
+        await journal.record(0, 0, 1)
+        await journal.record(1, 1, 2)
+    assert await journal.load() == {0: (0, 1)}
+
+
+@pytest.mark.asyncio
+async def test_positional_writer_writes_at_offsets(tmp_path: Path) -> None:
+    output = tmp_path / "video.part"
+    committed: list[tuple[int, int, int]] = []
+
+    async def on_commit(index: int, offset: int, size: int) -> None:
+        committed.append((index, offset, size))
+
+    async with PositionalSegmentWriter.open(
+        output, (1, 2, 3), on_commit
+    ) as writer:
+        assert output.stat().st_size == writer.total_size == 6
+        await writer.write(2, b"cc")
+        await writer.write(1, b"xx")
+        await writer.reset(1)
+        await writer.write(1, b"bb")
+        await writer.write(2, b"c")
+        await writer.commit(2)
+        await writer.commit(1)
+        await writer.write(0, b"a")
+        await writer.commit(0)
+    assert output.read_bytes() == b"abbccc"
+    assert committed == [(2, 3, 3), (1, 1, 2), (0, 0, 1)]
+
+
+@pytest.mark.asyncio
+async def test_positional_writer_checks_segment_size(tmp_path: Path) -> None:
+    async with PositionalSegmentWriter.open(
+        tmp_path / "video.part", (1, 2)
+    ) as writer:
+        with pytest.raises(SegmentSizeError):
+            await writer.write(0, b"too long")
+        await writer.write(1, b"b")
+        with pytest.raises(SegmentSizeError):
+            await writer.commit(1)
+
+
+@pytest.mark.asyncio
+async def test_positional_writer_truncates_stale_file(tmp_path: Path) -> None:
+    output = tmp_path / "video.part"
+    output.write_bytes(b"a" + b"stale" * 10)
+    async with PositionalSegmentWriter.open(output, (1, 2)) as writer:
+        await writer.write(1, b"bb")
+    assert output.read_bytes() == b"abb"
+
+
+def test_mirror_pool_prefers_faster_mirror() -> None:
+    random.seed(42)
+    pool = MirrorPool(["https://cdn-1/video.m3u8", "https://cdn-2/video.m3u8"])
+    slow, fast = pool.mirrors
+    pool.report_success(slow, size=1_000, latency=0.1, duration=1)
+    pool.report_success(fast, size=9_000, latency=0.1, duration=1)
+    chosen = [pool.choose() for _ in range(1_000)]
+    assert chosen.count(slow) < chosen.count(fast)
+    assert chosen.count(slow) > 0
+
+
+def test_mirror_pool_disables_failing_mirror() -> None:
+    pool = MirrorPool(["https://cdn-1/video.m3u8", "https://cdn-2/video.m3u8"])
+    failing, working = pool.mirrors
+    for _ in range(MIRROR_MAX_FAILURES):
+        assert pool.choose(avoid=working) is failing
+        pool.report_failure(failing)
+    assert all(pool.choose() is working for _ in range(100))
+    # Nothing else is healthy, so the avoided mirror is used.
+    assert pool.choose(avoid=working) is working
+    # Every mirror is disabled, the download must not fail.
+    pool.disable(working)
+    assert pool.choose() is failing
+
+
+def test_mirror_segment_url() -> None:
+    pool = MirrorPool(["https://cdn-1/hls/video.mp4.m3u8?i=1"])
+    segment = M3U8("#EXTINF:2.0,\nvideo.mp4/segment-1.ts").segments[0]
+    assert (
+        pool.mirrors[0].segment_url(segment)
+        == "https://cdn-1/hls/video.mp4/segment-1.ts"
+    )
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_adaptive_concurrency_grows_while_goodput_improves() -> None:
+    clock = FakeClock()
+    concurrency = AdaptiveConcurrency(2, maximum=4, interval=1, clock=clock)
+    for second in range(1, 5):
+        clock.now = second
+        concurrency.record_success(size=second * 1_000, latency=0.1)
+    assert concurrency.limit == 4
+
+
+def test_adaptive_concurrency_halves_on_rising_latency() -> None:
+    clock = FakeClock()
+    concurrency = AdaptiveConcurrency(10, interval=1, clock=clock)
+    concurrency.record_success(size=1_000, latency=0.1)
+    clock.now = 1
+    concurrency.record_success(size=1_000, latency=1)
+    assert concurrency.limit == 5
+
+
+def test_adaptive_concurrency_halves_on_errors_once_per_interval() -> None:
+    clock = FakeClock()
+    concurrency = AdaptiveConcurrency(16, minimum=3, interval=1, clock=clock)
+    concurrency.record_error()
+    concurrency.record_error()
+    assert concurrency.limit == 8
+    clock.now = 1
+    concurrency.record_error()
+    clock.now = 2
+    concurrency.record_error()
+    assert concurrency.limit == 3
+
+
+@pytest.mark.parametrize("concurrency", ("0", "-1", "1.5", "abc", "10000"))
+def test_cli_validate_concurrency_invalid(concurrency: str) -> None:
+    with pytest.raises(ArgumentTypeError):
+        cli_validate_concurrency(concurrency)
+
+
+def test_cli_validate_concurrency() -> None:
+    assert cli_validate_concurrency("5") == 5
+
+
+@pytest.mark.parametrize("port", ("0", "-1", "http", "65536"))
+def test_cli_validate_port_invalid(port: str) -> None:
+    with pytest.raises(ArgumentTypeError):
+        cli_validate_port(port)
+
+
+@pytest.mark.parametrize("jobs", ("0", "1.5", "abc", "100"))
+def test_cli_validate_jobs_invalid(jobs: str) -> None:
+    with pytest.raises(ArgumentTypeError):
+        cli_validate_jobs(jobs)
+
+
+def test_segment_budget_is_shared() -> None:
+    budget = SegmentBudget(10)
+    assert budget.share() == 10
+    with budget.join():
+        assert budget.share() == 10
+        with budget.join(), budget.join():
+            assert budget.share() == 3
+    assert budget.share() == 10
+    with pytest.raises(ConcurrencyLimitError):
+        SegmentBudget(0)
+
+
+@pytest.mark.asyncio
+async def test_segment_budget_caps_requests_in_flight() -> None:
+    budget = SegmentBudget(3)
+    peak = 0
+
+    async def request() -> None:
+        nonlocal peak
+        async with budget.request():
+            peak = max(peak, budget.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(request() for _ in range(10)))
+    assert peak == budget.limit
+    assert budget.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_unlimited_does_not_wait() -> None:
+    bucket = TokenBucket()
+    start = asyncio.get_running_loop().time()
+    for _ in range(1_000):
+        await bucket.acquire(1024 * 1024)
+    assert asyncio.get_running_loop().time() - start < 0.1
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_paces_concurrent_callers() -> None:
+    rate = 1_000_000
+    bucket = TokenBucket(rate)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await asyncio.gather(*(bucket.acquire(10_000) for _ in range(30)))
+    assert loop.time() - start == pytest.approx(0.3, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_rate_change_wakes_waiters() -> None:
+    bucket = TokenBucket(rate=1)
+    waiter = asyncio.create_task(bucket.acquire(1_000))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+    bucket.set_rate(None)
+    await asyncio.wait_for(waiter, timeout=1)
+
+
+@pytest.mark.parametrize(
+    "rate, expected",
+    (("100", 100), ("500K", 500 * 1024), ("1.5m", 3 * 512 * 1024)),
+)
+def test_cli_validate_rate(rate: str, expected: int) -> None:
+    assert cli_validate_rate(rate) == expected
+
+
+@pytest.mark.parametrize("rate", ("", "0", "-1K", "2X", "K", "inf"))
+def test_cli_validate_rate_invalid(rate: str) -> None:
+    with pytest.raises(ArgumentTypeError):
+        cli_validate_rate(rate)
+
+
+def test_cli_validate_size() -> None:
+    assert cli_validate_size("2G") == 2 * 1024**3
+    with pytest.raises(ArgumentTypeError, match="Invalid size"):
+        cli_validate_size("0")
+
+
+@pytest.mark.parametrize(
+    "size, parts, expected",
+    (
+        (10, 3, [(0, 4), (4, 7), (7, 10)]),
+        (2, 4, [(0, 1), (1, 2)]),
+        (5, 1, [(0, 5)]),
+    ),
+)
+def test_split_range(
+    size: int, parts: int, expected: list[tuple[int, int]]
+) -> None:
+    assert split_range(size, parts) == expected
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("honor_ranges", (True, False))
+async def test_read_in_ranges(honor_ranges: bool) -> None:
+    body = random.randbytes(300_000)
+    ranges_requested = []
+
+    async def handler(request: web.Request) -> web.Response:
+        if honor_ranges and request.http_range.start is not None:
+            ranges_requested.append(request.headers["Range"])
+            part = body[request.http_range]
+            return web.Response(
+                status=206,
+                body=part,
+                headers={
+                    "Content-Range": (
+                        f"bytes {request.http_range.start}"
+                        f"-{request.http_range.start + len(part) - 1}"
+                        f"/{len(body)}"
+                    )
+                },
+            )
+        return web.Response(body=body, headers={"Accept-Ranges": "bytes"})
+
+    app = web.Application()
+    app.router.add_get("/segment.ts", handler)
+    on_chunk = AsyncMock()
+    async with TestServer(app) as server, ClientSession() as session:
+        url = str(server.make_url("/segment.ts"))
+        async with session.get(url) as response:
+            assert supports_ranges(response)
+            result = await read_in_ranges(response, session, url, 3, on_chunk)
+    assert result == body
+    assert len(ranges_requested) == (2 if honor_ranges else 0)
+    assert sum(call.args[0] for call in on_chunk.await_args_list) == len(body)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ("status", "content_range", "raise_for_status"),
+    (
+        (416, "bytes */300000", False),
+        (416, "bytes */300000", True),
+        (206, None, True),
+        (206, "bytes 0-99999/300000", True),
+    ),
+)
+async def test_read_in_ranges_falls_back_on_unusable_ranges(
+    status: int, content_range: str | None, raise_for_status: bool
+) -> None:
+    body = random.randbytes(300_000)
+
+    async def handler(request: web.Request) -> web.Response:
+        if request.http_range.start is not None:
+            part = body[request.http_range]
+            headers = {"Content-Range": content_range} if content_range else {}
+            return web.Response(status=status, body=part, headers=headers)
+        return web.Response(body=body, headers={"Accept-Ranges": "bytes"})
+
+    app = web.Application()
+    app.router.add_get("/segment.ts", handler)
+    async with (
+        TestServer(app) as server,
+        ClientSession(raise_for_status=raise_for_status) as session,
+    ):
+        url = str(server.make_url("/segment.ts"))
+        async with session.get(url) as response:
+            result = await read_in_ranges(
+                response, session, url, 3, AsyncMock()
+            )
+    assert result == body
+
+
+@pytest.mark.asyncio
+async def test_read_in_ranges_retries_parts_through_breakers() -> None:
+    body = random.randbytes(300_000)
+    failed_ranges: set[str] = set()
+
+    async def handler(request: web.Request) -> web.Response:
+        if request.http_range.start is None:
+            return web.Response(body=body, headers={"Accept-Ranges": "bytes"})
+        if request.headers["Range"] not in failed_ranges:
+            failed_ranges.add(request.headers["Range"])
+            return web.Response(status=HTTPStatus.SERVICE_UNAVAILABLE)
+        part = body[request.http_range]
+        return web.Response(
+            status=206,
+            body=part,
+            headers={
+                "Content-Range": (
+                    f"bytes {request.http_range.start}"
+                    f"-{request.http_range.start + len(part) - 1}"
+                    f"/{len(body)}"
+                )
+            },
+        )
+
+    app = web.Application()
+    app.router.add_get("/segment.ts", handler)
+    breakers = CircuitBreakers(min_calls=10)
+    policy = RetryPolicy(jitter=min)
+    async with (
+        TestServer(app) as server,
+        ClientSession(raise_for_status=True) as session,
+    ):
+        url = str(server.make_url("/segment.ts"))
+        async with session.get(url) as response:
+            result = await read_in_ranges(
+                response, session, url, 3, AsyncMock(), breakers, policy
+            )
+        assert result == body
+        assert policy.retries["read_range"] == 2
+        # Requests to a host with an open circuit fail at once.
+        open_breakers = CircuitBreakers(min_calls=1)
+        open_breakers.for_url(url).record_failure()
+        async with session.get(url) as response:
+            with pytest.raises(CircuitOpenError):
+                await read_in_ranges(
+                    response, session, url, 3, AsyncMock(), open_breakers
+                )
+
+
+def response_error(
+    status: int, headers: dict[str, str] | None = None
+) -> ClientResponseError:
+    return ClientResponseError(
+        MagicMock(), (), status=status, headers=CIMultiDict(headers or {})
+    )
+
+
+@pytest.mark.parametrize(
+    "error, retried",
+    (
+        (ClientError(), True),
+        (response_error(HTTPStatus.SERVICE_UNAVAILABLE), True),
+        (response_error(HTTPStatus.TOO_MANY_REQUESTS), True),
+        (response_error(HTTPStatus.NOT_FOUND), False),
+        (response_error(HTTPStatus.FORBIDDEN), False),
+    ),
+)
+def test_retry_policy_classifies_errors(
+    error: Exception, retried: bool
+) -> None:
+    policy = RetryPolicy()
+    assert (policy.next_delay(error, 1, "get") is not None) is retried
+
+
+def test_retry_policy_backoff_with_full_jitter() -> None:
+    policy = RetryPolicy(
+        max_attempts=10, base_delay=1, max_delay=5, jitter=max
+    )
+    delays = [policy.next_delay(ClientError(), n, "get") for n in (1, 2, 3, 4)]
+    assert delays == [1, 2, 4, 5]
+    assert RetryPolicy(jitter=min).next_delay(ClientError(), 1, "get") == 0
+    assert policy.retries == {"get": 4}
+
+
+@pytest.mark.parametrize(
+    "retry_after, expected",
+    (
+        ("7", 7),
+        ("100", 10),
+        (format_datetime(datetime.now(UTC) + timedelta(seconds=4), True), 4),
+    ),
+)
+def test_retry_policy_respects_retry_after(
+    retry_after: str, expected: float
+) -> None:
+    policy = RetryPolicy(max_delay=10, jitter=min)
+    error = response_error(
+        HTTPStatus.TOO_MANY_REQUESTS, {"Retry-After": retry_after}
+    )
+    assert policy.next_delay(error, 1, "get") == pytest.approx(expected, 1)
+
+
+def test_retry_policy_budget() -> None:
+    policy = RetryPolicy(
+        max_attempts=10, budget_minimum=2, budget_ratio=0.5, jitter=min
+    )
+    assert policy.next_delay(ClientError(), 1, "get") is not None
+    assert policy.next_delay(ClientError(), 1, "get") is not None
+    assert policy.next_delay(ClientError(), 1, "get") is None
+    policy.record_success()
+    policy.record_success()
+    assert policy.next_delay(ClientError(), 1, "get") is not None
+    assert policy.retries.total() == 3
+
+
+@pytest.mark.asyncio
+async def test_retry_uses_policy_of_the_object() -> None:
+    class Client:
+        retry_policy = RetryPolicy(max_attempts=5, jitter=min)
+
+        def __init__(self) -> None:
+            self.responses = [ClientError(), ClientError(), "ok"]
+
+        @retry("Failed", EXCEPTION_TO_RAISE)
+        async def fetch(self) -> str:
+            response = self.responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        @retry("Failed", EXCEPTION_TO_RAISE)
+        async def missing(self) -> None:
+            raise response_error(HTTPStatus.NOT_FOUND)
+
+    client = Client()
+    assert await client.fetch() == "ok"
+    with pytest.raises(EXCEPTION_TO_RAISE):
+        await client.missing()
+    assert client.retry_policy.retries == {"fetch": 2}
+
+
+def test_circuit_breaker_opens_on_failure_rate() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker(
+        "cdn", failure_rate=0.5, window=4, min_calls=4, clock=clock
+    )
+    for failed in (False, True, False):
+        breaker.acquire()
+        breaker.record_failure() if failed else breaker.record_success()
+    assert breaker.state is CircuitState.closed
+    breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state is CircuitState.open
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+
+
+def test_circuit_breaker_probes_while_half_open() -> None:
+    clock = FakeClock()
+    breaker = CircuitBreaker("cdn", min_calls=1, cooldown=10, clock=clock)
+    breaker.acquire()
+    breaker.record_failure()
+    clock.now = 10
+    breaker.acquire()
+    assert breaker.state is CircuitState.half_open
+    # Only one probe at a time.
+    assert not breaker.is_available()
+    breaker.record_failure()
+    assert breaker.state is CircuitState.open
+    clock.now = 20
+    breaker.acquire()
+    breaker.record_success()
+    assert breaker.state is CircuitState.closed
+
+
+@pytest.mark.asyncio
+async def test_circuit_breakers_guard_counts_host_failures() -> None:
+    breakers = CircuitBreakers(min_calls=2)
+    url = "https://cdn-1/segment.ts"
+    for error in (response_error(HTTPStatus.NOT_FOUND), ClientError()):
+        with pytest.raises(ClientError):
+            async with breakers.guard(url):
+                raise error
+    assert breakers.for_url(url).state is CircuitState.closed
+    with pytest.raises(ClientError):
+        async with breakers.guard(url):
+            raise ServerDisconnectedError
+    assert breakers.for_url(url).state is CircuitState.closed
+    with pytest.raises(ClientError):
+        async with breakers.guard(url):
+            raise response_error(HTTPStatus.BAD_GATEWAY)
+    assert breakers.for_url(url).state is CircuitState.open
+    with pytest.raises(CircuitOpenError):
+        async with breakers.guard(url):
+            pass  # pragma: no cover
+    assert breakers.for_url("https://cdn-2/").state is CircuitState.closed
+
+
+def test_circuit_breakers_are_shared_by_session(
+    mocked_session: AsyncMock,
+) -> None:
+    assert breakers_for(mocked_session) is breakers_for(mocked_session)
+    assert breakers_for(mocked_session) is not breakers_for(MagicMock())
+
+
+def test_mirror_pool_skips_open_circuits() -> None:
+    breakers = CircuitBreakers(min_calls=1)
+    pool = MirrorPool(
+        ["https://cdn-1/video.m3u8", "https://cdn-2/video.m3u8"], breakers
+    )
+    first, second = pool.mirrors
+    breakers.for_host(first.host).record_failure()
+    assert all(pool.choose() is second for _ in range(20))
+
+
+def test_connection_profile_for_concurrency() -> None:
+    profile = ConnectionProfile.for_concurrency(10)
+    assert (profile.limit, profile.limit_per_host) == (20, 10)
+    profile = ConnectionProfile.for_concurrency(10, split_segments=True)
+    assert profile.limit_per_host == 10 * RANGE_PARTS
+
+
+@pytest.mark.asyncio
+async def test_session_pool_stats() -> None:
+    release = asyncio.Event()
+
+    async def handler(request: web.Request) -> web.Response:
+        await release.wait()
+        return web.Response(body=b"segment")
+
+    app = web.Application()
+    app.router.add_get("/segment.ts", handler)
+    profile = ConnectionProfile(limit=2, limit_per_host=2, keepalive_timeout=5)
+    async with TestServer(app) as server:
+        session = create_aiohttp_session(asyncio.get_running_loop(), profile)
+        connector = session.connector
+        assert isinstance(connector, TCPConnector)
+        assert (connector.limit, connector.limit_per_host) == (2, 2)
+        assert get_pool_stats(session) == PoolStats(0, 0, 0, 0)
+
+        async def get() -> None:
+            async with session.get(server.make_url("/segment.ts")) as response:
+                await response.read()
+
+        requests = [asyncio.create_task(get()) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        assert get_pool_stats(session) == PoolStats(
+            open=2, idle=0, acquired=2, waiting=1
+        )
+        release.set()
+        await asyncio.gather(*requests)
+        assert get_pool_stats(session) == PoolStats(
+            open=2, idle=2, acquired=0, waiting=0
+        )
+        await session.close()
+    assert get_ssl_context() is get_ssl_context()
+
+
+@pytest.mark.asyncio
+async def test_metadata_cache_expires_entries(tmp_path: Path) -> None:
+    clock = FakeClock()
+    cache = MetadataCache(tmp_path / "cache.sqlite3", ttl=600, clock=clock)
+    await cache.set("video", "api", "response")
+    # URLs expire at 400, the entry a margin before it.
+    await cache.set("video", "master", "playlist", expires_at=400)
+    await cache.set("video", "expired", "playlist", expires_at=100)
+    assert await cache.get("video", "master") == "playlist"
+    assert await cache.get("video", "expired") is None
+    clock.now = 100
+    assert await cache.get("video", "master") is None
+    assert await cache.get("video", "api") == "response"
+    clock.now = 600
+    assert await cache.get("video", "api") is None
+    await cache.set("video", "api", "response")
+    await cache.invalidate("video")
+    assert await cache.get("video", "api") is None
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_metadata_cache_evicts_least_recently_used(
+    tmp_path: Path,
+) -> None:
+    clock = FakeClock()
+    cache = MetadataCache(tmp_path / "cache.sqlite3", max_size=8, clock=clock)
+    await cache.set("first", "api", "1234")
+    clock.now = 1
+    await cache.set("second", "api", "1234")
+    clock.now = 2
+    assert await cache.get("first", "api") == "1234"
+    clock.now = 3
+    await cache.set("third", "api", "1234")
+    assert await cache.get("first", "api") == "1234"
+    assert await cache.get("second", "api") is None
+    assert await cache.get("third", "api") == "1234"
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_broken_metadata_cache_is_a_miss(tmp_path: Path) -> None:
+    path = tmp_path / "cache.sqlite3"
+    path.write_text("not a database")
+    cache = MetadataCache(path)
+    await cache.set("video", "api", "response")
+    assert await cache.get("video", "api") is None
+
+
+@pytest.mark.asyncio
+async def test_download_archive(tmp_path: Path) -> None:
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"video")
+    archive = DownloadArchive(tmp_path / "archive.sqlite3")
+    assert await archive.find("video") is None
+    entry = await archive.add("video", HD_720p, video)
+    assert entry
+    assert entry.size == len(b"video")
+    assert await archive.find("video") == entry
+    assert await archive.find("video", HD_720p) == entry
+    assert await archive.find("video", FULL_HD_1080p) is None
+    archive.close()
+
+
+@pytest.mark.asyncio
+async def test_broken_download_archive_is_a_miss(tmp_path: Path) -> None:
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"video")
+    path = tmp_path / "archive.sqlite3"
+    path.write_text("not a database")
+    archive = DownloadArchive(path)
+    assert await archive.add("video", HD_720p, video) is None
+    assert await archive.find("video") is None
+    archive.close()
+
+
+@pytest.mark.asyncio
+async def test_verified_download_archive_drops_changed_files(
+    tmp_path: Path,
+) -> None:
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"video")
+    archive = DownloadArchive(tmp_path / "archive.sqlite3", verify=True)
+    entry = await archive.add("video", HD_720p, video)
+    assert await archive.find("video") == entry
+    video.write_bytes(b"VIDEO")
+    assert await archive.find("video") is None
+    archive.verify = False
+    assert await archive.find("video") is None
+    archive.close()
+
+
+def test_progress_tracker_measures_rate_and_eta() -> None:
+    clock = FakeClock()
+    events: list[ProgressEvent] = []
+    tracker = ProgressTracker(
+        4, events.append, interval=5, rate_window=4, clock=clock
+    )
+    assert tracker.emit().eta is None  # type: ignore
+    for _ in range(2):
+        clock.now += 1
+        tracker.receive(100)
+        tracker.complete(100)
+    assert tracker.emit() is None
+    clock.now += 3
+    event = tracker.emit(retries=1, concurrency=3)
+    assert event
+    assert event.bytes_received == 200
+    assert event.percent == 50
+    # 100 bytes in the last 4 seconds, 200 bytes in 5 seconds.
+    assert event.rate == 25
+    assert event.average_rate == 40
+    assert event.eta == 8
+    assert (event.retries, event.concurrency) == (1, 3)
+    clock.now += 10
+    assert tracker.rate() == 0
+    tracker.complete()
+    tracker.complete()
+    # The last segment is always reported.
+    assert tracker.emit()
+    assert events[-1].finished
+    assert len(events) == 3
+
+
+def test_progress_renderer_redraws_lines_in_place() -> None:
+    stream = io.StringIO()
+    renderer = ProgressRenderer(stream, interactive=True)
+    first, second = ProgressLine("first"), ProgressLine("second")
+    renderer.add(first)
+    renderer.add(second)
+    first.update(ProgressEvent(1, 4, rate=2 * MIB, eta=75))
+    renderer.draw()
+    assert stream.getvalue() == (
+        f"[first] [{'#' * 5}{' ' * 15}] 25% 2.0 MiB/s ETA 1:15\n"
+        f"[second] [{' ' * 20}]\n"
+    )
+    stream.seek(0)
+    stream.truncate()
+    renderer.echo("message")
+    renderer.remove(first)
+    renderer.draw()
+    assert stream.getvalue() == (
+        f"{CURSOR_UP.format(2)}{ERASE_DOWN}message\n"
+        f"[first] [{'#' * 5}{' ' * 15}] 25% 2.0 MiB/s ETA 1:15\n"
+        f"[second] [{' ' * 20}]\n"
+    )
+
+
+def test_progress_renderer_prints_steps_without_terminal() -> None:
+    stream = io.StringIO()
+    renderer = ProgressRenderer(stream, interactive=False)
+    line = ProgressLine("video")
+    renderer.add(line)
+    for completed in (2, 5, 7, 40):
+        line.update(ProgressEvent(completed, 40))
+        renderer.draw()
+    renderer.remove(line)
+    lines = stream.getvalue().splitlines()
+    # 17% is skipped, it's in the same 10% step as 12%.
+    assert [text.split(" MiB/s")[0] for text in lines] == [
+        "[video] 5% 0.0",
+        "[video] 12% 0.0",
+        "[video] 100% 0.0",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_progress_renderer_draws_at_frame_rate() -> None:
+    stream = io.StringIO()
+    renderer = ProgressRenderer(stream, fps=100, interactive=True)
+    line = ProgressLine("video")
+    async with renderer.running():
+        renderer.add(line)
+        for completed in range(1, 1001):
+            line.update(ProgressEvent(completed, 1000))
+        await asyncio.sleep(0.05)
+    frames = stream.getvalue().count("[video]")
+    assert 1 < frames < 1000
+
+
+def test_latest_value_wakes_consumer_once() -> None:
+    latest: LatestValue[int] = LatestValue()
+    assert latest.take() is None
+    assert latest.put(1)
+    assert not latest.put(2)
+    assert not latest.put(3)
+    assert latest.take() == 3
+    assert latest.take() is None
+    assert latest.put(4)
+
+
+def test_segment_key_ignores_mirror_and_signature() -> None:
+    key = segment_key("video", HD_720p, "segment-1-v1-a1.ts?sign=a")
+    assert key == segment_key(
+        "video", HD_720p, "https://mirror.rutube.ru/route/segment-1-v1-a1.ts"
+    )
+    assert key != segment_key("video", FULL_HD_1080p, "segment-1-v1-a1.ts")
+    assert key != segment_key("video", HD_720p, "segment-2-v1-a1.ts")
+
+
+@pytest.mark.asyncio
+async def test_segment_cache_evicts_least_recently_used(
+    tmp_path: Path,
+) -> None:
+    clock = FakeClock()
+    cache = SegmentCache(tmp_path, max_size=10, clock=clock)
+    await cache.put("first", b"12345")
+    clock.now += 1
+    await cache.put("second", b"12345")
+    clock.now += 1
+    assert await cache.get("first") == b"12345"
+    clock.now += 1
+    await cache.put("third", b"12345")
+    assert await cache.get("second") is None
+    assert await cache.get("first") == b"12345"
+    assert await cache.get("third") == b"12345"
+    assert not list(tmp_path.rglob("*.tmp"))
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_segment_cache_streams_segments(tmp_path: Path) -> None:
+    cache = SegmentCache(tmp_path, max_size=10)
+    async with cache.entry("first") as entry:
+        for chunk in (b"12", b"345"):
+            await entry.write(chunk)
+    with pytest.raises(ClientPayloadError):
+        async with cache.entry("second") as entry:
+            await entry.write(b"12")
+            raise ClientPayloadError
+    assert await cache.get("first") == b"12345"
+    assert await cache.get("second") is None
+    assert not list(tmp_path.rglob("*.tmp"))
+    # Replaced segments are counted once.
+    await cache.put("first", b"1234")
+    await cache.put("first", b"123456")
+    assert cache._database.run_sync(
+        lambda connection: connection.execute(
+            "SELECT size FROM total"
+        ).fetchone()[0]
+    ) == len(b"123456")
+    await cache.put("second", b"1234")
+    assert await cache.get("first") == b"123456"
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_damaged_cached_segment_is_a_miss(tmp_path: Path) -> None:
+    cache = SegmentCache(tmp_path)
+    await cache.put("segment", b"12345")
+    (path,) = (path for path in tmp_path.rglob("segment") if path.is_file())
+    path.write_bytes(b"123")
+    assert await cache.get("segment") is None
+    assert not path.exists()
+    cache.close()
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    (
+        (
+            "https://bl.rutube.ru/route/id.m3u8?sign=a&expire=1733494986",
+            1733494986,
+        ),
+        ("https://bl.rutube.ru/route/id.m3u8?expire=soon", None),
+        ("https://bl.rutube.ru/route/id.m3u8", None),
+    ),
+)
+def test_signed_url_expiry(url: str, expected: float | None) -> None:
+    assert signed_url_expiry(url) == expected
+
+
+def test_metrics_are_rendered(tmp_path: Path) -> None:
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ("cause",))
+    in_flight = registry.gauge("in_flight", "In flight.")
+    latency = registry.histogram("latency_seconds", "Latency.", (0.1, 1.0))
+    requests.inc(cause="503")
+    assert requests.get(cause="503") == 0, "Disabled registry records"
+    registry.enabled = True
+    requests.inc(cause="503")
+    requests.inc(2, cause='a "quoted" cause')
+    with in_flight.track():
+        assert in_flight.get() == 1
+    for value in (0.05, 0.5, 0.5, 5):
+        latency.observe(value)
+    text = registry.render()
+    assert text.splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{cause="503"} 1.0',
+        r'requests_total{cause="a \"quoted\" cause"} 2.0',
+        "# HELP in_flight In flight.",
+        "# TYPE in_flight gauge",
+        "in_flight 0.0",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 6.05",
+        "latency_seconds_count 4",
+    ]
+    registry.write_textfile(tmp_path / "rutube.prom")
+    assert (tmp_path / "rutube.prom").read_text() == text
+    assert list(tmp_path.iterdir()) == [tmp_path / "rutube.prom"]
+
+
+@pytest.mark.asyncio
+async def test_request_phases_are_traced(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def handler(request: web.Request) -> web.Response:
+        return web.Response(text="playlist")
+
+    app = web.Application()
+    app.router.add_get("/", handler)
+    monkeypatch.setattr(metrics.process_metrics, "enabled", True)
+    session = create_aiohttp_session(
+        asyncio.get_running_loop(), ConnectionProfile(trace_phases=True)
+    )
+    tracer = get_tracer(session)
+    assert tracer
+    async with TestServer(app) as server, session:
+        exported_before = metrics.request_phases.get(
+            host=server.host, phase=Phase.ttfb
+        )
+        async with session.get(server.make_url("/")) as response:
+            assert await response.text() == "playlist"
+        start = tracer.timings
+        async with session.get(server.make_url("/")) as response:
+            await response.text()
+    phases = tracer.timings.hosts[server.host]
+    assert phases[Phase.ttfb].count == phases[Phase.body].count == 2
+    # The second request reused the connection.
+    assert phases[Phase.connect].count == 1
+    since = tracer.timings.since(start).hosts[server.host]
+    assert since[Phase.ttfb].count == 1
+    assert Phase.connect not in since
+    assert tracer.timings.summary()[0].startswith(
+        f"{server.host}, 2 requests: "
+    )
+    tracer.timings.dump(tmp_path / "phases.json")
+    dump = json.loads((tmp_path / "phases.json").read_text())
+    assert dump[server.host]["ttfb"]["count"] == 2
+    # Exported to /metrics too.
+    exported = metrics.request_phases.get(host=server.host, phase=Phase.ttfb)
+    assert (exported - exported_before).count == 2
+    tracker = ProgressTracker(1, None, phases=lambda: tracer.timings)
+    assert tracker.event().phases.hosts.keys() == {server.host}  # type: ignore